@@ -2,16 +2,31 @@
 Shared utilities for Advanced RAG Techniques - OpenAI Version
 """
 
+import hashlib
 import pandas as pd
-from uuid import uuid4
 import os
+import sys
 from dotenv import load_dotenv
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Iterator
 
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+
+# Shared modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chroma_sync import bulk_add, get_client
+from embedding_cache import CachedEmbeddings
+from extractive_compression import ExtractiveCompressor, cache_sentence_embeddings
+from hybrid_search import BM25Index, HybridRetriever
+from hyde import HyDERetriever, HypotheticalDocuments
+from llm_backends import is_offline, make_chat_model, make_cross_encoder, make_embeddings
+from multi_query import MultiQueryRetriever
+from reranker import RerankService, RerankingRetriever
+from semantic_chunking import StreamingSemanticChunker
+from retrieval_service import RetrievalService
  
 
 # ============================================
@@ -21,10 +36,14 @@ from langchain_core.prompts import ChatPromptTemplate
 def setup_openai_api() -> str:
     """
     Load OpenAI API key from environment
+    (not required when LLM_BACKEND=fake selects the offline backends)
     """
     load_dotenv()
     api_key = os.environ.get("OPENAI_API_KEY")
 
+    if is_offline():
+        return api_key or "offline"
+
     if not api_key:
         raise ValueError(
             "OPENAI_API_KEY not found. "
@@ -38,30 +57,96 @@ def setup_openai_api() -> str:
 # DATA LOADING
 # ===========================================
 
-def load_msme_data(file_path: str = "msme.csv") -> Tuple[List[str], List[Dict], List[str]]:
+MSME_COLUMNS = ["Title", "Sources", "Content"]
+
+
+def content_id(title: str, text: str) -> str:
     """
-    Load and prepare MSME dataset for RAG
+    Deterministic ID: title plus a hash of the content, so re-loading the
+    same row yields the same ID (re-ingestion upserts instead of duplicating)
     """
-    msme = pd.read_csv(file_path)
+    return f"{title}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
 
-    documents = []
-    metadatas = []
-    ids = []
 
-    for index, row in msme.iterrows():
-        # Extract content and metadata
-        text = str(row["Content"])
-        title = str(row["Title"])
-        source = str(row["Sources"])
+def _iter_csv_columns(file_path: str, columns: List[str], engine: str = "auto", chunk_rows: int = 10_000):
+    """
+    Stream the CSV as {column: list of str} blocks
+    engine="pyarrow" uses pyarrow's streaming reader, "pandas" chunked read_csv,
+    "auto" pyarrow when it is installed; missing values become empty strings
+    """
+    if engine == "auto":
+        try:
+            import pyarrow.csv  # noqa: F401
+            engine = "pyarrow"
+        except ImportError:
+            engine = "pandas"
+
+    if engine == "pyarrow":
+        import pyarrow as pa
+        import pyarrow.csv as pv
+
+        reader = pv.open_csv(
+            file_path,
+            # Content fields are quoted multi-line text
+            parse_options=pv.ParseOptions(newlines_in_values=True),
+            convert_options=pv.ConvertOptions(
+                include_columns=columns,
+                column_types={column: pa.string() for column in columns},
+                strings_can_be_null=False
+            )
+        )
+        for batch in reader:
+            yield {column: batch.column(column).to_pylist() for column in columns}
+    else:
+        for frame in pd.read_csv(file_path, usecols=columns, dtype=str, keep_default_na=False,
+                                 chunksize=chunk_rows):
+            yield {column: frame[column].tolist() for column in columns}
+
+
+def iter_msme_batches(
+    file_path: str = "msme.csv",
+    batch_size: int = 256,
+    engine: str = "auto",
+    dedupe: bool = True
+) -> Iterator[Tuple[List[str], List[Dict], List[str]]]:
+    """
+    Stream the MSME dataset as (documents, metadatas, ids) batches of batch_size rows
+    Rows repeating the title and content of an earlier row are skipped (dedupe);
+    this keeps an 8-byte digest per unique row in memory, ~75 MB per million rows
+    """
+    documents, metadatas, ids = [], [], []
+    seen = set()
+    row = 0
+    for block in _iter_csv_columns(file_path, MSME_COLUMNS, engine, chunk_rows=max(batch_size, 10_000)):
+        for title, source, text in zip(block["Title"], block["Sources"], block["Content"]):
+            doc_id = row
+            row += 1
+            key = content_id(title, text)
+            if dedupe:
+                digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+
+            documents.append(text)
+            metadatas.append({"source": source, "doc_title": title, "doc_id": doc_id})
+            ids.append(key)
+            if len(documents) == batch_size:
+                yield documents, metadatas, ids
+                documents, metadatas, ids = [], [], []
+    if documents:
+        yield documents, metadatas, ids
+
 
-        # Prepare document components
-        documents.append(text)
-        metadatas.append({
-            "source": source,
-            "doc_title": title,
-            "doc_id": index
-        })
-        ids.append(f"{title}-{uuid4()}")
+def load_msme_data(file_path: str = "msme.csv") -> Tuple[List[str], List[Dict], List[str]]:
+    """
+    Load and prepare MSME dataset for RAG
+    """
+    documents, metadatas, ids = [], [], []
+    for batch_documents, batch_metadatas, batch_ids in iter_msme_batches(file_path):
+        documents.extend(batch_documents)
+        metadatas.extend(batch_metadatas)
+        ids.extend(batch_ids)
 
     print(f"[OK] Loaded {len(documents)} documents from {file_path}")
     return documents, metadatas, ids
@@ -71,44 +156,60 @@ def load_msme_as_langchain_docs(file_path: str = "msme.csv") -> List[Document]:
     """
     Load MSME data as LangChain Document objects
     """
-    msme = pd.read_csv(file_path)
-    documents = []
-
-    for index, row in msme.iterrows():
-        text = str(row["Content"])
-        title = str(row["Title"])
-        source = str(row["Sources"])
-
-        doc = Document(
-            page_content=text,
-            metadata={
-                "source": source,
-                "doc_title": title,
-                "doc_id": index
-            }
-        )
-        documents.append(doc)
+    documents = [
+        Document(page_content=text, metadata=metadata, id=doc_id)
+        for batch in iter_msme_batches(file_path)
+        for text, metadata, doc_id in zip(*batch)
+    ]
 
     print(f"[OK] Loaded {len(documents)} LangChain Documents from {file_path}")
     return documents
 
 
+def semantic_chunk_data(
+    documents: List[str],
+    metadatas: List[Dict],
+    chunker: StreamingSemanticChunker
+) -> Tuple[List[str], List[Dict], List[str]]:
+    """
+    Split each document into semantic chunks (same return shape as load_msme_data)
+    Chunks keep their document's metadata plus a chunk_index
+    """
+    chunks, chunk_metadatas, ids = [], [], []
+    counters = {}
+    for chunk in chunker.split_texts(documents, metadatas):
+        doc_id = chunk.metadata.get("doc_id")
+        chunk_index = counters.get(doc_id, 0)
+        counters[doc_id] = chunk_index + 1
+
+        chunks.append(chunk.page_content)
+        chunk_metadatas.append({**chunk.metadata, "chunk_index": chunk_index})
+        ids.append(content_id(f"{chunk.metadata.get('doc_title', 'doc')}-{chunk_index}", chunk.page_content))
+
+    print(f"[OK] Split {len(documents)} documents into {len(chunks)} semantic chunks")
+    return chunks, chunk_metadatas, ids
+
+
 # ==============================================
 # MODEL INITIALIZATION
 # ==============================================
 
 def create_embeddings(
     api_key: str,
-    model: str = "text-embedding-3-small"
+    model: str = "text-embedding-3-small",
+    use_cache: bool = True
 ) -> OpenAIEmbeddings:
     """
     Initialize OpenAI embeddings model
+    Wrapped in the shared on-disk cache unless use_cache=False
     """
-    embeddings = OpenAIEmbeddings(
+    embeddings = make_embeddings(
         model=model,
-        openai_api_key=api_key
+        api_key=api_key
     )
-    print(f"[OK] Initialized embeddings: {model}")
+    if use_cache:
+        embeddings = CachedEmbeddings(embeddings)
+    print(f"[OK] Initialized embeddings: {model}{' (cached)' if use_cache else ''}")
     return embeddings
 
 
@@ -120,54 +221,88 @@ def create_llm(
     """
     Initialize OpenAI chat model
     """
-    llm = ChatOpenAI(
+    llm = make_chat_model(
         model=model,
         temperature=temperature,
-        openai_api_key=api_key
+        api_key=api_key
     )
     print(f"[OK] Initialized LLM: {model} (temp={temperature})")
     return llm
 
 
+def create_semantic_chunker(
+    embeddings: OpenAIEmbeddings,
+    breakpoint_percentile: float = 95.0,
+    min_chunk_chars: int = 200,
+    max_chunk_chars: int = 2000
+) -> StreamingSemanticChunker:
+    """
+    Semantic chunker that splits each document on its own, streaming
+    Sentence embeddings are batched across documents through the (cached) embeddings
+    """
+    chunker = StreamingSemanticChunker(
+        embeddings,
+        breakpoint_percentile=breakpoint_percentile,
+        min_chunk_chars=min_chunk_chars,
+        max_chunk_chars=max_chunk_chars
+    )
+    print(f"[OK] Initialized semantic chunker ({min_chunk_chars}-{max_chunk_chars} chars)")
+    return chunker
+
+
 # ==============================================
 # VECTOR STORE
 # ==============================================
 
+def get_chroma_client(persist_directory: str = "./chroma_db"):
+    """
+    Shared ChromaDB client for persist_directory (one per path per process)
+    """
+    return get_client(persist_directory)
+
+
 def create_vectorstore(
     documents: List[str],
     metadatas: List[Dict],
     ids: List[str],
     embeddings: OpenAIEmbeddings,
     collection_name: str = "msme",
-    persist_directory: str = "./chroma_db"
+    persist_directory: str = "./chroma_db",
+    keyword_index: bool = True,
+    sentence_embeddings: bool = False,
+    batch_size: int = 256,
+    workers: int = 4
 ) -> Chroma:
     """
     Create and populate ChromaDB vector store
-    Uses SQLite backend to avoid Rust bindings issues on Windows
+    Uses the process-wide client for persist_directory; documents whose IDs are
+    already in the collection are skipped, so techniques loading the same data
+    share one collection instead of re-embedding it
+    Adds in batches of batch_size across `workers` threads
+    Also saves a BM25 keyword index of the collection for hybrid retrieval
+    sentence_embeddings=True pre-embeds every sentence into the embedding cache
+    (used by the extractive compressor)
     """
-    import chromadb
-    from chromadb.config import Settings
-
-    # Force SQLite backend (bypasses Rust bindings)
-    client = chromadb.PersistentClient(
-        path=persist_directory,
-        settings=Settings(allow_reset=True)
-    )
-
     vectorstore = Chroma(
-        client=client,
+        client=get_chroma_client(persist_directory),
         collection_name=collection_name,
         embedding_function=embeddings
     )
 
-    # Add documents
-    vectorstore.add_texts(
-        texts=documents,
-        metadatas=metadatas,
-        ids=ids
-    )
+    # Add documents (only the ones not stored yet)
+    stats = bulk_add(vectorstore, documents, metadatas, ids, batch_size=batch_size, workers=workers)
 
-    print(f"[OK] Created vector store: {collection_name} ({len(documents)} docs)")
+    print(f"[OK] Created vector store: {collection_name} "
+          f"({stats['added']} docs added, {stats['skipped']} already stored)")
+
+    if keyword_index:
+        if stats["added"]:
+            build_keyword_index(vectorstore, collection_name, persist_directory)
+        else:
+            load_keyword_index(vectorstore, collection_name, persist_directory)
+    if sentence_embeddings:
+        count = cache_sentence_embeddings(embeddings, documents)
+        print(f"[OK] Cached sentence embeddings: {count} sentences")
     return vectorstore
 
 
@@ -178,19 +313,10 @@ def load_existing_vectorstore(
 ) -> Chroma:
     """
     Load existing ChromaDB vector store
-    Uses SQLite backend to avoid Rust bindings issues on Windows
+    Uses the process-wide client for persist_directory
     """
-    import chromadb
-    from chromadb.config import Settings
-
-    # Force SQLite backend (bypasses Rust bindings)
-    client = chromadb.PersistentClient(
-        path=persist_directory,
-        settings=Settings(allow_reset=True)
-    )
-
     vectorstore = Chroma(
-        client=client,
+        client=get_chroma_client(persist_directory),
         collection_name=collection_name,
         embedding_function=embeddings
     )
@@ -199,6 +325,199 @@ def load_existing_vectorstore(
     return vectorstore
 
 
+# ==============================================
+# HYBRID RETRIEVAL
+# ==============================================
+
+def keyword_index_path(collection_name: str = "msme", persist_directory: str = "./chroma_db") -> str:
+    return os.path.join(persist_directory, f"{collection_name}_bm25.npz")
+
+
+def build_keyword_index(
+    vectorstore: Chroma,
+    collection_name: str = "msme",
+    persist_directory: str = "./chroma_db"
+) -> BM25Index:
+    """
+    Build the BM25 index of every chunk in the collection and save it
+    next to the Chroma files
+    """
+    contents = vectorstore.get(include=["documents"])
+    index = BM25Index.build(contents["ids"], contents["documents"])
+    index.save(keyword_index_path(collection_name, persist_directory))
+    print(f"[OK] Built keyword index: {len(index)} chunks, {len(index.vocabulary)} terms")
+    return index
+
+
+def load_keyword_index(
+    vectorstore: Chroma,
+    collection_name: str = "msme",
+    persist_directory: str = "./chroma_db"
+) -> BM25Index:
+    """
+    Load the saved BM25 index, building it first if it does not exist
+    """
+    path = keyword_index_path(collection_name, persist_directory)
+    if not os.path.exists(path):
+        return build_keyword_index(vectorstore, collection_name, persist_directory)
+    index = BM25Index.load(path)
+    if len(index) != vectorstore._collection.count():
+        # The collection changed since the index was saved
+        return build_keyword_index(vectorstore, collection_name, persist_directory)
+    print(f"[OK] Loaded keyword index: {len(index)} chunks")
+    return index
+
+
+def create_hybrid_retriever(
+    vectorstore: Chroma,
+    k: int = 4,
+    fetch_k: int = 20,
+    mode: str = "hybrid",
+    collection_name: str = "msme",
+    persist_directory: str = "./chroma_db"
+) -> HybridRetriever:
+    """
+    BM25 + vector retriever fused with reciprocal rank fusion
+    mode: "hybrid" (exact identifier lookups skip the embedding call),
+    "keyword" (never embeds) or "vector"
+    """
+    return HybridRetriever(
+        vectorstore=vectorstore,
+        keyword_index=load_keyword_index(vectorstore, collection_name, persist_directory),
+        k=k,
+        fetch_k=fetch_k,
+        mode=mode
+    )
+
+
+# ==============================================
+# RERANKING
+# ==============================================
+
+def create_reranker(
+    model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    backend: str = "torch",
+    top_n: int = 5,
+    decisive_margin: float = None,
+    batch_window_ms: float = 5
+) -> RerankService:
+    """
+    Shared cross-encoder reranking service
+    backend="onnx" runs the int8-quantized ONNX model on CPU;
+    concurrent queries within batch_window_ms are scored in one batch;
+    scores are cached per (query, chunk)
+    """
+    service = RerankService(
+        make_cross_encoder(model, backend=backend),
+        top_n=top_n,
+        batch_window=batch_window_ms / 1000,
+        decisive_margin=decisive_margin
+    )
+    print(f"[OK] Initialized reranker: {model} ({backend}, top_n={top_n})")
+    return service
+
+
+def create_reranking_retriever(
+    vectorstore: Chroma,
+    reranker: RerankService,
+    fetch_k: int = 10
+) -> RerankingRetriever:
+    """
+    Retrieve fetch_k candidates, rerank to the reranker's top_n
+    (the rerank is skipped when the vector scores are already decisive)
+    """
+    return RerankingRetriever(vectorstore=vectorstore, service=reranker, fetch_k=fetch_k)
+
+
+# ==============================================
+# CONTEXTUAL COMPRESSION
+# ==============================================
+
+def create_extractive_compressor(
+    embeddings: OpenAIEmbeddings,
+    token_budget: int = 300,
+    min_similarity: float = None
+) -> ExtractiveCompressor:
+    """
+    Compressor keeping the sentences most similar to the query within token_budget
+    No LLM calls: one batched sentence embedding pass (cache hits when the
+    vector store was created with sentence_embeddings=True) and one query embedding
+    """
+    return ExtractiveCompressor(
+        embeddings=embeddings,
+        token_budget=token_budget,
+        min_similarity=min_similarity
+    )
+
+
+# ==============================================
+# MULTI-QUERY RETRIEVAL
+# ==============================================
+
+def create_query_generator(llm: ChatOpenAI, num_variants: int = 4):
+    """
+    Chain mapping {"question": ...} to a list of rephrased questions
+    """
+    return (
+        get_multi_query_prompt(num_variants)
+        | llm
+        | StrOutputParser()
+        | (lambda x: [q.strip() for q in x.split('\n') if q.strip()])
+    )
+
+
+def create_multi_query_retriever(
+    vectorstore: Chroma,
+    llm: ChatOpenAI,
+    k: int = 3,
+    limit: int = None,
+    num_variants: int = 4,
+    speculative: bool = True,
+    query_generator=None
+) -> MultiQueryRetriever:
+    """
+    Retrieve k docs for the question and each LLM-generated variant
+    All variants are embedded in one request and searched in one batched query;
+    results are deduplicated by chunk ID and fused with RRF (limit caps the total).
+    speculative=True retrieves the original question while the variants are generated
+    """
+    return MultiQueryRetriever(
+        service=RetrievalService(vectorstore, search_type="similarity", k=k),
+        query_generator=query_generator or create_query_generator(llm, num_variants),
+        limit=limit,
+        max_variants=num_variants,
+        speculative=speculative
+    )
+
+
+# ==============================================
+# HYDE
+# ==============================================
+
+def create_hyde_retriever(
+    vectorstore: Chroma,
+    llm: ChatOpenAI,
+    k: int = 5,
+    speculative: bool = True,
+    score_threshold: float = None,
+    hyde_generator=None
+) -> HyDERetriever:
+    """
+    HyDE retriever with hypothetical answers cached per normalized question
+    speculative=True searches with the question while the answer is generated
+    and fuses both rankings; with score_threshold a confident direct hit
+    returns early and cancels the HyDE branch
+    """
+    generator = hyde_generator or (get_hyde_prompt() | llm | StrOutputParser())
+    return HyDERetriever(
+        vectorstore=vectorstore,
+        hypotheses=HypotheticalDocuments(generator),
+        k=k,
+        speculative=speculative,
+        score_threshold=score_threshold
+    )
+
+
 # =================================================
 # PROMPTS
 # =================================================
@@ -245,6 +564,42 @@ Answer:"""
     return ChatPromptTemplate.from_template(template)
 
 
+def get_multi_query_prompt(num_variants: int = 4) -> ChatPromptTemplate:
+    """
+    Get the query variation prompt used by multi-query retrieval
+    """
+    template = f"""You are an AI assistant helping to improve search results.
+Your task is to generate {num_variants} different versions of the given user question.
+
+These variations should:
+- Rephrase using different words
+- Use different levels of specificity
+- Include relevant synonyms
+- Maintain the original intent
+
+Provide ONLY the questions, one per line, without numbering or explanation.
+
+Original question: {{question}}
+
+Alternative questions:"""
+
+    return ChatPromptTemplate.from_template(template)
+
+
+def get_hyde_prompt() -> ChatPromptTemplate:
+    """
+    Get the hypothetical answer prompt used by HyDE retrieval
+    """
+    template = """Write a brief hypothetical answer (2-3 sentences) to this question about MSMEs in Nigeria.
+Make it sound like it's from a business guide document.
+
+Question: {question}
+
+Hypothetical answer:"""
+
+    return ChatPromptTemplate.from_template(template)
+
+
 # =============================================================================
 # UTILITIES
 # =============================================================================
@@ -1,25 +1,20 @@
 from langgraph.graph import START, END, StateGraph, MessagesState
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import ToolNode
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.tools import StructuredTool
 from langchain_core.documents import Document
 from dotenv import load_dotenv
+from dataclasses import dataclass
 from typing import Literal
+import asyncio
 import os
+import threading
 
-print(" All libraries successfully imported")
+from llm_backends import is_offline, make_chat_model, make_embeddings
+from chat_streaming import stream_reply, format_timing
 
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY not found!")
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.5, api_key=openai_api_key)
-print(f" LLM initialized: {llm.model_name}")
+# Importing this module has no side effects: the vector store, models and graphs
+# are built on first use by get_app() (or by touching e.g. `agentic_rag_task.agent`)
 
 # 1. document collection
 python_docs = [
@@ -35,41 +30,11 @@ python_docs = [
     "pytest testing: def test_addition(): assert 1+1==2. Run with pytest test_file.py"
 ]
 
-doc_objects = [Document(page_content=doc, metadata={"source": f"python_doc_{i+1}"}) 
-               for i, doc in enumerate(python_docs)]
-print(f" Created {len(doc_objects)} Python documents")
-
-#  2. vector setup
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=openai_api_key)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-doc_splits = text_splitter.split_documents(doc_objects)
-print(f" Split into {len(doc_splits)} chunks")
-
 chroma_path = "./python_tutorials_db"
-vectorstore = Chroma.from_documents(
-    documents=doc_splits,
-    embedding=embeddings,
-    persist_directory=chroma_path
-)
-print(f" Vector store created at {chroma_path}")
-
-# 3. Retrival tool
-@tool
-def retrieve_python_docs(query: str) -> str:
-    """Search Python programming tutorials. Use for Python syntax, functions, classes, code examples."""
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 3})
-    results = retriever.invoke(query)
-    
-    if not results:
-        return "No relevant Python docs found."
-    
-    formatted = "\n---\n".join([f"Source: {r.metadata.get('source')}\n{r.page_content[:200]}..." 
-                              for r in results])
-    return formatted
-
-print(" Retrieval tool created")
+# Optional quantized first-pass index kept next to the Chroma files:
+# VECTOR_QUANTIZATION=int8|binary, VECTOR_DIMS (Matryoshka truncation), VECTOR_RESCORE (candidates per result)
+compact_path = "./python_tutorials_db_compact"
 
-# 4. Agentic rag system
 system_prompt = SystemMessage(content="""You are PyTutor, a Python programming assistant.
 
 RETRIEVE WHEN:
@@ -84,49 +49,242 @@ Simple math or general knowledge
 
 Cite sources when retrieving. Be concise.""")
 
-tools = [retrieve_python_docs]
-llm_with_tools = llm.bind_tools(tools)
+def format_python_docs(results) -> str:
+    if not results:
+        return "No relevant Python docs found."
+
+    formatted = "\n---\n".join([f"Source: {r.metadata.get('source')}\n{r.page_content[:200]}..."
+                              for r in results])
+    return formatted
+
+def make_retrieve_python_docs(service):
+    def retrieve_python_docs(query: str) -> str:
+        return format_python_docs(service.retrieve(query))
 
-def assistant(state: MessagesState) -> dict:
-    messages = [system_prompt] + state["messages"]
-    response = llm_with_tools.invoke(messages)
-    return {"messages": [response]}
+    async def aretrieve_python_docs(query: str) -> str:
+        return format_python_docs(await service.aretrieve(query))
+
+    # Sync and async implementations, so the tool works in both graph variants
+    return StructuredTool.from_function(
+        func=retrieve_python_docs,
+        coroutine=aretrieve_python_docs,
+        name="retrieve_python_docs",
+        description="Search Python programming tutorials. Use for Python syntax, functions, classes, code examples."
+    )
 
 def should_continue(state: MessagesState) -> Literal["tools", "__end__"]:
     return "tools" if state["messages"][-1].tool_calls else "__end__"
 
-# Build graph
-builder = StateGraph(MessagesState)
-builder.add_node("assistant", assistant)
-builder.add_node("tools", ToolNode(tools))
-builder.add_edge(START, "assistant")
-builder.add_conditional_edges("assistant", should_continue, {"tools": "tools", "__end__": END})
-builder.add_edge("tools", "assistant")
 
-agent = builder.compile(checkpointer=MemorySaver())
-print(" Agentic RAG system compiled")
+@dataclass
+class PyTutorApp:
+    """
+    Everything the agent needs, built once per process by get_app()
+    """
+    llm: object
+    embeddings: object
+    vectorstore: object
+    retrieval_service: object
+    response_cache: object
+    history: object
+    memory: object
+    telemetry: object
+    agent: object
+    async_agent: object
+
+
+def build_app() -> PyTutorApp:
+    """
+    Build the vector store, models and compiled graphs (uncached; use get_app())
+    """
+    # Heavy dependencies are imported here so importing the module stays cheap
+    from langchain_chroma import Chroma
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    from chroma_sync import content_hash_id, sync_vectorstore
+    from conversation_memory import HistoryManager
+    from embedding_cache import CachedEmbeddings
+    from graph_telemetry import GraphTelemetry
+    from hybrid_search import BM25Index
+    from retrieval_service import RetrievalService, batched_tool_node
+    from semantic_cache import SemanticCache, fingerprint, is_cache_hit
+    from sqlite_checkpointer import SQLiteCheckpointer, checkpoint_path
+
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key and not is_offline():
+        raise ValueError("OPENAI_API_KEY not found!")
+
+    llm = make_chat_model("gpt-4o-mini", temperature=0.5, api_key=openai_api_key)
+    print(f" LLM initialized: {llm.model_name}")
+
+    doc_objects = [Document(page_content=doc, metadata={"source": f"python_doc_{i+1}"})
+                   for i, doc in enumerate(python_docs)]
+
+    #  2. vector setup
+    embeddings = CachedEmbeddings(make_embeddings("text-embedding-3-small", api_key=openai_api_key))
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    doc_splits = text_splitter.split_documents(doc_objects)
+
+    vectorstore = Chroma(
+        embedding_function=embeddings,
+        persist_directory=chroma_path
+    )
+    # Only new or changed chunks are embedded; a restart on an unchanged corpus makes no API calls
+    sync_stats = sync_vectorstore(vectorstore, doc_splits)
+    print(f" Vector store synced at {chroma_path} "
+          f"(added {sync_stats['added']}, removed {sync_stats['removed']}, unchanged {sync_stats['unchanged']})")
+
+    # 3. Retrival tool
+    # BM25 over the same chunk IDs: identifiers like "ZeroDivisionError" are found
+    # lexically (without an embedding call) and fused with dense results otherwise
+    chunks_by_id = {content_hash_id(d): d for d in doc_splits}
+    keyword_index = BM25Index.build(list(chunks_by_id), [d.page_content for d in chunks_by_id.values()])
+
+    compact_index = None
+    quantization = os.getenv("VECTOR_QUANTIZATION")
+    if quantization:
+        from quantization import load_compact_index
+        # Int8 or binary codes in memory; candidates are re-scored from memory-mapped float32 vectors
+        compact_index = load_compact_index(
+            vectorstore, compact_path, kind=quantization,
+            dims=int(os.environ["VECTOR_DIMS"]) if os.getenv("VECTOR_DIMS") else None,
+            rescore=int(os.getenv("VECTOR_RESCORE", "4"))
+        )
+        stats = compact_index.stats()
+        print(f" Compact index: {stats['kind']} x {stats['dims']} dims, {stats['vectors']} vectors, "
+              f"{stats['compact_bytes']} bytes in memory")
+
+    # Built once at startup; the tool and the batched tool node share it
+    retrieval_service = RetrievalService(vectorstore, search_type="mmr", k=3, keyword_index=keyword_index,
+                                         compact_index=compact_index)
+    tools = [make_retrieve_python_docs(retrieval_service)]
+
+    # 4. Agentic rag system
+    llm_with_tools = llm.bind_tools(tools)
+
+    def assistant(state: MessagesState) -> dict:
+        messages = [system_prompt] + state["messages"]
+        response = llm_with_tools.invoke(messages)
+        return {"messages": [response]}
+
+    async def aassistant(state: MessagesState) -> dict:
+        messages = [system_prompt] + state["messages"]
+        response = await llm_with_tools.ainvoke(messages)
+        return {"messages": [response]}
+
+    async def aretrieve_batch(calls: list) -> list:
+        results = await retrieval_service.aretrieve_many([c["query"] for c in calls])
+        return [format_python_docs(docs) for docs in results]
+
+    # Several retrieve_python_docs calls in one turn share a single embedding request;
+    # under ainvoke the turn's tool calls run concurrently
+    tools_node = batched_tool_node(
+        ToolNode(tools),
+        {"retrieve_python_docs": lambda calls: [
+            format_python_docs(docs)
+            for docs in retrieval_service.retrieve_many([c["query"] for c in calls])
+        ]},
+        {"retrieve_python_docs": aretrieve_batch}
+    )
+
+    # Keeps each thread under a token budget: stale retrieval dumps are stubbed,
+    # older turns are folded into a summary, the last few turns stay verbatim
+    history = HistoryManager(system_prompt, max_tokens=3000, keep_recent_turns=3, summarizer=llm)
+
+    # Near-duplicate questions are answered from past answers without an LLM call.
+    # Changing the docs, prompt or model changes the version and invalidates old answers.
+    response_cache = SemanticCache(
+        embeddings,
+        namespace="pytutor",
+        corpus_version=fingerprint(*sorted(content_hash_id(d) for d in doc_splits), system_prompt.content, llm.model_name),
+        threshold=0.9
+    )
+    cache_lookup, cache_store = response_cache.as_nodes()
+
+    def route_after_cache(state: MessagesState) -> Literal["assistant", "__end__"]:
+        return "__end__" if is_cache_hit(state["messages"][-1]) else "assistant"
+
+    # Build graph
+    def build_graph(assistant_node) -> StateGraph:
+        builder = StateGraph(MessagesState)
+        builder.add_node("history", history.as_node())
+        builder.add_node("cache_lookup", cache_lookup)
+        builder.add_node("assistant", assistant_node)
+        builder.add_node("tools", tools_node)
+        builder.add_node("cache_store", cache_store)
+        builder.add_edge(START, "history")
+        builder.add_edge("history", "cache_lookup")
+        builder.add_conditional_edges("cache_lookup", route_after_cache, {"assistant": "assistant", "__end__": END})
+        builder.add_conditional_edges("assistant", should_continue, {"tools": "tools", "__end__": "cache_store"})
+        builder.add_edge("tools", "assistant")
+        builder.add_edge("cache_store", END)
+        return builder
+
+    memory = SQLiteCheckpointer(checkpoint_path("agentic_rag"))
+    # Per-node timings, tokens, tool calls, retrieval and cache hits of every run
+    telemetry = GraphTelemetry(log_path=os.getenv("AGENT_TELEMETRY_LOG"))
+    agent = build_graph(assistant).compile(checkpointer=memory).with_config(callbacks=[telemetry])
+    # Async variant: use with `await async_agent.ainvoke(...)`; many threads can share one event loop
+    async_agent = build_graph(aassistant).compile(checkpointer=memory).with_config(callbacks=[telemetry])
+    print(" Agentic RAG system compiled")
+
+    return PyTutorApp(
+        llm=llm,
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+        retrieval_service=retrieval_service,
+        response_cache=response_cache,
+        history=history,
+        memory=memory,
+        telemetry=telemetry,
+        agent=agent,
+        async_agent=async_agent
+    )
+
+_app = None
+_app_lock = threading.Lock()
+
+def get_app() -> PyTutorApp:
+    """
+    The process-wide PyTutorApp, built on first call (thread-safe)
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_app()
+    return _app
+
+def __getattr__(name: str):
+    # `agentic_rag_task.agent` and friends resolve to the lazily built app
+    if name in PyTutorApp.__dataclass_fields__:
+        return getattr(get_app(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 5. Testing
 def test_agent(query: str, thread_id: str = "test"):
     print(f"\n{'='*60}")
     print(f": {query}")
-    
-    result = agent.invoke(
+
+    app = get_app()
+    # A fresh thread and no response cache: every run exercises the LLM and the tools
+    app.memory.delete_thread(thread_id)
+    result = app.agent.invoke(
         {"messages": [HumanMessage(content=query)]},
-        config={"configurable": {"thread_id": thread_id}}
+        config={"configurable": {"thread_id": thread_id, "bypass_cache": True}}
     )
-    
-    used_retrieval = any(isinstance(m, AIMessage) and m.tool_calls for m in result["messages"])
+
+    # Only this turn: the messages after the question just asked
+    start = max(i for i, m in enumerate(result["messages"]) if isinstance(m, HumanMessage))
+    used_retrieval = any(isinstance(m, AIMessage) and m.tool_calls for m in result["messages"][start + 1:])
     answer = result["messages"][-1].content if result["messages"][-1].content else "No answer"
-    
+
     print(f" {answer[:150]}...")
     print(f" {'RETRIEVED' if used_retrieval else 'DIRECT'}")
     print("="*60)
-    
-    return used_retrieval
 
-print("\n: TEST CASES:")
-print("="*60)
+    return used_retrieval
 
 # Test cases
 tests = [
@@ -137,34 +295,65 @@ tests = [
     ("Explain Python exception handling", True),
 ]
 
-results = []
-for query, expected in tests:
-    actual = test_agent(query, f"test_{len(results)}")
-    correct = actual == expected
-    results.append(correct)
-    print(f"Expected: {'RETRIEVE' if expected else 'DIRECT'} | {':' if correct else ':x:'}")
+def run_tests() -> float:
+    print("\n: TEST CASES:")
+    print("="*60)
+
+    results = []
+    for query, expected in tests:
+        actual = test_agent(query, f"test_{len(results)}")
+        correct = actual == expected
+        results.append(correct)
+        print(f"Expected: {'RETRIEVE' if expected else 'DIRECT'} | {':' if correct else ':x:'}")
 
-accuracy = sum(results) / len(results) * 100
-print(f"\n Accuracy: {accuracy:.0f}% ({sum(results)}/{len(results)} correct)")
+    accuracy = sum(results) / len(results) * 100
+    print(f"\n Accuracy: {accuracy:.0f}% ({sum(results)}/{len(results)} correct)")
+    print(f" Response cache: {get_app().response_cache.stats()}")
+    print(f" Per-node telemetry: {get_app().telemetry.summary()}")
+    return accuracy
+
+# Async serving
+async def aask(query: str, thread_id: str) -> str:
+    result = await get_app().async_agent.ainvoke(
+        {"messages": [HumanMessage(content=query)]},
+        config={"configurable": {"thread_id": thread_id}}
+    )
+    return result["messages"][-1].content
+
+async def aask_many(conversations: dict) -> dict:
+    """Answer {thread_id: query} pairs concurrently on one event loop."""
+    answers = await asyncio.gather(*(aask(query, thread_id) for thread_id, query in conversations.items()))
+    return dict(zip(conversations, answers))
 
 # Interactive mode
-def interactive_mode():
+def interactive_mode(stream: bool = True):
+    agent = get_app().agent
+
     print("\n" + "="*60)
     print(" Python Tutor - Interactive Mode")
     print("Type 'exit' to quit")
     print("="*60)
-    
+
     thread_id = "interactive"
     while True:
         query = input("\n: You: ").strip()
         if query.lower() in ["exit", "quit"]:
             print(" Goodbye! ")
             break
-        
+
+        if stream:
+            # Tokens and tool calls are printed as they arrive
+            reply = stream_reply(agent, query, thread_id, prefix=" ")
+            print(f" {format_timing(reply)}")
+            continue
+
         result = agent.invoke(
             {"messages": [HumanMessage(content=query)]},
             config={"configurable": {"thread_id": thread_id}}
         )
         print(f" {result['messages'][-1].content}")
 
-interactive_mode()
+if __name__ == "__main__":
+    get_app()
+    run_tests()
+    interactive_mode()
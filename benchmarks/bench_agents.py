@@ -0,0 +1,370 @@
+"""
+Offline latency benchmark for the agent graphs and the utils_openai pipelines
+
+Runs everything on the deterministic local backends (LLM_BACKEND=fake), so
+no API key or network is needed. Reports per-node latency, throughput and
+allocation profiles as JSON; pass --baseline to fail on regressions.
+
+The semantic response cache is bypassed so that every turn runs the
+assistant and tool nodes; with --response-cache it is on, and turns it
+answered are reported separately ("cached_turn") from the others ("turn").
+
+Run from the repository root:
+    python benchmarks/bench_agents.py [--turns 20] [--concurrency 8] [--output bench.json]
+    python benchmarks/bench_agents.py --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGENT_QUESTIONS = {
+    "agentic_rag_task": [
+        "How do I define a Python function?",
+        "What are Python decorators?",
+        "Hello! How are you?",
+        "Explain Python exception handling",
+    ],
+    "tool_integration_task": [
+        "What's the weather in Lagos?",
+        "Dictionary meaning of ephemeral",
+        "Tell me a fun fact about octopuses",
+    ],
+    "langgraph_task": [
+        "My laptop won't turn on after an update",
+        "How do I reset my phone to factory settings?",
+        "The tablet screen flickers when charging",
+    ],
+}
+
+# Attribute names of the compiled graphs (sync, async) in each module
+AGENT_GRAPHS = {
+    "agentic_rag_task": ("agent", "async_agent"),
+    "tool_integration_task": ("agent", "async_agent"),
+    "langgraph_task": ("customer_support_agent", "customer_support_agent"),
+}
+
+PIPELINE_QUESTIONS = [
+    "What challenges do MSMEs face in Nigeria?",
+    "How can a small business access funding?",
+    "What policies support MSMEs?",
+]
+
+
+def configure_offline(args, workdir: str):
+    """
+    Select the fake backends and keep every cache, checkpoint and vector store
+    in a scratch directory (must run before the repo modules are imported)
+    """
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_TOKEN_MS"] = str(args.token_latency_ms)
+    os.environ["FAKE_EMBEDDING_LATENCY_MS"] = str(args.embedding_latency_ms)
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.sqlite3")
+    os.environ["CHECKPOINT_DIR"] = os.path.join(workdir, "checkpoints")
+    sys.path.append(ROOT)
+    sys.path.append(os.path.join(ROOT, "Rag_Techniques"))
+    os.chdir(workdir)
+
+
+def summarize(timings_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(timings_ms)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def make_node_timer():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class NodeTimer(BaseCallbackHandler):
+        """
+        Wall time of every graph node run (outermost run per node only)
+        """
+
+        def __init__(self):
+            self.starts = {}
+            self.timings = defaultdict(list)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            node = (metadata or {}).get("langgraph_node")
+            if node and kwargs.get("name") == node and self.starts.get(parent_run_id, (None,))[0] != node:
+                self.starts[run_id] = (node, time.perf_counter())
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            if run_id in self.starts:
+                node, start = self.starts.pop(run_id)
+                self.timings[node].append((time.perf_counter() - start) * 1000)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self.starts.pop(run_id, None)
+
+    return NodeTimer()
+
+
+def short_path(filename: str) -> str:
+    if filename.startswith(ROOT):
+        return os.path.relpath(filename, ROOT)
+    return filename.split("site-packages" + os.sep)[-1]
+
+
+def allocation_profile(fn, top: int = 10) -> Dict:
+    """
+    Peak traced memory of `fn()` and its largest allocation sites
+    """
+    tracemalloc.start(10)
+    try:
+        fn()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    stats = snapshot.statistics("lineno")[:top]
+    return {
+        "peak_kb": round(peak / 1024, 1),
+        "top_sites": [
+            {"site": f"{short_path(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+             "kb": round(s.size / 1024, 1), "blocks": s.count}
+            for s in stats
+        ],
+    }
+
+
+def import_quietly(name: str):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = importlib.import_module(name)
+    return module, time.perf_counter() - start
+
+
+def bench_agent(name: str, args) -> Dict:
+    from langchain_core.messages import HumanMessage
+    from semantic_cache import is_cache_hit
+
+    module, import_s = import_quietly(name)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = module.get_app()
+    build_s = time.perf_counter() - start
+    sync_graph, async_graph = (getattr(app, attr) for attr in AGENT_GRAPHS[name])
+    questions = AGENT_QUESTIONS[name]
+    bypass_cache = not args.response_cache
+
+    def turn(graph, i: int, run: str, callbacks=None):
+        return graph.invoke(
+            {"messages": [HumanMessage(content=f"{questions[i % len(questions)]} (case {i})")]},
+            config={"configurable": {"thread_id": f"bench-{run}-{i % args.threads}", "bypass_cache": bypass_cache},
+                    "callbacks": callbacks or []}
+        )
+
+    async def aturn(i: int, run: str):
+        return await async_graph.ainvoke(
+            {"messages": [HumanMessage(content=f"{questions[i % len(questions)]} (case {i})")]},
+            config={"configurable": {"thread_id": f"bench-{run}-{i}", "bypass_cache": bypass_cache}}
+        )
+
+    async def concurrent(run: str):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(i):
+            async with semaphore:
+                return await aturn(i, run)
+        await asyncio.gather(*(bounded(i) for i in range(args.turns)))
+
+    # Warm-up turn (lazy imports, SQLite page cache) is not measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        turn(sync_graph, 0, "warmup")
+
+        timer = make_node_timer()
+        turn_ms, cached_ms = [], []
+        start = time.perf_counter()
+        for i in range(args.turns):
+            turn_start = time.perf_counter()
+            state = turn(sync_graph, i, "sync", [timer])
+            elapsed_ms = (time.perf_counter() - turn_start) * 1000
+            (cached_ms if is_cache_hit(state["messages"][-1]) else turn_ms).append(elapsed_ms)
+        sync_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(concurrent("async"))
+        async_elapsed = time.perf_counter() - start
+
+        allocations = allocation_profile(lambda: [turn(sync_graph, i, "alloc") for i in range(min(5, args.turns))])
+
+    result = {
+        "import_s": round(import_s, 3),
+        "build_s": round(build_s, 3),
+        "turn": summarize(turn_ms) if turn_ms else {"count": 0},
+        "nodes": {node: summarize(t) for node, t in sorted(timer.timings.items())},
+        "throughput": {
+            "sequential_turns_per_s": round(args.turns / sync_elapsed, 2),
+            "concurrent_turns_per_s": round(args.turns / async_elapsed, 2),
+            "concurrency": args.concurrency,
+        },
+        "allocations": allocations,
+    }
+    if cached_ms:
+        result["cached_turn"] = summarize(cached_ms)
+    if hasattr(app, "response_cache"):
+        result["response_cache"] = app.response_cache.stats()
+    return result
+
+
+def bench_pipelines(args, workdir: str) -> Dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        utils, import_s = import_quietly("utils_openai")
+        from langchain_core.output_parsers import StrOutputParser
+
+        api_key = utils.setup_openai_api()
+        embeddings = utils.create_embeddings(api_key)
+        llm = utils.create_llm(api_key)
+
+        start = time.perf_counter()
+        documents, metadatas, ids = utils.load_msme_data(os.path.join(ROOT, "Rag_Techniques", "msme.csv"))
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorstore = utils.create_vectorstore(
+            documents, metadatas, ids, embeddings, persist_directory=os.path.join(workdir, "chroma_db")
+        )
+        index_s = time.perf_counter() - start
+
+        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+        chain = utils.get_baseline_prompt() | llm | StrOutputParser()
+
+        stages = defaultdict(list)
+
+        def answer(question: str):
+            t0 = time.perf_counter()
+            docs = retriever.invoke(question)
+            t1 = time.perf_counter()
+            context = utils.format_docs(docs)
+            t2 = time.perf_counter()
+            chain.invoke({"context": context, "question": question})
+            t3 = time.perf_counter()
+            stages["retrieve"].append((t1 - t0) * 1000)
+            stages["format_docs"].append((t2 - t1) * 1000)
+            stages["generate"].append((t3 - t2) * 1000)
+            stages["total"].append((t3 - t0) * 1000)
+
+        answer(PIPELINE_QUESTIONS[0])
+        stages.clear()
+        start = time.perf_counter()
+        for i in range(args.turns):
+            answer(PIPELINE_QUESTIONS[i % len(PIPELINE_QUESTIONS)])
+        elapsed = time.perf_counter() - start
+        stage_summary = {stage: summarize(t) for stage, t in stages.items()}
+
+        allocations = allocation_profile(lambda: [answer(q) for q in PIPELINE_QUESTIONS])
+
+    return {
+        "baseline_rag": {
+            "import_s": round(import_s, 3),
+            "load_csv_s": round(load_s, 3),
+            "index_s": round(index_s, 3),
+            "documents": len(documents),
+            "stages": stage_summary,
+            "throughput": {"queries_per_s": round(args.turns / elapsed, 2)},
+            "allocations": allocations,
+        }
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, floor_ms: float) -> List[str]:
+    """
+    p50 timings that got slower than baseline * (1 + tolerance) + floor_ms
+    """
+    regressions = []
+
+    def walk(current, previous, path):
+        for key, value in current.items():
+            if key not in previous:
+                continue
+            if isinstance(value, dict):
+                walk(value, previous[key], f"{path}/{key}")
+            elif key == "p50_ms" and value > previous[key] * (1 + tolerance) + floor_ms:
+                regressions.append(f"{path}: p50 {previous[key]:.3f} ms -> {value:.3f} ms")
+
+    walk(results, baseline, "")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20, help="measured turns per agent / queries per pipeline")
+    parser.add_argument("--threads", type=int, default=4, help="conversation threads the sequential turns rotate over")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent ainvoke calls")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="simulated time to first token")
+    parser.add_argument("--token-latency-ms", type=float, default=0, help="simulated time per generated word")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0, help="simulated embedding round trip")
+    parser.add_argument("--agents", nargs="*", default=list(AGENT_QUESTIONS), choices=list(AGENT_QUESTIONS))
+    parser.add_argument("--skip-pipelines", action="store_true")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="keep the semantic response cache on (cached turns are reported separately)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report; exit 1 if any p50 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p50 slowdown")
+    parser.add_argument("--floor-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix="bench_agents_") as workdir:
+        configure_offline(args, workdir)
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "llm_latency_ms": args.llm_latency_ms,
+                "token_latency_ms": args.token_latency_ms,
+                "embedding_latency_ms": args.embedding_latency_ms,
+                "turns": args.turns,
+            },
+            "agents": {name: bench_agent(name, args) for name in args.agents},
+        }
+        if not args.skip_pipelines:
+            report["pipelines"] = bench_pipelines(args, workdir)
+        os.chdir(ROOT)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"[OK] Report written to {output}")
+    else:
+        print(text)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance, args.floor_ms)
+        for line in regressions:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("[OK] No p50 regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
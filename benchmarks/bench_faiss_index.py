@@ -0,0 +1,187 @@
+"""
+Recall@k vs latency of the FAISS index types against the flat baseline
+
+Builds flat, HNSW (several efSearch values) and IVF-PQ (several nprobe
+values, with and without re-scoring k * rescore candidates at full
+precision, as the store does) over the same vectors and reports, for each,
+recall@k against exact search, median per-query latency and index size. Vectors come from an
+existing personal_rag_kb store (--store) or are synthetic clustered data.
+
+Run from the repository root:
+    python benchmarks/bench_faiss_index.py [--vectors 100000] [--dim 384] [--k 10]
+    python benchmarks/bench_faiss_index.py --store personal_rag_kb/vectorstore_faiss --output faiss.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "personal_rag_kb"))
+from faiss_store import (RESCORED_TYPES, STORE_FILE, VECTORS_FILE, index_params, new_index, read_shard,
+                         set_search_params, train_ivfpq)
+
+
+EF_SEARCH = [16, 32, 64, 128]
+NPROBE = [1, 4, 16, 64]
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Gaussian clusters: closer to real embeddings than uniform noise
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.3 * rng.normal(size=(count, dim)).astype(np.float32)
+
+
+def store_vectors(path: str) -> np.ndarray:
+    """
+    Every vector of a store (reconstructed; approximate for IVF-PQ stores)
+    """
+    with open(os.path.join(path, STORE_FILE)) as f:
+        config = json.load(f)
+    index_type = config.get("index", {}).get("type", "flat")
+    if index_type in RESCORED_TYPES and os.path.exists(os.path.join(path, VECTORS_FILE)):
+        # Full-precision rows of the IDs still in the shards
+        full = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r").reshape(-1, config["dim"])
+        shards = [read_shard(os.path.join(path, shard["file"]), index_type) for shard in config["shards"]]
+        ids = np.concatenate([faiss.vector_to_array(index.id_map) for index in shards])
+        return np.ascontiguousarray(full[np.sort(ids)])
+    parts = []
+    for shard in config["shards"]:
+        index = faiss.read_index(os.path.join(path, shard["file"]))
+        if index.ntotal:
+            # IDMap2 reconstructs by ID; the wrapped index by position
+            inner = index.index if hasattr(index, "id_map") else index
+            parts.append(inner.reconstruct_n(0, index.ntotal))
+    return np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+
+
+class Rescored:
+    """
+    Exact L2 re-ranking of k * rescore candidates, as ShardedFAISS does for ivfpq stores
+    """
+
+    def __init__(self, index, vectors: np.ndarray, rescore: int):
+        self.index = index
+        self.vectors = vectors
+        self.rescore = rescore
+
+    def search(self, queries: np.ndarray, k: int):
+        _, candidates = self.index.search(queries, k * self.rescore)
+        rows = candidates[0][candidates[0] >= 0]
+        distances = ((self.vectors[rows] - queries[0]) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return distances[order][np.newaxis, :], rows[order][np.newaxis, :]
+
+
+def build(vectors: np.ndarray, index_type: str, params: dict):
+    ids = np.arange(len(vectors), dtype=np.int64)
+    start = time.perf_counter()
+    if index_type == "ivfpq":
+        index, params = train_ivfpq(vectors, params)
+    else:
+        index = new_index(vectors.shape[1], index_type, params)
+    index.add_with_ids(vectors, ids)
+    return index, params, time.perf_counter() - start
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """
+    recall@k against `truth` and per-query latency (one query per call, as at serving time)
+    """
+    found, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[np.newaxis, :], k)
+        timings.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    hits = sum(len(set(row[row >= 0]) & set(expected)) for row, expected in zip(found, truth))
+    return {
+        "recall_at_k": hits / (len(queries) * k),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": float(np.percentile(timings, 95))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", help="personal_rag_kb store directory to take the vectors from")
+    parser.add_argument("--vectors", type=int, default=100_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--nlist", type=int, help="IVF lists (default ~4*sqrt(training sample))")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (default dim/16)")
+    parser.add_argument("--rescore", type=int, help="ivfpq candidates re-scored per result (default 4)")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors = store_vectors(args.store) if args.store else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries near stored vectors, but not identical to them
+    queries = vectors[rng.choice(len(vectors), args.queries)]
+    queries = queries + 0.05 * queries.std() * rng.normal(size=queries.shape).astype(np.float32)
+
+    flat, _, build_s = build(vectors, "flat", {})
+    _, truth = flat.search(queries, args.k)
+    rows = [{"index": "flat", "build_s": build_s, "bytes": len(faiss.serialize_index(flat)),
+             **measure(flat, queries, truth, args.k)}]
+
+    hnsw_params = index_params("hnsw", {"m": args.hnsw_m})
+    hnsw, hnsw_params, build_s = build(vectors, "hnsw", hnsw_params)
+    size = len(faiss.serialize_index(hnsw))
+    for ef_search in EF_SEARCH:
+        set_search_params(hnsw, "hnsw", {**hnsw_params, "ef_search": ef_search})
+        rows.append({"index": f"hnsw M={args.hnsw_m} efSearch={ef_search}", "build_s": build_s, "bytes": size,
+                     **measure(hnsw, queries, truth, args.k)})
+
+    ivf_params = index_params("ivfpq", {"nlist": args.nlist, "pq_m": args.pq_m, "rescore": args.rescore})
+    ivfpq, ivf_params, build_s = build(vectors, "ivfpq", ivf_params)
+    size = len(faiss.serialize_index(ivfpq))
+    for nprobe in NPROBE:
+        if nprobe > ivf_params["nlist"]:
+            continue
+        set_search_params(ivfpq, "ivfpq", {**ivf_params, "nprobe": nprobe})
+        name = f"ivfpq nlist={ivf_params['nlist']} PQ{ivf_params['pq_m']} nprobe={nprobe}"
+        rows.append({"index": name, "build_s": build_s, "bytes": size, **measure(ivfpq, queries, truth, args.k)})
+        # Full-precision vectors are memory-mapped by the store, not counted in the index size
+        rows.append({"index": f"{name} rescore={ivf_params['rescore']}", "build_s": build_s, "bytes": size,
+                     **measure(Rescored(ivfpq, vectors, ivf_params["rescore"]), queries, truth, args.k)})
+
+    print(f"\n {len(vectors)} vectors, dim {vectors.shape[1]}, {args.queries} queries, recall@{args.k}")
+    print(f" {'index':<58}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'MB':>9}{'build s':>9}")
+    for row in rows:
+        print(f" {row['index']:<58}{row['recall_at_k']:>8.3f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+              f"{row['bytes'] / 2 ** 20:>9.1f}{row['build_s']:>9.1f}")
+
+    report = {
+        "vectors": len(vectors),
+        "dim": int(vectors.shape[1]),
+        "queries": args.queries,
+        "k": args.k,
+        "threads": args.threads,
+        "results": rows
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"\n[OK] Report written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: NumPy MMRReranker vs the vector store's generic MMR
+
+Run from the repository root:
+    python benchmarks/bench_mmr.py [--dim 1536] [--repeats 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mmr import MMRReranker, normalize_rows
+
+
+CANDIDATE_COUNTS = [1_000, 10_000, 100_000]
+PRODUCTION_K = [3, 5, 10]
+
+
+def time_call(fn, repeats: int) -> float:
+    """
+    Median wall time of `fn()` in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--skip-generic-above", type=int, default=10_000,
+                        help="the generic path loops in Python; skip it above this many candidates")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(args.dim).astype(np.float32)
+
+    print(f"{'candidates':>10} {'k':>3} {'generic ms':>11} {'native ms':>10} "
+          f"{'native fetch_k ms':>18} {'same picks':>10}")
+    print("-" * 68)
+
+    for n in CANDIDATE_COUNTS:
+        candidates = rng.standard_normal((n, args.dim)).astype(np.float32)
+        normalized = normalize_rows(candidates)
+
+        for k in PRODUCTION_K:
+            full = MMRReranker(k=k, fetch_k=None, lambda_mult=args.lambda_mult)
+            pooled = MMRReranker(k=k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult)
+
+            native_ms = time_call(lambda: full.select(query, normalized, normalized=True), args.repeats)
+            pooled_ms = time_call(lambda: pooled.select(query, normalized, normalized=True), args.repeats)
+
+            if n <= args.skip_generic_above:
+                generic_repeats = max(1, args.repeats // 10)
+                generic_ms = time_call(
+                    lambda: maximal_marginal_relevance(query, candidates, lambda_mult=args.lambda_mult, k=k),
+                    generic_repeats
+                )
+                same = full.select(query, normalized, normalized=True) == maximal_marginal_relevance(
+                    query, candidates, lambda_mult=args.lambda_mult, k=k
+                )
+                generic_col = f"{generic_ms:>11.3f}"
+                same_col = f"{str(same):>10}"
+            else:
+                generic_col = f"{'skipped':>11}"
+                same_col = f"{'-':>10}"
+
+            print(f"{n:>10} {k:>3} {generic_col} {native_ms:>10.3f} {pooled_ms:>18.3f} {same_col}")
+
+
+if __name__ == "__main__":
+    main()
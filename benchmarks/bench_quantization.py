@@ -0,0 +1,134 @@
+"""
+Memory, latency and recall@k of int8 / binary quantized vectors with full-precision re-scoring
+
+Builds a quantization.CompactIndex (int8 and binary codes, all dimensions
+and Matryoshka-truncated) over the same vectors and reports, for several
+re-scoring factors, recall@k against exact float32 cosine search, per-query
+latency and the bytes each variant keeps in memory. "rescore=0" ranks by
+the compact codes alone; otherwise k * rescore candidates are re-scored
+from the full-precision vectors, memory-mapped from disk.
+
+Synthetic vectors are not Matryoshka-trained, so truncation costs them more
+recall than it costs text-embedding-3 vectors; use --store for real ones.
+
+Run from the repository root:
+    python benchmarks/bench_quantization.py [--vectors 100000] [--dim 384] [--k 10]
+    python benchmarks/bench_quantization.py --store personal_rag_kb/vectorstore_faiss --output quantization.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_faiss_index import store_vectors, synthetic_vectors
+from mmr import normalize_rows
+from quantization import CompactIndex
+
+
+RESCORE = [0, 1, 4, 10]
+
+
+def measure(search, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """
+    recall@k against `truth` and per-query latency of `search(query, k) -> row positions`
+    """
+    found, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows = search(query, k)
+        timings.append((time.perf_counter() - start) * 1000)
+        found.append(rows)
+    hits = sum(len(set(np.asarray(rows).tolist()) & set(expected.tolist())) for rows, expected in zip(found, truth))
+    return {
+        "recall_at_k": hits / (len(queries) * k),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": float(np.percentile(timings, 95))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", help="personal_rag_kb store directory to take the vectors from")
+    parser.add_argument("--vectors", type=int, default=100_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension")
+    parser.add_argument("--dims", type=int, help="Matryoshka truncation to compare (default dim/2)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors = store_vectors(args.store) if args.store else synthetic_vectors(args.vectors, args.dim)
+    dim = vectors.shape[1]
+    truncated = args.dims or dim // 2 // 8 * 8
+    rng = np.random.default_rng(1)
+    # Queries near stored vectors, but not identical to them
+    queries = vectors[rng.choice(len(vectors), args.queries)]
+    queries = queries + 0.05 * queries.std() * rng.normal(size=queries.shape).astype(np.float32)
+
+    # Exact cosine baseline, fully in memory
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(normalize_rows(vectors))
+    _, truth = exact.search(normalize_rows(queries), args.k)
+    rows = [{"index": "float32 exact", "memory_bytes": int(vectors.shape[0]) * dim * 4, "disk_bytes": 0,
+             **measure(lambda q, k: exact.search(normalize_rows(q), k)[1][0], queries, truth, args.k)}]
+
+    ids = list(range(len(vectors)))
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in ("int8", "binary"):
+            for dims in (dim, truncated):
+                path = os.path.join(workdir, f"{kind}_{dims}")
+                start = time.perf_counter()
+                CompactIndex.build(ids, vectors, kind=kind, dims=dims).save(path)
+                build_s = time.perf_counter() - start
+                # Reloaded so the full-precision vectors are memory-mapped, as at serving time
+                index = CompactIndex.load(path)
+                stats = index.stats()
+                for rescore in RESCORE:
+                    index.rescore = rescore
+                    if rescore:
+                        search = lambda q, k: index.search_rows(q, k)[0]
+                    else:
+                        search = index.candidates
+                    rows.append({"index": f"{kind} dims={dims} rescore={rescore}",
+                                 "memory_bytes": stats["compact_bytes"],
+                                 "disk_bytes": stats["full_bytes"] if rescore else 0,
+                                 "build_s": build_s, **measure(search, queries, truth, args.k)})
+
+    print(f"\n {len(vectors)} vectors, dim {dim}, {args.queries} queries, recall@{args.k}")
+    print(f" {'index':<32}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'RAM MB':>9}{'mmap MB':>9}")
+    for row in rows:
+        print(f" {row['index']:<32}{row['recall_at_k']:>8.3f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+              f"{row['memory_bytes'] / 2 ** 20:>9.1f}{row['disk_bytes'] / 2 ** 20:>9.1f}")
+
+    report = {
+        "vectors": len(vectors),
+        "dim": dim,
+        "truncated_dims": truncated,
+        "queries": args.queries,
+        "k": args.k,
+        "threads": args.threads,
+        "results": rows
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"\n[OK] Report written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
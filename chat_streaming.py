@@ -0,0 +1,125 @@
+"""
+Token streaming for the interactive chat loops
+
+Prints LLM tokens as they arrive, shows tool calls starting and finishing
+inline, and records time-to-first-token for every turn.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+
+@dataclass
+class StreamResult:
+    """
+    What a streamed turn produced, with its timings (seconds)
+    """
+    text: str = ""
+    time_to_first_token: Optional[float] = None
+    total_time: float = 0.0
+    tool_calls: List[str] = field(default_factory=list)
+    cached: bool = False
+
+
+class _TurnPrinter:
+    """
+    Turns (mode, payload) pairs from graph.stream into terminal output
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.result = StreamResult()
+        self.start = time.perf_counter()
+        self.tool_started = {}
+        self.line_open = False
+
+    def handle(self, mode: str, payload):
+        if mode == "messages":
+            chunk, _ = payload
+            # Full messages are re-emitted when nodes return; only chunks are new tokens
+            if isinstance(chunk, AIMessageChunk) and isinstance(chunk.content, str) and chunk.content:
+                self._token(chunk.content)
+        elif mode == "updates":
+            for update in payload.values():
+                for message in (update or {}).get("messages", []):
+                    if isinstance(message, AIMessage) and message.tool_calls:
+                        for call in message.tool_calls:
+                            self._tool_start(call)
+                    elif isinstance(message, AIMessage) and "semantic_cache" in message.response_metadata:
+                        # Cached answers arrive whole from the cache stage, not as LLM tokens
+                        self.result.cached = True
+                        self._token(message.content)
+                    elif isinstance(message, ToolMessage):
+                        self._tool_end(message)
+
+    def finish(self) -> StreamResult:
+        if self.line_open:
+            print()
+        self.result.total_time = time.perf_counter() - self.start
+        return self.result
+
+    def _token(self, token: str):
+        if self.result.time_to_first_token is None:
+            self.result.time_to_first_token = time.perf_counter() - self.start
+        if not self.line_open:
+            print(self.prefix, end="", flush=True)
+            self.line_open = True
+            self.result.text = ""
+        print(token, end="", flush=True)
+        self.result.text += token
+
+    def _tool_start(self, call: dict):
+        self._close_line()
+        self.tool_started[call["id"]] = time.perf_counter()
+        self.result.tool_calls.append(call["name"])
+        print(f"   [tool start] {call['name']}({call['args']})", flush=True)
+
+    def _tool_end(self, message: ToolMessage):
+        # Ignore tool messages from other turns (e.g. history trimming rewrites)
+        started = self.tool_started.pop(message.tool_call_id, None)
+        if started is None:
+            return
+        self._close_line()
+        print(f"   [tool done] {message.name} in {time.perf_counter() - started:.2f}s", flush=True)
+
+    def _close_line(self):
+        if self.line_open:
+            print()
+            self.line_open = False
+
+
+def stream_reply(agent, user_input: str, thread_id: str, prefix: str = " ") -> StreamResult:
+    """
+    Run one turn of a compiled graph, printing the reply as it streams
+    """
+    printer = _TurnPrinter(prefix)
+    for mode, payload in agent.stream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config={"configurable": {"thread_id": thread_id}},
+        stream_mode=["messages", "updates"]
+    ):
+        printer.handle(mode, payload)
+    return printer.finish()
+
+
+async def astream_reply(agent, user_input: str, thread_id: str, prefix: str = " ") -> StreamResult:
+    """
+    Async counterpart of stream_reply, for graphs with async nodes
+    """
+    printer = _TurnPrinter(prefix)
+    async for mode, payload in agent.astream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config={"configurable": {"thread_id": thread_id}},
+        stream_mode=["messages", "updates"]
+    ):
+        printer.handle(mode, payload)
+    return printer.finish()
+
+
+def format_timing(result: StreamResult) -> str:
+    ttft = f"{result.time_to_first_token:.2f}s" if result.time_to_first_token is not None else "n/a"
+    source = ", from cache" if result.cached else ""
+    return f"(first token {ttft}, total {result.total_time:.2f}s{source})"
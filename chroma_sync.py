@@ -0,0 +1,132 @@
+"""
+Incremental, content-hashed ingestion for Chroma vector stores
+
+get_client returns one PersistentClient per directory for the whole
+process, so every vector store opened on the same path shares it (and its
+collections). bulk_add loads large corpora in batches, optionally on a
+thread pool, and never re-embeds IDs that are already stored.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List, Optional, Sequence
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+_CLIENTS: Dict[str, object] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(persist_directory: str):
+    """
+    Process-wide PersistentClient for `persist_directory` (created on first use)
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    path = os.path.abspath(persist_directory)
+    with _CLIENTS_LOCK:
+        if path not in _CLIENTS:
+            _CLIENTS[path] = chromadb.PersistentClient(path=path, settings=Settings(allow_reset=True))
+        return _CLIENTS[path]
+
+
+def content_hash_id(doc: Document) -> str:
+    """
+    Stable ID for a chunk, derived from its content and metadata
+    """
+    payload = json.dumps(
+        {"content": doc.page_content, "metadata": doc.metadata},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def sync_vectorstore(
+    vectorstore: Chroma,
+    documents: List[Document],
+    batch_size: int = 256
+) -> Dict[str, int]:
+    """
+    Bring a persisted collection in line with `documents`.
+    Only new or changed chunks are embedded; chunks that are no longer
+    present are deleted. Nothing is embedded when the corpus is unchanged.
+    """
+    wanted = {}
+    for doc in documents:
+        wanted.setdefault(content_hash_id(doc), doc)
+
+    existing = set(vectorstore.get(include=[])["ids"])
+
+    new_ids = [doc_id for doc_id in wanted if doc_id not in existing]
+    stale_ids = [doc_id for doc_id in existing if doc_id not in wanted]
+
+    for start in range(0, len(new_ids), batch_size):
+        batch = new_ids[start:start + batch_size]
+        vectorstore.add_documents([wanted[doc_id] for doc_id in batch], ids=batch)
+
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+
+    return {
+        "added": len(new_ids),
+        "removed": len(stale_ids),
+        "unchanged": len(wanted) - len(new_ids)
+    }
+
+
+def existing_ids(vectorstore: Chroma, ids: Sequence[str], batch_size: int = 1_000) -> set:
+    """
+    The subset of `ids` already stored in the collection
+    """
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        found.update(vectorstore.get(ids=list(ids[start:start + batch_size]), include=[])["ids"])
+    return found
+
+
+def bulk_add(
+    vectorstore: Chroma,
+    texts: Sequence[str],
+    metadatas: Optional[Sequence[Dict]],
+    ids: Sequence[str],
+    batch_size: int = 256,
+    workers: int = 1
+) -> Dict[str, int]:
+    """
+    Add texts in batches of `batch_size` (embedding request and write per
+    batch), on `workers` threads. Duplicate IDs and IDs already in the
+    collection are skipped, so they are never embedded again.
+    """
+    metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+    rows = {}
+    for text, metadata, doc_id in zip(texts, metadatas, ids):
+        rows.setdefault(doc_id, (text, metadata))
+
+    stored = existing_ids(vectorstore, list(rows))
+    new_ids = [doc_id for doc_id in rows if doc_id not in stored]
+    batch_size = min(batch_size, vectorstore._client.get_max_batch_size())
+    batches = [new_ids[start:start + batch_size] for start in range(0, len(new_ids), batch_size)]
+
+    def add(batch: List[str]):
+        vectorstore.add_texts(
+            texts=[rows[doc_id][0] for doc_id in batch],
+            metadatas=[rows[doc_id][1] for doc_id in batch],
+            ids=batch
+        )
+
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chroma-bulk") as pool:
+            for future in [pool.submit(copy_context().run, add, batch) for batch in batches]:
+                future.result()
+    else:
+        for batch in batches:
+            add(batch)
+
+    return {"added": len(new_ids), "skipped": len(rows) - len(new_ids), "batches": len(batches)}
@@ -0,0 +1,203 @@
+"""
+Bounded conversation memory for MessagesState graphs
+
+A history stage that runs at the start of every turn and keeps the stored
+thread under a token budget (counted with tiktoken, not len/4):
+  1. tool outputs from older turns are replaced by a short stub
+  2. if still over budget, the oldest turns are removed - optionally folded
+     into a running summary message - while recent turns stay verbatim
+Changes are written back through the add_messages reducer, so the
+checkpointed thread itself stays small and each summary is made only once.
+"""
+
+import json
+from functools import lru_cache
+from typing import List, Optional
+
+import tiktoken
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableLambda
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph import MessagesState
+
+
+STALE_TOOL_OUTPUT = "[tool output removed from history to save context]"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Per-message framing overhead used by the OpenAI chat format
+_TOKENS_PER_MESSAGE = 4
+
+# Summaries are internal; keep their tokens out of the graph's message stream
+_SUMMARY_CONFIG = {"tags": [TAG_NOSTREAM]}
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; offline boxes fall back to len/4
+        print(f":warning: tiktoken unavailable ({type(e).__name__}); approximating token counts")
+        return None
+
+
+def count_text_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[BaseMessage], model: str = "gpt-4o-mini") -> int:
+    """
+    Tokens the messages occupy in a chat prompt (content plus tool-call arguments)
+    """
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        total += _TOKENS_PER_MESSAGE + count_text_tokens(content, model)
+        for call in getattr(message, "tool_calls", None) or []:
+            total += count_text_tokens(call["name"] + json.dumps(call["args"]), model)
+    return total
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Group messages into turns, each starting at a HumanMessage
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def is_summary(message: BaseMessage) -> bool:
+    return isinstance(message, SystemMessage) and message.content.startswith(SUMMARY_PREFIX)
+
+
+class HistoryManager:
+    """
+    Keeps a thread under `max_tokens` (including the system prompt).
+    The last `keep_recent_turns` turns are never trimmed or stubbed.
+    Pass a chat model as `summarizer` to fold removed turns into a summary
+    instead of dropping them.
+    """
+
+    def __init__(
+        self,
+        system_prompt: Optional[SystemMessage] = None,
+        max_tokens: int = 4000,
+        keep_recent_turns: int = 3,
+        summarizer=None,
+        model: str = "gpt-4o-mini"
+    ):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.summarizer = summarizer
+        self.model = model
+
+    def plan(self, messages: List[BaseMessage]):
+        """
+        Work out the state updates for a thread.
+        Returns (updates, removed turns' messages, previous summary or None)
+        """
+        summary = messages[0] if messages and is_summary(messages[0]) else None
+        turns = split_turns(messages[1:] if summary else messages)
+        old_turns = turns[:-self.keep_recent_turns] if self.keep_recent_turns else turns
+
+        updates = {}
+        for turn in old_turns:
+            for message in turn:
+                if isinstance(message, ToolMessage) and message.content != STALE_TOOL_OUTPUT:
+                    updates[message.id] = ToolMessage(
+                        content=STALE_TOOL_OUTPUT,
+                        tool_call_id=message.tool_call_id,
+                        name=message.name,
+                        id=message.id
+                    )
+
+        def current(message):
+            return updates.get(message.id, message)
+
+        fixed = [self.system_prompt] if self.system_prompt else []
+        if summary:
+            fixed.append(summary)
+        budget_used = count_message_tokens(fixed, self.model)
+        turn_tokens = [count_message_tokens([current(m) for m in turn], self.model) for turn in turns]
+        total = budget_used + sum(turn_tokens)
+
+        removed = []
+        for turn, tokens in zip(old_turns, turn_tokens):
+            if total <= self.max_tokens:
+                break
+            removed.extend(turn)
+            total -= tokens
+
+        for message in removed:
+            updates.pop(message.id, None)
+        return list(updates.values()), removed, summary
+
+    def _apply(self, updates, removed, summary, new_summary: Optional[str]) -> dict:
+        if not removed:
+            return {"messages": updates}
+
+        out = list(updates)
+        if new_summary is not None:
+            # Reusing the first removed message's (or old summary's) ID keeps the summary at the front
+            anchor = summary.id if summary else removed[0].id
+            out.append(SystemMessage(content=SUMMARY_PREFIX + new_summary, id=anchor))
+            out.extend(RemoveMessage(id=m.id) for m in removed if m.id != anchor)
+        else:
+            out.extend(RemoveMessage(id=m.id) for m in removed)
+        return {"messages": out}
+
+    def _summary_prompt(self, removed, summary) -> List[BaseMessage]:
+        transcript = "\n".join(
+            f"{type(m).__name__.replace('Message', '')}: {m.content}"
+            for m in removed
+            if isinstance(m, (HumanMessage, AIMessage)) and m.content
+        )
+        previous = summary.content[len(SUMMARY_PREFIX):] if summary else "(none)"
+        return [
+            SystemMessage(content="Condense conversations into short factual summaries that keep names, "
+                                  "problems, decisions and anything the user may refer back to."),
+            HumanMessage(content=f"Existing summary:\n{previous}\n\nNew messages:\n{transcript}\n\n"
+                                 "Write the updated summary in at most 150 words.")
+        ]
+
+    def __call__(self, state: MessagesState) -> dict:
+        updates, removed, summary = self.plan(state["messages"])
+        new_summary = None
+        if removed and self.summarizer is not None:
+            new_summary = self.summarizer.invoke(
+                self._summary_prompt(removed, summary), config=_SUMMARY_CONFIG
+            ).content
+        return self._apply(updates, removed, summary, new_summary)
+
+    async def acall(self, state: MessagesState) -> dict:
+        updates, removed, summary = self.plan(state["messages"])
+        new_summary = None
+        if removed and self.summarizer is not None:
+            new_summary = (await self.summarizer.ainvoke(
+                self._summary_prompt(removed, summary), config=_SUMMARY_CONFIG
+            )).content
+        return self._apply(updates, removed, summary, new_summary)
+
+    def as_node(self) -> RunnableLambda:
+        """
+        Graph node usable from both invoke and ainvoke
+        """
+        return RunnableLambda(self, afunc=self.acall, name="history")
@@ -0,0 +1,227 @@
+"""
+Persistent on-disk embedding cache shared by every OpenAIEmbeddings call site
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from graph_telemetry import emit_event
+
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+)
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used for cache keys (unicode NFC, collapsed whitespace)
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """
+    Cache key for a (model, normalized text) pair
+    """
+    payload = f"{model}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def default_model_key(embeddings: Embeddings) -> str:
+    """
+    Cache namespace of an embeddings client: its model name, plus the output
+    dimensionality when it is set, so truncated and full-size vectors of the
+    same model never share entries
+    """
+    model = getattr(embeddings, "model", None) or type(embeddings).__name__
+    dimensions = getattr(embeddings, "dimensions", None)
+    return f"{model}@{dimensions}" if dimensions else model
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a SQLite-backed, size-bounded LRU cache.
+    Both document and query embeddings are served from the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = 50_000,
+        model: Optional[str] = None
+    ):
+        self.embeddings = embeddings
+        # Output dimensionality, when the client fixes it (text-embedding-3 `dimensions`);
+        # otherwise learned from the first vector the model returns
+        self.dimensions = getattr(embeddings, "dimensions", None)
+        self.model = model or default_model_key(embeddings)
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+
+    # ------------------------------------------
+    # Embeddings interface
+    # ------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._partition(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            self._fill(cached, missing, vectors)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, cached, missing = self._partition([text])
+        if missing:
+            self._fill(cached, missing, [self.embeddings.embed_query(text)])
+        return cached[keys[0]]
+
+    # SQLite reads and writes run in a worker thread, off the event loop
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await asyncio.to_thread(self._partition, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._fill, cached, missing, vectors)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, cached, missing = await asyncio.to_thread(self._partition, [text])
+        if missing:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self._fill, cached, missing, [vector])
+        return cached[keys[0]]
+
+    def _partition(self, texts: List[str]):
+        """
+        Cache keys, cached vectors and the (deduplicated) texts still to embed
+        """
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        hits = sum(1 for key in keys if key in cached)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        emit_event("embedding_cache", {"hits": hits, "misses": len(keys) - hits})
+        return keys, cached, missing
+
+    def _fill(self, cached: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]):
+        fresh = dict(zip(missing.keys(), vectors))
+        if self.dimensions is None and vectors:
+            self.dimensions = len(vectors[0])
+        self._store(fresh)
+        cached.update(fresh)
+
+    # ------------------------------------------
+    # Cache management
+    # ------------------------------------------
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit/miss counters and current cache size
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries
+            }
+
+    def clear(self):
+        """
+        Drop every cached vector and reset the counters
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), _SQL_BATCH):
+                batch = unique[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob)
+                    # A vector of another size was cached under this key: treat it as a miss
+                    if self.dimensions is None or len(vector) == self.dimensions:
+                        found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, self.model, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Least-recently-used entries go first once the cache is over budget
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+                )""",
+                (overflow,)
+            )
@@ -0,0 +1,92 @@
+"""
+Extractive contextual compression without LLM calls
+
+ExtractiveCompressor keeps the sentences of the retrieved chunks that are
+most similar to the query, up to a token budget for the whole context.
+All sentences of all documents are embedded in one batched pass and scored
+with one matrix-vector product. With CachedEmbeddings the sentence vectors
+computed at ingest time (cache_sentence_embeddings) are cache hits, so a
+query usually costs a single query embedding.
+"""
+
+import asyncio
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+
+from mmr import normalize_rows
+from sentences import embed_sentences, split_documents
+
+
+def cache_sentence_embeddings(embeddings, texts: Sequence[str]) -> int:
+    """
+    Embed every sentence of `texts` (run at ingest so that queries hit the
+    embedding cache); returns the number of sentences
+    """
+    sentences, _ = split_documents(texts)
+    embed_sentences(embeddings, sentences)
+    return len(sentences)
+
+
+def approximate_tokens(sentences: Sequence[str]) -> np.ndarray:
+    """
+    Approximate token count of each sentence (1 token ≈ 4 characters)
+    """
+    return np.fromiter((len(s) for s in sentences), dtype=np.int64, count=len(sentences)) // 4 + 1
+
+
+class ExtractiveCompressor(BaseDocumentCompressor):
+    """
+    Drop-in replacement for LLMChainExtractor in ContextualCompressionRetriever.
+
+    Sentences are ranked by cosine similarity to the query across all
+    documents and kept best-first while they fit `token_budget`
+    (and score at least `min_similarity`, when set). Each document keeps
+    its chosen sentences in their original order; documents left with
+    none are dropped, the rest keep their retrieval order.
+    """
+
+    embeddings: Any
+    token_budget: int = 300
+    min_similarity: Optional[float] = None
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Callbacks = None) -> Sequence[Document]:
+        sentences, owners = split_documents([doc.page_content for doc in documents])
+        if not sentences:
+            return []
+        matrix = embed_sentences(self.embeddings, sentences)
+        query_vector = normalize_rows(self.embeddings.embed_query(query))[0]
+        return self._select(documents, sentences, owners, matrix @ query_vector)
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str,
+                                  callbacks: Callbacks = None) -> Sequence[Document]:
+        sentences, owners = split_documents([doc.page_content for doc in documents])
+        if not sentences:
+            return []
+        matrix, query_vector = await asyncio.gather(
+            asyncio.to_thread(embed_sentences, self.embeddings, sentences),
+            self.embeddings.aembed_query(query)
+        )
+        return self._select(documents, sentences, owners, matrix @ normalize_rows(query_vector)[0])
+
+    def _select(self, documents: Sequence[Document], sentences: List[str], owners: np.ndarray,
+                scores: np.ndarray) -> List[Document]:
+        tokens = approximate_tokens(sentences)
+        order = np.argsort(-scores, kind="stable")
+        # Sentences longer than the whole budget can never be kept
+        order = order[tokens[order] <= self.token_budget]
+        # Best-first prefix that fits the budget
+        fits = np.cumsum(tokens[order]) <= self.token_budget
+        if self.min_similarity is not None:
+            fits &= scores[order] >= self.min_similarity
+        keep = np.sort(order[fits])
+
+        compressed = []
+        for position in np.unique(owners[keep]):
+            doc = documents[position]
+            text = " ".join(sentences[i] for i in keep[owners[keep] == position])
+            compressed.append(Document(page_content=text, metadata=dict(doc.metadata), id=doc.id))
+        return compressed
@@ -0,0 +1,431 @@
+"""
+Per-node timing and token instrumentation for the LangGraph agents
+
+GraphTelemetry is a callback handler: attach it to a compiled graph with
+`graph.with_config(callbacks=[telemetry])` (or pass it in the invoke config)
+and every node run - assistant, tools, customer_support, the planner/executor/
+critic nodes of the notebooks, ... - becomes one step record with
+
+  - wall time, thread id and LangGraph step number
+  - LLM calls and prompt/completion tokens of the models called inside it
+  - names of the tools called (from ToolNode runs and from the tool calls it
+    was given, so batched tool nodes are covered too)
+  - retrieval hits (documents returned by retrievers and RetrievalService)
+  - semantic-cache and embedding-cache hits and misses
+
+Library code reports the last two with `emit_event`, a no-op outside a graph run.
+
+Exports:
+  - `export_jsonl` / `log_path`: one JSON object per step (structured logs)
+  - `prometheus_text`: counters and a latency histogram in the Prometheus
+    text exposition format (write it where node_exporter's textfile
+    collector looks, or serve it from a /metrics handler)
+  - `write_chrome_trace`: node, LLM, tool and retriever spans of one
+    conversation for chrome://tracing / Perfetto / speedscope (flamegraph)
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.callbacks.manager import dispatch_custom_event
+from langchain_core.messages import AIMessage
+
+
+# Upper bounds (seconds) of the node latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def emit_event(name: str, data: Dict[str, Any]):
+    """
+    Report a measurement (e.g. retrieval hits) to the telemetry of the
+    enclosing graph run; does nothing when called outside one
+    """
+    try:
+        dispatch_custom_event(name, data)
+    except RuntimeError:
+        pass
+
+
+def _new_step(node: str, metadata: Dict[str, Any], start: float) -> Dict[str, Any]:
+    return {
+        "thread_id": str(metadata.get("thread_id", "")),
+        "node": node,
+        "step": metadata.get("langgraph_step"),
+        "start": start,
+        "duration_ms": 0.0,
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "tools": [],
+        "retrieval_hits": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "embedding_cache_hits": 0,
+        "embedding_cache_misses": 0,
+        "error": None
+    }
+
+
+def _token_usage(response) -> tuple:
+    """
+    (prompt, completion) tokens of an LLMResult, from the message usage
+    metadata or, failing that, the provider's llm_output
+    """
+    prompt = completion = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+                found = True
+    if not found:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+    return prompt, completion
+
+
+def _run_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], default: str) -> str:
+    serialized = serialized or {}
+    return kwargs.get("name") or serialized.get("name") or (serialized.get("id") or [default])[-1]
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class GraphTelemetry(BaseCallbackHandler):
+    """
+    Callback handler collecting one record per graph node run.
+    Counters and histograms cover the whole process lifetime; the last
+    `max_steps` step records and `max_spans` trace spans are kept in memory.
+    With `log_path` every finished step is appended there as a JSON line.
+    """
+
+    # Called in the caller's thread/event loop, so timestamps are exact
+    run_inline = True
+
+    def __init__(self, log_path: Optional[str] = None, max_steps: int = 10_000, max_spans: int = 50_000):
+        self.log_path = log_path
+        self.steps = deque(maxlen=max_steps)
+        self.spans = deque(maxlen=max_spans)
+
+        self._lock = threading.Lock()
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._open_steps: Dict[UUID, Dict[str, Any]] = {}
+        self._open_spans: Dict[UUID, Dict[str, Any]] = {}
+        self._origin = time.time() - time.perf_counter()
+
+        self.node_runs = defaultdict(int)
+        self.node_errors = defaultdict(int)
+        self.tokens = defaultdict(int)
+        self.tool_calls = defaultdict(int)
+        self.retrieval_hits = defaultdict(int)
+        self.cache_lookups = defaultdict(int)
+        self.latency_buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.latency_sum = defaultdict(float)
+
+    # ------------------------------------------
+    # Run bookkeeping
+    # ------------------------------------------
+
+    def _enclosing_step(self, run_id: Optional[UUID]) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock
+        while run_id is not None:
+            step = self._open_steps.get(run_id)
+            if step is not None:
+                return step
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _start_span(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, category: str,
+                    metadata: Optional[Dict[str, Any]]):
+        now = time.perf_counter()
+        metadata = metadata or {}
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            if category == "chain":
+                node = metadata.get("langgraph_node")
+                if not node or name != node:
+                    return
+                # A node's inner runnable often carries the node's own name
+                enclosing = self._enclosing_step(parent_run_id)
+                if enclosing and enclosing["node"] == node and enclosing["step"] == metadata.get("langgraph_step"):
+                    return
+                self._open_steps[run_id] = _new_step(node, metadata, now)
+                category = "node"
+            self._open_spans[run_id] = {
+                "name": name,
+                "cat": category,
+                "thread_id": str(metadata.get("thread_id", "")),
+                "start": now
+            }
+
+    def _end_span(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Dict[str, Any]]:
+        now = time.perf_counter()
+        with self._lock:
+            self._parents.pop(run_id, None)
+            span = self._open_spans.pop(run_id, None)
+            if span is not None:
+                span["duration"] = now - span["start"]
+                self.spans.append(span)
+            step = self._open_steps.pop(run_id, None)
+            if step is None:
+                return None
+            step["duration_ms"] = round((now - step["start"]) * 1000, 3)
+            if error is not None:
+                step["error"] = type(error).__name__
+            self._record(step)
+        self._log(step)
+        return step
+
+    def _record(self, step: Dict[str, Any]):
+        # Caller holds the lock
+        node = step["node"]
+        self.steps.append(step)
+        self.node_runs[node] += 1
+        if step["error"]:
+            self.node_errors[node] += 1
+        if step["llm_calls"]:
+            self.tokens[(node, "prompt")] += step["prompt_tokens"]
+            self.tokens[(node, "completion")] += step["completion_tokens"]
+        for tool in step["tools"]:
+            self.tool_calls[tool] += 1
+        if step["retrieval_hits"]:
+            self.retrieval_hits[node] += step["retrieval_hits"]
+        self.cache_lookups[("semantic", "hit")] += step["cache_hits"]
+        self.cache_lookups[("semantic", "miss")] += step["cache_misses"]
+        self.cache_lookups[("embedding", "hit")] += step["embedding_cache_hits"]
+        self.cache_lookups[("embedding", "miss")] += step["embedding_cache_misses"]
+
+        seconds = step["duration_ms"] / 1000
+        self.latency_sum[node] += seconds
+        buckets = self.latency_buckets[node]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+
+    def _log(self, step: Dict[str, Any]):
+        if self.log_path:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self._public(step)) + "\n")
+
+    def _public(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(step)
+        record["start"] = round(self._origin + step["start"], 6)
+        return record
+
+    def _update_step(self, run_id: Optional[UUID], **increments):
+        with self._lock:
+            step = self._enclosing_step(run_id)
+            if step is None:
+                return
+            for key, value in increments.items():
+                if key == "tools":
+                    step["tools"].extend(value)
+                elif key == "tool":
+                    # Tools run by a "tools" node were already counted from its tool calls
+                    if step["node"] != "tools" or value not in step["tools"]:
+                        step["tools"].append(value)
+                else:
+                    step[key] += value
+
+    # ------------------------------------------
+    # Callbacks
+    # ------------------------------------------
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_span(run_id, parent_run_id, kwargs.get("name") or "chain", "chain", metadata)
+        # Tool names come from the calls handed to the node, so batched tool
+        # nodes that bypass ToolNode are counted as well
+        if run_id in self._open_steps and isinstance(inputs, dict):
+            messages = inputs.get("messages") or []
+            last = messages[-1] if messages else None
+            if (metadata or {}).get("langgraph_node") == "tools" and isinstance(last, AIMessage):
+                self._update_step(run_id, tools=[call["name"] for call in last.tool_calls])
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_span(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_span(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "chat_model"), "llm", metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "llm"), "llm", metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt, completion = _token_usage(response)
+        self._update_step(run_id, llm_calls=1, prompt_tokens=prompt, completion_tokens=completion)
+        span = self._open_spans.get(run_id)
+        if span is not None:
+            span["args"] = {"prompt_tokens": prompt, "completion_tokens": completion}
+        self._end_span(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._update_step(run_id, llm_calls=1)
+        self._end_span(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = _run_name(serialized, kwargs, "tool")
+        self._start_span(run_id, parent_run_id, name, "tool", metadata)
+        self._update_step(run_id, tool=name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_span(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_span(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "retriever"), "retriever", metadata)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._update_step(run_id, retrieval_hits=len(documents))
+        self._end_span(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end_span(run_id, error)
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        if name == "retrieval":
+            self._update_step(run_id, retrieval_hits=data.get("hits", 0))
+        elif name == "semantic_cache":
+            self._update_step(run_id, **({"cache_hits": 1} if data.get("hit") else {"cache_misses": 1}))
+        elif name == "embedding_cache":
+            self._update_step(
+                run_id,
+                embedding_cache_hits=data.get("hits", 0),
+                embedding_cache_misses=data.get("misses", 0)
+            )
+
+    # ------------------------------------------
+    # Exports
+    # ------------------------------------------
+
+    def records(self, thread_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Finished step records (JSON-serializable), optionally for one thread
+        """
+        with self._lock:
+            steps = list(self.steps)
+        return [self._public(s) for s in steps if thread_id is None or s["thread_id"] == thread_id]
+
+    def export_jsonl(self, path: str, thread_id: Optional[str] = None) -> int:
+        """
+        Write step records as JSON lines; returns the number written
+        """
+        records = self.records(thread_id)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return len(records)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-node run count, mean latency and token totals
+        """
+        with self._lock:
+            return {
+                node: {
+                    "runs": runs,
+                    "mean_ms": round(self.latency_sum[node] / runs * 1000, 3),
+                    "prompt_tokens": self.tokens.get((node, "prompt"), 0),
+                    "completion_tokens": self.tokens.get((node, "completion"), 0),
+                    "retrieval_hits": self.retrieval_hits.get(node, 0)
+                }
+                for node, runs in sorted(self.node_runs.items())
+            }
+
+    def prometheus_text(self, prefix: str = "agent") -> str:
+        """
+        Counters and the node latency histogram in Prometheus text format
+        """
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Iterable):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                rendered = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{rendered}}} {value}")
+
+        with self._lock:
+            metric("node_runs_total", "counter", "Graph node runs.",
+                   [("", {"node": n}, v) for n, v in sorted(self.node_runs.items())])
+            metric("node_errors_total", "counter", "Graph node runs that raised.",
+                   [("", {"node": n}, v) for n, v in sorted(self.node_errors.items())])
+            metric("llm_tokens_total", "counter", "LLM tokens by node and kind.",
+                   [("", {"node": n, "kind": k}, v) for (n, k), v in sorted(self.tokens.items())])
+            metric("tool_calls_total", "counter", "Tool calls by tool.",
+                   [("", {"tool": t}, v) for t, v in sorted(self.tool_calls.items())])
+            metric("retrieval_hits_total", "counter", "Documents returned by retrieval.",
+                   [("", {"node": n}, v) for n, v in sorted(self.retrieval_hits.items())])
+            metric("cache_lookups_total", "counter", "Cache lookups by cache and result.",
+                   [("", {"cache": c, "result": r}, v) for (c, r), v in sorted(self.cache_lookups.items())])
+
+            samples = []
+            for node, buckets in sorted(self.latency_buckets.items()):
+                for bound, count in zip(LATENCY_BUCKETS, buckets):
+                    samples.append(("_bucket", {"node": node, "le": repr(bound)}, count))
+                samples.append(("_bucket", {"node": node, "le": "+Inf"}, self.node_runs[node]))
+                samples.append(("_sum", {"node": node}, round(self.latency_sum[node], 6)))
+                samples.append(("_count", {"node": node}, self.node_runs[node]))
+            metric("node_duration_seconds", "histogram", "Graph node wall time.", samples)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "agent"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(prefix))
+
+    def chrome_trace(self, thread_id: str) -> Dict[str, Any]:
+        """
+        Trace Event Format document of one conversation: nested node, LLM,
+        tool and retriever spans ("X" events, microsecond timestamps)
+        """
+        with self._lock:
+            spans = [s for s in self.spans if s["thread_id"] == thread_id]
+            steps = {(s["node"], s["start"]): s for s in self.steps if s["thread_id"] == thread_id}
+
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": thread_id}}]
+        for span in sorted(spans, key=lambda s: (s["start"], -s["duration"])):
+            args = dict(span.get("args", {}))
+            step = steps.get((span["name"], span["start"])) if span["cat"] == "node" else None
+            if step is not None:
+                args.update({k: v for k, v in step.items() if k not in ("node", "start", "duration_ms", "thread_id")})
+            events.append({
+                "name": span["name"],
+                "cat": span["cat"],
+                "ph": "X",
+                "ts": round((self._origin + span["start"]) * 1e6, 1),
+                "dur": round(span["duration"] * 1e6, 1),
+                "pid": 1,
+                "tid": 1,
+                "args": args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str, thread_id: str) -> int:
+        """
+        Write the trace of one conversation; returns the number of spans
+        """
+        trace = self.chrome_trace(thread_id)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+        return len(trace["traceEvents"]) - 1
+
+    def reset(self):
+        with self._lock:
+            self.steps.clear()
+            self.spans.clear()
+            for counter in (self.node_runs, self.node_errors, self.tokens, self.tool_calls,
+                            self.retrieval_hits, self.cache_lookups, self.latency_buckets, self.latency_sum):
+                counter.clear()
@@ -0,0 +1,316 @@
+"""
+Hybrid lexical + dense retrieval
+
+BM25Index is a compact in-memory inverted index (CSR postings in NumPy
+arrays) built next to the Chroma/FAISS index at ingest time and saved as one
+.npz file. HybridRetriever runs BM25 and vector search in parallel and fuses
+the two rankings with reciprocal rank fusion (RRF). Queries that are exact
+identifier lookups ("ZeroDivisionError", "df.head()", "CAC registration") are
+answered from the inverted index alone, without an embedding call.
+"""
+
+import asyncio
+import json
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+# Words, numbers and dotted identifiers ("df.head", "os.path.join")
+_TOKEN = re.compile(r"[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*")
+# Identifier-looking tokens: dotted/snake_case names, CamelCase, acronyms, codes with digits
+_IDENTIFIER = re.compile(r"[._]|[a-z][A-Z]|^[A-Z]{2,}$|[A-Za-z]\d|\d[A-Za-z]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the to what when where which who why with you your".split()
+)
+
+_pool_thread = threading.local()
+
+# Vector searches run here while BM25 scores on the calling thread
+SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-search",
+                                 initializer=lambda: setattr(_pool_thread, "active", True))
+
+
+def submit_search(fn: Callable, *args) -> Future:
+    """
+    Run fn(*args) on SEARCH_POOL with the caller's context (callbacks,
+    telemetry). On a SEARCH_POOL thread it runs inline instead: a pool task
+    blocking on another pool task can starve the pool.
+    """
+    if getattr(_pool_thread, "active", False):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return SEARCH_POOL.submit(copy_context().run, fn, *args)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased index terms; dotted identifiers also yield their parts
+    """
+    terms = []
+    for match in _TOKEN.findall(text):
+        token = match.lower()
+        terms.append(token)
+        if "." in token:
+            terms.extend(part for part in token.split(".") if part)
+    return terms
+
+
+def identifier_terms(text: str) -> List[str]:
+    """
+    Lowercased terms of `text` that look like code identifiers, error names or acronyms
+    """
+    return [match.lower() for match in _TOKEN.findall(text) if _IDENTIFIER.search(match)]
+
+
+def doc_key(doc: Document) -> Hashable:
+    """
+    Identity of a chunk for deduplication: its store ID, else its content
+    """
+    return doc.id if doc.id is not None else doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = 60,
+                           limit: Optional[int] = None) -> List[Document]:
+    """
+    Fuse several ranked lists: score(d) = sum of 1 / (k + rank). Chunks are
+    deduplicated by ID; the first copy seen is returned with its metadata.
+    """
+    scores: Dict[Hashable, float] = {}
+    first: Dict[Hashable, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            first.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [first[key] for key in ordered[:limit]]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an immutable set of chunks. Postings are stored as CSR
+    arrays (term offsets, document positions, term frequencies), so a query
+    costs one vectorized update per query term.
+    """
+
+    def __init__(
+        self,
+        ids: List[Any],
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        self.ids = ids
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+
+        n = len(ids)
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average = float(lengths.mean()) if n else 1.0
+        self._norm = (k1 * (1 - b + b * lengths / max(average, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids: Sequence[Any], texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Index `texts`; `ids` are the vector store IDs of the same chunks
+        """
+        vocabulary: Dict[str, int] = {}
+        term_parts, doc_parts, count_parts, lengths = [], [], [], []
+        for position, text in enumerate(texts):
+            term_ids = np.fromiter(
+                (vocabulary.setdefault(term, len(vocabulary)) for term in tokenize(text)), dtype=np.int32
+            )
+            unique, counts = np.unique(term_ids, return_counts=True)
+            term_parts.append(unique)
+            count_parts.append(counts)
+            doc_parts.append(np.full(len(unique), position, dtype=np.int32))
+            lengths.append(len(term_ids))
+
+        # Group the (term, document, count) triples by term: CSR postings
+        terms = np.concatenate(term_parts) if term_parts else np.empty(0, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocabulary)))
+        postings = np.concatenate(doc_parts)[order] if doc_parts else np.empty(0, dtype=np.int32)
+        frequencies = (np.concatenate(count_parts)[order] if count_parts else np.empty(0)).astype(np.float32)
+        return cls(list(ids), vocabulary, offsets, postings, frequencies,
+                   np.asarray(lengths, dtype=np.float32), k1=k1, b=b)
+
+    @classmethod
+    def build_stream(cls, pairs: Iterable[Tuple[Any, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Index a stream of (ID, text) pairs; texts are tokenized as they
+        arrive and never held in memory together
+        """
+        ids = []
+
+        def texts():
+            for doc_id, text in pairs:
+                ids.append(doc_id)
+                yield text
+
+        return cls.build(ids, texts(), k1=k1, b=b)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Any, float]]:
+        """
+        (chunk ID, BM25 score) of the k best matching chunks; chunks
+        sharing no term with the query are never returned
+        """
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids or not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in matched]
+
+    def is_exact_lookup(self, query: str, max_terms: int = 3) -> bool:
+        """
+        True for short queries naming an indexed identifier, which lexical
+        search answers on its own (no embedding needed)
+        """
+        content_terms = [t for t in _TOKEN.findall(query) if t.lower() not in STOPWORDS]
+        if not content_terms or len(content_terms) > max_terms:
+            return False
+        return any(term in self.vocabulary for term in identifier_terms(query))
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+
+    def save(self, path: str):
+        """
+        Write the index as a single .npz file (no pickled objects);
+        NumPy appends ".npz" to paths without it
+        """
+        header = {"ids": self.ids, "vocabulary": list(self.vocabulary), "k1": self.k1, "b": self.b}
+        np.savez_compressed(
+            path,
+            header=np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            lengths=self.lengths
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            return cls(
+                header["ids"],
+                {term: i for i, term in enumerate(header["vocabulary"])},
+                data["offsets"],
+                data["postings"],
+                data["frequencies"],
+                data["lengths"],
+                k1=header["k1"],
+                b=header["b"]
+            )
+
+
+def fetch_documents(vectorstore, ids: Sequence[Any]) -> List[Document]:
+    """
+    Chunks for `ids` from the vector store, in the order of `ids`
+    """
+    if not ids:
+        return []
+    # Document.id is always a string; FAISS stores use integer IDs
+    by_id = {doc.id: doc for doc in vectorstore.get_by_ids(list(ids))}
+    return [by_id[str(doc_id)] for doc_id in ids if str(doc_id) in by_id]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 + vector retriever fused with RRF.
+
+    mode="hybrid" runs both searches in parallel (exact identifier lookups
+    take the keyword-only path when `exact_fast_path` is set),
+    mode="keyword" never embeds, mode="vector" is plain dense search.
+    `vectorstore` needs `similarity_search` and `get_by_ids` (Chroma and
+    ShardedFAISS both have them); `keyword_index` holds the same chunk IDs.
+    """
+
+    vectorstore: Any
+    keyword_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    mode: str = "hybrid"
+    exact_fast_path: bool = True
+    rrf_k: int = 60
+
+    def _route(self, query: str) -> str:
+        if self.mode == "hybrid" and self.exact_fast_path and self.keyword_index.is_exact_lookup(query):
+            return "keyword"
+        return self.mode
+
+    def _keyword(self, query: str) -> List[Document]:
+        hits = self.keyword_index.search(query, self.fetch_k)
+        return fetch_documents(self.vectorstore, [doc_id for doc_id, _ in hits])
+
+    def _vector(self, query: str) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=self.fetch_k)
+
+    def _fuse(self, lexical: List[Document], dense: List[Document]) -> List[Document]:
+        return reciprocal_rank_fusion([lexical, dense], k=self.rrf_k, limit=self.k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        route = self._route(query)
+        if route == "keyword":
+            return self._keyword(query)[:self.k]
+        if route == "vector":
+            return self._vector(query)[:self.k]
+        dense = submit_search(self._vector, query)
+        lexical = self._keyword(query)
+        return self._fuse(lexical, dense.result())
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        route = self._route(query)
+        if route == "keyword":
+            return (await asyncio.to_thread(self._keyword, query))[:self.k]
+        if route == "vector":
+            return (await asyncio.to_thread(self._vector, query))[:self.k]
+        lexical, dense = await asyncio.gather(
+            asyncio.to_thread(self._keyword, query),
+            asyncio.to_thread(self._vector, query)
+        )
+        return self._fuse(lexical, dense)
@@ -0,0 +1,179 @@
+"""
+Speculative HyDE (Hypothetical Document Embeddings)
+
+Plain HyDE is serial: an LLM writes a hypothetical answer, and only then is
+that answer embedded and searched. HyDERetriever in speculative mode starts
+the generation in the background and searches with the question itself at
+the same time. When the direct top hit already clears `score_threshold` its
+results are returned straight away and the HyDE branch is cancelled;
+otherwise both rankings are fused with RRF.
+
+Hypothetical documents are cached per normalized question by
+HypotheticalDocuments, so a repeated question costs no LLM call at all.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from embedding_cache import normalize_text
+from hybrid_search import reciprocal_rank_fusion
+
+# LLM calls are slow; keep them off the shared search pool
+GENERATION_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hyde")
+
+
+class HypotheticalDocuments:
+    """
+    Hypothetical-answer generator with an LRU cache keyed by the
+    normalized question. `generator` maps {"question": ...} to a string.
+    """
+
+    def __init__(self, generator, cache_size: int = 1_024):
+        self.generator = generator
+        self.cache_size = cache_size
+
+        self.cache_hits = 0
+        self.generated = 0
+        self.early_exits = 0
+
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(question: str) -> str:
+        return normalize_text(question).lower()
+
+    def cached(self, question: str) -> Optional[str]:
+        key = self.key(question)
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._cache[key]
+
+    def generate(self, question: str, config: Optional[Dict] = None) -> str:
+        """
+        Hypothetical answer to `question` (cached)
+        """
+        document = self.cached(question)
+        if document is None:
+            document = self.generator.invoke({"question": question}, config=config)
+            self._store(question, document)
+        return document
+
+    async def agenerate(self, question: str, config: Optional[Dict] = None) -> str:
+        document = self.cached(question)
+        if document is None:
+            document = await self.generator.ainvoke({"question": question}, config=config)
+            self._store(question, document)
+        return document
+
+    def record_early_exit(self):
+        with self._lock:
+            self.early_exits += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "cache_hits": self.cache_hits,
+                "generated": self.generated,
+                "early_exits": self.early_exits,
+                "cached_documents": len(self._cache)
+            }
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _store(self, question: str, document: str):
+        with self._lock:
+            self.generated += 1
+            self._cache[self.key(question)] = document
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+class HyDERetriever(BaseRetriever):
+    """
+    HyDE retriever over `vectorstore` using a shared HypotheticalDocuments.
+
+    speculative=False is classic HyDE (generate, then search with the
+    hypothetical answer). speculative=True runs the direct search and the
+    generation concurrently; with a `score_threshold` the direct results
+    are returned early when their top relevance score reaches it, and the
+    HyDE search never runs. A sync generation that is already running
+    cannot be interrupted - it finishes in the background and still fills
+    the cache - while the async path cancels the LLM call.
+    """
+
+    vectorstore: Any
+    hypotheses: Any
+    k: int = 5
+    speculative: bool = True
+    score_threshold: Optional[float] = None
+    rrf_k: int = 60
+
+    def _confident(self, direct) -> bool:
+        return self.score_threshold is not None and bool(direct) and direct[0][1] >= self.score_threshold
+
+    def _early_exit(self, direct) -> List[Document]:
+        self.hypotheses.record_early_exit()
+        return [doc for doc, _ in direct]
+
+    def _fuse(self, hyde_docs: List[Document], direct) -> List[Document]:
+        return reciprocal_rank_fusion([hyde_docs, [doc for doc, _ in direct]], k=self.rrf_k, limit=self.k)
+
+    def _hyde(self, query: str, config: Dict) -> List[Document]:
+        return self.vectorstore.similarity_search(self.hypotheses.generate(query, config), k=self.k)
+
+    async def _ahyde(self, query: str, config: Dict) -> List[Document]:
+        document = await self.hypotheses.agenerate(query, config)
+        return await self.vectorstore.asimilarity_search(document, k=self.k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()}
+        if not self.speculative:
+            return self._hyde(query, config)
+
+        # Only the LLM call runs ahead; the HyDE search waits for the fusion decision
+        generation = GENERATION_POOL.submit(copy_context().run, self.hypotheses.generate, query, config)
+        try:
+            direct = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.k)
+        except BaseException:
+            generation.cancel()
+            raise
+        if self._confident(direct):
+            generation.cancel()
+            return self._early_exit(direct)
+        hyde_docs = self.vectorstore.similarity_search(generation.result(), k=self.k)
+        return self._fuse(hyde_docs, direct)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()}
+        if not self.speculative:
+            return await self._ahyde(query, config)
+
+        generation = asyncio.ensure_future(self.hypotheses.agenerate(query, config))
+        try:
+            direct = await self.vectorstore.asimilarity_search_with_relevance_scores(query, k=self.k)
+        except BaseException:
+            generation.cancel()
+            raise
+        if self._confident(direct):
+            generation.cancel()
+            return self._early_exit(direct)
+        hyde_docs = await self.vectorstore.asimilarity_search(await generation, k=self.k)
+        return self._fuse(hyde_docs, direct)
@@ -1,24 +1,21 @@
 from langgraph.graph import START, END, StateGraph, MessagesState
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
+from dataclasses import dataclass
+import threading
 import os
 import time
 
-# loading environment variables from .env file 
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
+from llm_backends import is_offline, make_chat_model, make_embeddings
+from chat_streaming import stream_reply, format_timing
+from conversation_memory import HistoryManager
+from sqlite_checkpointer import SQLiteCheckpointer, checkpoint_path
+from embedding_cache import CachedEmbeddings
+from semantic_cache import SemanticCache, fingerprint, is_cache_hit
+from graph_telemetry import GraphTelemetry
 
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY not found! Please set it in your .env file.")
-
-# Initialize the LLM
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.7,
-    api_key=openai_api_key
-)
+# Importing this module has no side effects: the LLM, caches and graph are built
+# on first use by get_app() (or by touching `langgraph_task.customer_support_agent`)
 
 # system prompt for customer support
 customer_support_prompt = SystemMessage(
@@ -29,44 +26,131 @@ customer_support_prompt = SystemMessage(
     Remember the entire conversation history to provide consistent support."""
 )
 
-# Assistant node function
-def customer_support_assistant(state: MessagesState) -> dict:
+@dataclass
+class CustomerSupportApp:
     """
-    Customer support node - processes messages and generates helpful responses.
+    LLM, caches and compiled graph, built once per process by get_app()
     """
-    # system prompt with conversation history
-    messages = [customer_support_prompt] + state["messages"]
-    
-    # response from LLM
-    response = llm.invoke(messages)
-    
-    # Return as state update
-    return {"messages": [AIMessage(content=response.content)]}
+    llm: object
+    embeddings: CachedEmbeddings
+    response_cache: SemanticCache
+    history: HistoryManager
+    memory: SQLiteCheckpointer
+    telemetry: GraphTelemetry
+    customer_support_agent: object
+
+def build_app() -> CustomerSupportApp:
+    """
+    Initialize the LLM and compile the support graph (uncached; use get_app())
+    """
+    # loading environment variables from .env file 
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+
+    if not openai_api_key and not is_offline():
+        raise ValueError("OPENAI_API_KEY not found! Please set it in your .env file.")
+
+    # Initialize the LLM
+    llm = make_chat_model(
+        model="gpt-4o-mini",
+        temperature=0.7,
+        api_key=openai_api_key
+    )
+
+    # Assistant node function
+    def customer_support_assistant(state: MessagesState) -> dict:
+        """
+        Customer support node - processes messages and generates helpful responses.
+        """
+        # system prompt with conversation history
+        messages = [customer_support_prompt] + state["messages"]
+        
+        # response from LLM
+        response = llm.invoke(messages)
+        
+        # Return as state update
+        return {"messages": [AIMessage(content=response.content)]}
+
+    # History stage - keeps long support sessions under a token budget.
+    # Older turns are summarized so details the customer gave earlier are not lost.
+    history = HistoryManager(customer_support_prompt, max_tokens=3000, keep_recent_turns=4, summarizer=llm)
 
-# Create StateGraph
-builder = StateGraph(MessagesState)
+    # Semantic response cache - repeated standalone questions ("how do I reset my laptop?")
+    # are answered from earlier replies; follow-ups that refer back to the chat always reach the LLM
+    embeddings = CachedEmbeddings(make_embeddings("text-embedding-3-small", api_key=openai_api_key))
+    response_cache = SemanticCache(
+        embeddings,
+        namespace="customer_support",
+        corpus_version=fingerprint(customer_support_prompt.content, llm.model_name),
+        threshold=0.92
+    )
+    cache_lookup, cache_store = response_cache.as_nodes()
+
+    def route_after_cache(state: MessagesState) -> str:
+        return END if is_cache_hit(state["messages"][-1]) else "customer_support"
+
+    # Create StateGraph
+    builder = StateGraph(MessagesState)
+
+    # Add the history stage, the cache stages and the customer support assistant node
+    builder.add_node("history", history.as_node())
+    builder.add_node("cache_lookup", cache_lookup)
+    builder.add_node("customer_support", customer_support_assistant)
+    builder.add_node("cache_store", cache_store)
+
+    # Flow Declaration
+    builder.add_edge(START, "history")
+    builder.add_edge("history", "cache_lookup")
+    builder.add_conditional_edges("cache_lookup", route_after_cache, ["customer_support", END])
+    builder.add_edge("customer_support", "cache_store")
+    builder.add_edge("cache_store", END)
+
+    # memory checkpointer
+    memory = SQLiteCheckpointer(checkpoint_path("customer_support"))
+
+    # Per-node timings, tokens and cache hits; set AGENT_TELEMETRY_LOG to also get JSON-lines logs
+    telemetry = GraphTelemetry(log_path=os.getenv("AGENT_TELEMETRY_LOG"))
 
-# Add the customer support assistant node
-builder.add_node("customer_support", customer_support_assistant)
+    # building graph with memory
+    customer_support_agent = builder.compile(checkpointer=memory).with_config(callbacks=[telemetry])
 
-# Flow Declaration
-builder.add_edge(START, "customer_support")
-builder.add_edge("customer_support", END)
+    print(": Customer support agent built successfully!")
+    return CustomerSupportApp(
+        llm=llm,
+        embeddings=embeddings,
+        response_cache=response_cache,
+        history=history,
+        memory=memory,
+        telemetry=telemetry,
+        customer_support_agent=customer_support_agent
+    )
 
-# memory checkpointer
-memory = MemorySaver()
+_app = None
+_app_lock = threading.Lock()
 
-# building graph with memory
-customer_support_agent = builder.compile(checkpointer=memory)
+def get_app() -> CustomerSupportApp:
+    """
+    The process-wide CustomerSupportApp, built on first call (thread-safe)
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_app()
+    return _app
 
-print(": Customer support agent built successfully!")
+def __getattr__(name: str):
+    # `langgraph_task.customer_support_agent` and friends resolve to the lazily built app
+    if name in CustomerSupportApp.__dataclass_fields__:
+        return getattr(get_app(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Helper function to run conversations
 def run_customer_conversation(user_input: str, thread_id: str = "default_session"):
     """
     Send a message to the customer support agent and get response.
     """
-    result = customer_support_agent.invoke(
+    result = get_app().customer_support_agent.invoke(
         {"messages": [HumanMessage(content=user_input)]},
         config={"configurable": {"thread_id": thread_id}}
     )
@@ -83,15 +167,18 @@ def run_customer_conversation(user_input: str, thread_id: str = "default_session
 
 
 # interactive chat
-def interactive_customer_support():
+def interactive_customer_support(stream: bool = True):
     """
     Live chat with your customer support agent.
+    With stream=True the reply is printed token by token as it is generated.
     """
+    customer_support_agent = get_app().customer_support_agent
+
     print("\n" + "="*70)
     print(" MARRIEJAYS GADGETS - CUSTOMER SUPPORT")
     print("="*60)
     print("Type your message and press Enter.")
-    print("Type '/new' to start fresh, '/exit' to quit.")
+    print("Type '/new' to start fresh, '/trace' to save this chat's timeline, '/exit' to quit.")
     print("="*60 + "\n")
     
     thread_id = "live_chat_001"
@@ -113,10 +200,23 @@ def interactive_customer_support():
             conversation_count = 0
             print(f" New conversation started: {thread_id}")
             continue
+        elif user_input.lower() == "/trace":
+            # Open in chrome://tracing or ui.perfetto.dev
+            path = f"trace_{thread_id}.json"
+            spans = get_app().telemetry.write_chrome_trace(path, thread_id)
+            print(f" Saved {spans} spans to {path}\n")
+            continue
         elif user_input == "":
             continue
         
         # Run the agent
+        if stream:
+            print()
+            reply = stream_reply(customer_support_agent, user_input, thread_id, prefix=" Support: ")
+            print(f" {format_timing(reply)}\n")
+            conversation_count += 1
+            continue
+        
         print(" Support: Thinking...")
         result = customer_support_agent.invoke(
             {"messages": [HumanMessage(content=user_input)]},
@@ -131,4 +231,5 @@ def interactive_customer_support():
         conversation_count += 1
 
 if __name__ == "__main__":
+    get_app()
     interactive_customer_support()
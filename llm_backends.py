@@ -0,0 +1,294 @@
+"""
+Pluggable chat and embedding backends
+
+Every module builds its models through `make_chat_model` / `make_embeddings`.
+With LLM_BACKEND=openai (the default) these are ChatOpenAI / OpenAIEmbeddings.
+With LLM_BACKEND=fake they are deterministic local stand-ins that need no API
+key or network, for benchmarks and offline CI:
+  - ScriptedChatModel answers with fixed text, calls a bound tool when the
+    question mentions one of the words in the tool's name, streams tokens and
+    tool-call chunks, and sleeps for a configurable latency
+  - HashEmbeddings is a hashed bag-of-words embedder, so identical texts get
+    identical vectors and texts sharing words get similar ones
+  - OverlapCrossEncoder scores (query, passage) pairs by word overlap and
+    sleeps per batch and per pair like a CPU cross-encoder
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+BACKEND = os.environ.get("LLM_BACKEND", "openai").lower()
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def is_offline() -> bool:
+    return BACKEND == "fake"
+
+
+def _env_seconds(name: str, default_ms: float) -> float:
+    return float(os.environ.get(name, default_ms)) / 1000
+
+
+def make_chat_model(model: str = "gpt-4o-mini", temperature: float = 0, api_key: Optional[str] = None, **kwargs):
+    """
+    ChatOpenAI, or a ScriptedChatModel when LLM_BACKEND=fake
+    """
+    if is_offline():
+        return ScriptedChatModel(
+            model_name=f"scripted-{model}",
+            latency=_env_seconds("FAKE_LLM_LATENCY_MS", 0),
+            token_latency=_env_seconds("FAKE_LLM_TOKEN_MS", 0)
+        )
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, temperature=temperature, api_key=api_key, **kwargs)
+
+
+def make_embeddings(model: str = "text-embedding-3-small", api_key: Optional[str] = None, **kwargs) -> Embeddings:
+    """
+    OpenAIEmbeddings, or HashEmbeddings when LLM_BACKEND=fake
+    """
+    if is_offline():
+        return HashEmbeddings(
+            size=int(os.environ.get("FAKE_EMBEDDING_DIM", 256)),
+            latency=_env_seconds("FAKE_EMBEDDING_LATENCY_MS", 0),
+            model=f"hash-{model}"
+        )
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model, api_key=api_key, **kwargs)
+
+
+def make_cross_encoder(
+    model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    backend: str = "torch",
+    onnx_file: str = "onnx/model_quint8_avx2.onnx",
+    **kwargs
+):
+    """
+    sentence-transformers CrossEncoder, or an OverlapCrossEncoder when LLM_BACKEND=fake.
+    backend="onnx" loads the int8-quantized ONNX export `onnx_file` for CPU
+    inference (needs `pip install sentence-transformers[onnx]`);
+    backend="torch" loads the regular model.
+    """
+    if is_offline():
+        return OverlapCrossEncoder(
+            latency=_env_seconds("FAKE_RERANK_LATENCY_MS", 0),
+            pair_latency=_env_seconds("FAKE_RERANK_PAIR_MS", 0)
+        )
+    from sentence_transformers import CrossEncoder
+    if backend == "onnx":
+        kwargs.setdefault("model_kwargs", {"file_name": onnx_file})
+    return CrossEncoder(model, backend=backend, **kwargs)
+
+
+# ==============================================
+# DETERMINISTIC EMBEDDINGS
+# ==============================================
+
+class HashEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words vectors: every lowercase word adds +-1 to one of
+    `size` buckets chosen by its blake2b digest. `latency` is slept once per
+    request, like a network round trip.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0, model: str = "hash"):
+        self.size = size
+        # Same attribute as OpenAIEmbeddings, so caches key on the vector size too
+        self.dimensions = size
+        self.latency = latency
+        self.model = model
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.size] += 1.0 if (digest >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+# ==============================================
+# DETERMINISTIC CROSS-ENCODER
+# ==============================================
+
+class OverlapCrossEncoder:
+    """
+    Share of the query's words found in the passage, with the
+    CrossEncoder.predict interface. `latency` is slept once per call and
+    `pair_latency` per pair, like a model scoring a batch on CPU.
+    """
+
+    def __init__(self, latency: float = 0.0, pair_latency: float = 0.0):
+        self.latency = latency
+        self.pair_latency = pair_latency
+
+    def predict(self, pairs: Sequence[Sequence[str]], **kwargs) -> np.ndarray:
+        time.sleep(self.latency + self.pair_latency * len(pairs))
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for i, (query, passage) in enumerate(pairs):
+            words = set(_WORD.findall(query.lower()))
+            if words:
+                scores[i] = len(words & set(_WORD.findall(passage.lower()))) / len(words)
+        return scores
+
+
+# ==============================================
+# SCRIPTED CHAT MODEL
+# ==============================================
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic chat model.
+
+    After a user message it calls the first bound tool whose name shares a
+    word with the question (passing the question as the tool's first string
+    argument); otherwise - and after tool results - it answers with
+    `answer_template`. `latency` is slept before the first token and
+    `token_latency` per streamed word. Usage metadata counts words.
+    """
+
+    model_name: str = "scripted"
+    answer_template: str = "Scripted answer to: {question}"
+    latency: float = 0.0
+    token_latency: float = 0.0
+    tools: List[Dict[str, Any]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs) -> "ScriptedChatModel":
+        return self.model_copy(update={"tools": [convert_to_openai_tool(t)["function"] for t in tools]})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        words = set(_WORD.findall(question.lower()))
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+
+        if messages and not isinstance(messages[-1], ToolMessage):
+            for spec in self.tools:
+                if words & set(spec["name"].lower().split("_")):
+                    args = self._tool_args(spec, question)
+                    call_id = "call_" + hashlib.sha1(f"{len(messages)}{question}".encode()).hexdigest()[:12]
+                    return AIMessage(
+                        content="",
+                        tool_calls=[{"name": spec["name"], "args": args, "id": call_id, "type": "tool_call"}],
+                        usage_metadata={"input_tokens": prompt_tokens, "output_tokens": 8,
+                                        "total_tokens": prompt_tokens + 8}
+                    )
+
+        content = self.answer_template.format(question=question)
+        output_tokens = len(content.split())
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": output_tokens,
+                            "total_tokens": prompt_tokens + output_tokens}
+        )
+
+    @staticmethod
+    def _tool_args(spec: Dict[str, Any], question: str) -> Dict[str, Any]:
+        properties = spec.get("parameters", {}).get("properties", {})
+        first_string = next((name for name, p in properties.items() if p.get("type") == "string"), None)
+        return {first_string: question} if first_string else {}
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        if message.tool_calls:
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata
+            )
+            return
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            yield AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=message.usage_metadata if last else None
+            )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self.latency + self.token_latency * len(reply.content.split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(reply.content.split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            time.sleep(self.token_latency)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=chunk)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            await asyncio.sleep(self.token_latency)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=chunk)
+            yield ChatGenerationChunk(message=chunk)
@@ -0,0 +1,89 @@
+"""
+Vectorized maximal marginal relevance (MMR) re-ranking with NumPy
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """
+    Contiguous float32 copy of `vectors` with unit-length rows
+    """
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class MMRReranker:
+    """
+    Selects `k` results from a candidate matrix by maximal marginal relevance.
+
+    Relevance to the query is one matrix-vector product over all candidates.
+    The `fetch_k` most relevant candidates form the MMR pool, and their
+    pairwise similarities come from a single matrix product (pools larger
+    than `pairwise_limit` fall back to one product per selected item to
+    keep memory bounded). `fetch_k=None` runs MMR over every candidate.
+    """
+
+    def __init__(
+        self,
+        k: int = 3,
+        fetch_k: Optional[int] = 20,
+        lambda_mult: float = 0.5,
+        pairwise_limit: int = 256
+    ):
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.pairwise_limit = pairwise_limit
+
+    def select(self, query_vector, candidates, normalized: bool = False) -> List[int]:
+        """
+        Indices into `candidates` picked by MMR, in selection order.
+        Pass normalized=True when `candidates` came from normalize_rows.
+        """
+        matrix = candidates if normalized else normalize_rows(candidates)
+        n = matrix.shape[0]
+        k = min(self.k, n)
+        if k <= 0:
+            return []
+
+        query = normalize_rows(query_vector)[0]
+        relevance = matrix @ query
+
+        if self.fetch_k is not None and self.fetch_k < n:
+            pool = np.argpartition(-relevance, self.fetch_k - 1)[:self.fetch_k]
+            pool = pool[np.argsort(-relevance[pool], kind="stable")]
+            pool_vectors = matrix[pool]
+            pool_relevance = relevance[pool]
+            k = min(k, len(pool))
+        else:
+            # Whole candidate set: avoid copying the matrix
+            pool = np.arange(n)
+            pool_vectors = matrix
+            pool_relevance = relevance
+
+        pairwise = pool_vectors @ pool_vectors.T if len(pool) <= self.pairwise_limit else None
+
+        chosen = np.zeros(len(pool), dtype=bool)
+        max_similarity = np.full(len(pool), -np.inf, dtype=np.float32)
+        selected = [int(np.argmax(pool_relevance))]
+        chosen[selected[0]] = True
+
+        while len(selected) < k:
+            last = selected[-1]
+            row = pairwise[last] if pairwise is not None else pool_vectors @ pool_vectors[last]
+            np.maximum(max_similarity, row, out=max_similarity)
+
+            scores = self.lambda_mult * pool_relevance - (1 - self.lambda_mult) * max_similarity
+            scores[chosen] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            chosen[best] = True
+
+        return [int(pool[i]) for i in selected]
@@ -0,0 +1,104 @@
+"""
+Multi-query retrieval with one round-trip per stage
+
+MultiQueryRetriever asks an LLM for variants of the question, embeds all of
+them in a single request, runs their searches together (one batched
+collection query on Chroma, concurrent searches on other stores) and fuses
+the rankings with reciprocal rank fusion, deduplicating chunks by ID.
+
+With `speculative=True` the original question is retrieved while the
+variants are still being generated, so the variant LLM call is the only
+serial step in front of one batched retrieval. The LLM call runs on
+VARIANT_POOL and the retrieval on the calling thread, so no SEARCH_POOL
+thread ever waits on another SEARCH_POOL task.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from embedding_cache import normalize_text
+from hybrid_search import reciprocal_rank_fusion
+
+# Variant generation (an LLM call) runs here during the speculative search
+VARIANT_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="multi-query")
+
+
+def clean_variants(question: str, variants: List[str], max_variants: Optional[int] = None) -> List[str]:
+    """
+    Non-empty variants that differ from the question and from each other
+    """
+    seen = {normalize_text(question).lower()}
+    cleaned = []
+    for variant in variants:
+        variant = variant.strip()
+        key = normalize_text(variant).lower()
+        if variant and key not in seen:
+            seen.add(key)
+            cleaned.append(variant)
+    return cleaned[:max_variants]
+
+
+class MultiQueryRetriever(BaseRetriever):
+    """
+    Retrieve for the question and its LLM-generated variants, fused with RRF.
+
+    `service` is a RetrievalService over the vector store (its `k` is the
+    per-query depth); `query_generator` maps {"question": ...} to a list
+    of variant strings. `limit` caps the fused result (None keeps every
+    unique chunk, like the union it replaces).
+    """
+
+    service: Any
+    query_generator: Any
+    limit: Optional[int] = None
+    max_variants: Optional[int] = None
+    speculative: bool = True
+    rrf_k: int = 60
+
+    def _fuse(self, rankings: List[List[Document]]) -> List[Document]:
+        return reciprocal_rank_fusion(rankings, k=self.rrf_k, limit=self.limit)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()}
+        if not self.speculative:
+            variants = self.query_generator.invoke({"question": query}, config=config)
+            return self._fuse(self.service.retrieve_many([query] + clean_variants(query, variants, self.max_variants)))
+
+        # The LLM writes the variants while the original question is searched here
+        generation = VARIANT_POOL.submit(copy_context().run, self.query_generator.invoke, {"question": query}, config)
+        try:
+            original = self.service.retrieve(query)
+        except BaseException:
+            generation.cancel()
+            raise
+        variants = clean_variants(query, generation.result(), self.max_variants)
+        rankings = self.service.retrieve_many(variants) if variants else []
+        return self._fuse([original] + rankings)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()}
+        if not self.speculative:
+            variants = await self.query_generator.ainvoke({"question": query}, config=config)
+            return self._fuse(
+                await self.service.aretrieve_many([query] + clean_variants(query, variants, self.max_variants))
+            )
+
+        original = asyncio.ensure_future(self.service.aretrieve(query))
+        try:
+            variants = clean_variants(query, await self.query_generator.ainvoke({"question": query}, config=config),
+                                      self.max_variants)
+        except BaseException:
+            original.cancel()
+            raise
+        rankings = await self.service.aretrieve_many(variants) if variants else []
+        return self._fuse([await original] + rankings)
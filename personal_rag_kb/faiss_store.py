@@ -0,0 +1,666 @@
+"""
+Sharded, memory-mapped FAISS store with a lazily loaded SQLite docstore
+
+On-disk layout of a store directory:
+    store.json          dimension, metric, index type and parameters, shard list
+    shard_000.faiss     one FAISS index per shard (vector IDs = docstore row IDs)
+    docstore.sqlite3    chunk text and metadata, fetched by ID at query time
+    keyword_index.npz   BM25 inverted index over the same IDs (hybrid retrieval)
+    vectors.f32         full-precision vectors, row = vector ID (ivfpq, sq8 and binary)
+
+Index types (chosen when the store is built, see index_params):
+    flat    exact brute-force search (IndexFlatL2)
+    hnsw    HNSW graph over full vectors; M and efConstruction at build
+            time, efSearch at query time
+    ivfpq   inverted lists with product-quantized codes; trained on a sample
+            of the first `train_size` vectors, nprobe lists searched per query
+    sq8     int8 scalar-quantized codes (4x smaller than float32)
+    binary  one sign bit per dimension (32x smaller), Hamming search
+
+sq8 and binary shards hold the first `dims` dimensions of each vector
+(Matryoshka truncation, renormalized). For ivfpq, sq8 and binary a query
+fetches `k * rescore` candidates from the shards and re-scores those with
+exact L2 distances from vectors.f32, which is memory-mapped rather than loaded.
+
+Convert an index written by FAISS.save_local:
+    python faiss_store.py convert faiss_index vectorstore_faiss --shards 4 --index hnsw
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Shared modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hybrid_search import BM25Index, HybridRetriever
+from quantization import binary_codes, compact_dims, truncate
+
+
+STORE_FILE = "store.json"
+DOCSTORE_FILE = "docstore.sqlite3"
+KEYWORD_INDEX_FILE = "keyword_index.npz"
+VECTORS_FILE = "vectors.f32"
+
+# Maps the flat vector codes instead of reading them into RAM (older FAISS builds lack IFC)
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+BINARY_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "sq8", "binary")
+
+# Types trained on buffered vectors before anything is added
+TRAINED_TYPES = ("ivfpq", "sq8")
+
+# Types holding truncated / quantized vectors (quantization kind of each)
+QUANTIZED_TYPES = {"sq8": "int8", "binary": "binary"}
+
+# Types whose candidates are re-scored at full precision from vectors.f32
+RESCORED_TYPES = ("ivfpq", "sq8", "binary")
+
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+    # nlist and pq_m are derived from the training sample / dimension when None;
+    # rescore = candidates re-scored at full precision per result
+    "ivfpq": {"nlist": None, "pq_m": None, "nbits": 8, "nprobe": 16, "train_size": 50_000, "rescore": 4},
+    # dims=None keeps every dimension
+    "sq8": {"dims": None, "rescore": 4, "train_size": 50_000},
+    "binary": {"dims": None, "rescore": 10},
+}
+
+
+def shard_file(shard: int) -> str:
+    return f"shard_{shard:03d}.faiss"
+
+
+def index_params(index_type: str = "flat", params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Defaults for `index_type` updated with `params` (unknown keys are rejected)
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    resolved = dict(DEFAULT_INDEX_PARAMS[index_type])
+    unknown = set(params or {}) - set(resolved)
+    if unknown:
+        raise ValueError(f"Unknown {index_type} parameters: {', '.join(sorted(unknown))}")
+    resolved.update({key: value for key, value in (params or {}).items() if value is not None})
+    return resolved
+
+
+def default_pq_m(dim: int) -> int:
+    """
+    Largest number of PQ sub-quantizers dividing `dim` with at least 16 dimensions each
+    """
+    for m in range(max(1, dim // 16), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def new_index(dim: int, index_type: str, params: Dict[str, Any]):
+    """
+    Empty index that stores explicit vector IDs (IVF-PQ and SQ8 still need
+    training; sq8 and binary indexes have params["dims"] dimensions)
+    """
+    if index_type == "sq8":
+        return faiss.index_factory(params["dims"], "IDMap2,SQ8")
+    if index_type == "binary":
+        return faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(params["dims"]))
+    if index_type == "hnsw":
+        index = faiss.index_factory(dim, f"IDMap2,HNSW{params['m']}")
+        faiss.downcast_index(index.index).hnsw.efConstruction = params["ef_construction"]
+        return index
+    if index_type == "ivfpq":
+        return faiss.index_factory(dim, f"IVF{params['nlist']},PQ{params['pq_m']}x{params['nbits']}")
+    return faiss.index_factory(dim, "IDMap2,Flat")
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return vectors[rng.choice(len(vectors), min(len(vectors), size), replace=False)]
+
+
+def ivfpq_min_vectors(params: Dict[str, Any]) -> int:
+    """
+    Vectors needed to train IVF-PQ well: FAISS wants ~39 points per PQ
+    centroid (2 ** nbits of them) and per inverted list
+    """
+    return 39 * max(2 ** params["nbits"], params["nlist"] or 1)
+
+
+def train_ivfpq(vectors: np.ndarray, params: Dict[str, Any], seed: int = 0):
+    """
+    Empty IVF-PQ index trained on a random sample of `vectors` (at most
+    train_size), and the params with nlist / pq_m filled in
+    """
+    sample = training_sample(vectors, params["train_size"], seed)
+    params = dict(params)
+    # ~4 * sqrt(n) lists, with at least 39 training points per list
+    params["nlist"] = params["nlist"] or int(min(4 * np.sqrt(len(sample)), max(1, len(sample) // 39)))
+    params["pq_m"] = params["pq_m"] or default_pq_m(vectors.shape[1])
+    index = new_index(vectors.shape[1], "ivfpq", params)
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return index, params
+
+
+def set_search_params(index, index_type: str, params: Dict[str, Any]):
+    """
+    Apply the query-time parameters (efSearch, nprobe) to a loaded index
+    """
+    if index_type == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = params["ef_search"]
+    elif index_type == "ivfpq":
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+
+
+def compact_vectors(matrix: np.ndarray, index_type: str, params: Dict[str, Any]) -> np.ndarray:
+    """
+    Vectors as the shards of `index_type` hold them: truncated to params["dims"]
+    and renormalized for sq8, then bit-packed for binary; unchanged otherwise
+    """
+    if index_type not in QUANTIZED_TYPES:
+        return matrix
+    compact = truncate(matrix, params["dims"])
+    return binary_codes(compact) if index_type == "binary" else compact
+
+
+def read_shard(path: str, index_type: str, mmap: bool = False):
+    if index_type == "binary":
+        return faiss.read_index_binary(path, BINARY_MMAP_FLAGS if mmap else 0)
+    return faiss.read_index(path, MMAP_FLAGS if mmap else 0)
+
+
+def write_shard(index, path: str, index_type: str):
+    if index_type == "binary":
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+class SQLiteDocstore:
+    """
+    Chunk text and metadata keyed by integer vector ID.
+    With autocommit=False, adds and deletes stay in one open transaction
+    until commit() (the writer commits once its shards are on disk).
+    """
+
+    def __init__(self, path: str, autocommit: bool = True):
+        self.autocommit = autocommit
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def add(self, ids: Sequence[int], documents: Sequence[Document]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, content, metadata) VALUES (?, ?, ?)",
+                [
+                    (int(doc_id), doc.page_content, json.dumps(doc.metadata, default=str))
+                    for doc_id, doc in zip(ids, documents)
+                ]
+            )
+            if self.autocommit:
+                self._conn.commit()
+
+    def get(self, ids: Sequence[int]) -> Dict[int, Document]:
+        ids = [int(doc_id) for doc_id in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, content, metadata FROM documents WHERE id IN ({placeholders})",
+                ids
+            ).fetchall()
+        return {
+            row_id: Document(page_content=content, metadata=json.loads(metadata), id=row_id)
+            for row_id, content, metadata in rows
+        }
+
+    def iter_texts(self, batch_size: int = 1_000) -> Iterator[Tuple[int, str]]:
+        """
+        (ID, chunk text) of every chunk, read in ID order a batch at a time
+        """
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, content FROM documents WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def delete(self, ids: Sequence[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", [(int(i),) for i in ids])
+            if self.autocommit:
+                self._conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def max_id(self) -> int:
+        with self._lock:
+            value = self._conn.execute("SELECT MAX(id) FROM documents").fetchone()[0]
+        return -1 if value is None else value
+
+    def close(self):
+        """
+        Close the connection (uncommitted changes are rolled back)
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class ShardedFAISSWriter:
+    """
+    Builds (or updates) a sharded store. Vectors are routed to shards by ID.
+
+    For ivfpq and sq8, vectors are buffered until `train_size` of them have
+    arrived (or save is called); one index is trained on a random sample of
+    them and cloned into every shard. With fewer vectors than PQ training
+    needs (ivfpq_min_vectors, ~10k at nbits=8) ivfpq falls back to flat,
+    which is recorded in store.json.
+
+    ivfpq, sq8 and binary stores also write every full-precision vector to
+    vectors.f32 at offset ID * dim as it is added.
+
+    Docstore adds and deletes are committed by save(), after the shards are
+    written; a sync that fails before then leaves the docstore unchanged.
+    """
+
+    def __init__(self, path: str, dim: int, num_shards: int = 1, index_type: str = "flat",
+                 params: Optional[Dict[str, Any]] = None):
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if (name in (STORE_FILE, KEYWORD_INDEX_FILE, VECTORS_FILE) or name.startswith(DOCSTORE_FILE)
+                    or name.endswith(".faiss")):
+                os.remove(os.path.join(path, name))
+
+        self.path = path
+        self.dim = dim
+        self.num_shards = num_shards
+        self.index_type = index_type
+        self.params = index_params(index_type, params)
+        if index_type in QUANTIZED_TYPES:
+            self.params["dims"] = compact_dims(dim, QUANTIZED_TYPES[index_type], self.params["dims"])
+        self.shards = None if index_type in TRAINED_TYPES else [
+            new_index(dim, index_type, self.params) for _ in range(num_shards)
+        ]
+        self.docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE), autocommit=False)
+        self.next_id = 0
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._changed = False
+        self._write_vectors = index_type in RESCORED_TYPES
+
+    @classmethod
+    def open(cls, path: str) -> "ShardedFAISSWriter":
+        """
+        Load an existing store fully into memory for in-place updates
+        """
+        with open(os.path.join(path, STORE_FILE)) as f:
+            config = json.load(f)
+        index_config = dict(config.get("index", {"type": "flat"}))
+        writer = cls.__new__(cls)
+        writer.path = path
+        writer.dim = config["dim"]
+        writer.index_type = index_config.pop("type")
+        index_config.pop("requested", None)
+        writer.params = index_config
+        writer.shards = [read_shard(os.path.join(path, shard["file"]), writer.index_type) for shard in config["shards"]]
+        writer.num_shards = len(writer.shards)
+        if writer.index_type in TRAINED_TYPES and not writer.shards[0].is_trained:
+            # Saved empty: train on the vectors of this update
+            writer.shards = None
+        writer.docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE), autocommit=False)
+        writer.next_id = writer.docstore.max_id() + 1
+        writer._pending = []
+        writer._changed = False
+        # ivfpq stores written before re-scoring existed have no vectors.f32 to extend
+        writer._write_vectors = writer.index_type in QUANTIZED_TYPES or (
+            writer.index_type in RESCORED_TYPES and os.path.exists(os.path.join(path, VECTORS_FILE))
+        )
+        return writer
+
+    def add(self, vectors, documents: Sequence[Document]) -> List[int]:
+        """
+        Add vectors with their chunks; returns the assigned vector IDs
+        """
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.arange(self.next_id, self.next_id + len(documents), dtype=np.int64)
+        self.next_id += len(documents)
+        if self._write_vectors:
+            self._write_full(matrix, ids)
+
+        if self.shards is None:
+            self._pending.append((matrix, ids))
+            if sum(len(batch_ids) for _, batch_ids in self._pending) >= self.params["train_size"]:
+                self._train()
+        else:
+            self._add_to_shards(matrix, ids)
+
+        self.docstore.add(ids.tolist(), documents)
+        self._changed = self._changed or len(ids) > 0
+        return ids.tolist()
+
+    def _write_full(self, matrix: np.ndarray, ids: np.ndarray):
+        """
+        Full-precision rows for re-scoring; IDs of one add are consecutive
+        """
+        target = os.path.join(self.path, VECTORS_FILE)
+        with open(target, "r+b" if os.path.exists(target) else "wb") as f:
+            f.seek(int(ids[0]) * self.dim * 4)
+            f.write(matrix.tobytes())
+
+    def _add_to_shards(self, matrix: np.ndarray, ids: np.ndarray):
+        matrix = compact_vectors(matrix, self.index_type, self.params)
+        shard_of = ids % len(self.shards)
+        for shard, index in enumerate(self.shards):
+            mask = shard_of == shard
+            if mask.any():
+                index.add_with_ids(matrix[mask], ids[mask])
+
+    def _train(self):
+        """
+        Train the IVF-PQ or SQ8 index on a sample of the buffered vectors, then add them
+        """
+        matrix = np.concatenate([m for m, _ in self._pending] or [np.empty((0, self.dim), np.float32)])
+        ids = np.concatenate([i for _, i in self._pending] or [np.empty(0, np.int64)])
+        self._pending = []
+
+        if self.index_type == "sq8":
+            # Per-dimension ranges of the int8 codes
+            template = new_index(self.dim, "sq8", self.params)
+            if len(matrix):
+                sample = training_sample(matrix, self.params["train_size"])
+                template.train(compact_vectors(sample, "sq8", self.params))
+            self.shards = [faiss.clone_index(template) for _ in range(self.num_shards)]
+        elif len(matrix) < ivfpq_min_vectors(self.params):
+            # Too few vectors to train the codebooks and lists: exact search is cheap at this size anyway
+            self.params = {"requested": self.index_type}
+            self.index_type = "flat"
+            self.shards = [new_index(self.dim, "flat", {}) for _ in range(self.num_shards)]
+            self._write_vectors = False
+            if os.path.exists(os.path.join(self.path, VECTORS_FILE)):
+                os.remove(os.path.join(self.path, VECTORS_FILE))
+        else:
+            template, self.params = train_ivfpq(matrix, self.params)
+            self.shards = [faiss.clone_index(template) for _ in range(self.num_shards)]
+        self._add_to_shards(matrix, ids)
+
+    def delete(self, ids: Sequence[int]):
+        """
+        Remove vectors and their chunks by ID
+        """
+        if not ids:
+            return
+        selector = np.asarray(ids, dtype=np.int64)
+        if self.shards is None:
+            pending = []
+            for matrix, batch_ids in self._pending:
+                keep = ~np.isin(batch_ids, selector)
+                pending.append((matrix[keep], batch_ids[keep]))
+            self._pending = pending
+        elif self.index_type == "hnsw":
+            # HNSW graphs cannot drop nodes: rebuild the affected shards from their vectors
+            self.shards = [self._without(index, selector) for index in self.shards]
+        else:
+            for index in self.shards:
+                index.remove_ids(selector)
+        self.docstore.delete(ids)
+        self._changed = True
+
+    def _without(self, index, selector: np.ndarray):
+        stored = faiss.vector_to_array(index.id_map)
+        keep = ~np.isin(stored, selector)
+        if keep.all():
+            return index
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        rebuilt = new_index(self.dim, self.index_type, self.params)
+        if keep.any():
+            rebuilt.add_with_ids(vectors[keep], stored[keep])
+        return rebuilt
+
+    def save(self):
+        """
+        Write shards, the keyword index and store.json (files are replaced atomically)
+        """
+        if self.shards is None:
+            self._train()
+        shards = []
+        for shard, index in enumerate(self.shards):
+            target = os.path.join(self.path, shard_file(shard))
+            write_shard(index, target + ".tmp", self.index_type)
+            os.replace(target + ".tmp", target)
+            shards.append({"file": shard_file(shard), "count": int(index.ntotal)})
+        self.docstore.commit()
+
+        # Rebuilt from the docstore, streamed a batch of chunks at a time, when chunks changed
+        target = os.path.join(self.path, KEYWORD_INDEX_FILE)
+        if self._changed or not os.path.exists(target):
+            BM25Index.build_stream(self.docstore.iter_texts()).save(target + ".tmp.npz")
+            os.replace(target + ".tmp.npz", target)
+            self._changed = False
+
+        config = {"dim": self.dim, "metric": "l2", "index": {"type": self.index_type, **self.params}, "shards": shards}
+        with open(os.path.join(self.path, STORE_FILE), "w") as f:
+            json.dump(config, f, indent=2)
+
+    def close(self):
+        self.docstore.close()
+
+
+class ShardedFAISS:
+    """
+    Read side of a sharded store. Shards are memory-mapped and searched in
+    parallel; results are merged by distance and chunks are fetched from the
+    docstore only for the final hits. For ivfpq, sq8 and binary stores the
+    merged candidates are re-scored from the memory-mapped full-precision vectors.
+    """
+
+    def __init__(self, path: str, embeddings, mmap: bool = True, max_workers: Optional[int] = None,
+                 search_params: Optional[Dict[str, Any]] = None):
+        with open(os.path.join(path, STORE_FILE)) as f:
+            self.config = json.load(f)
+
+        self.path = path
+        self.embeddings = embeddings
+        # Stores written before index types existed are flat
+        self.index_type = self.config.get("index", {}).get("type", "flat")
+        self.shards = [
+            read_shard(os.path.join(path, shard["file"]), self.index_type, mmap)
+            for shard in self.config["shards"]
+        ]
+        self.params = {**self.config.get("index", {}), **(search_params or {})}
+        for index in self.shards:
+            set_search_params(index, self.index_type, self.params)
+        self.full = None
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        if self.index_type in RESCORED_TYPES and os.path.exists(vectors_path) and os.path.getsize(vectors_path):
+            self.full = np.memmap(vectors_path, dtype=np.float32, mode="r").reshape(-1, self.config["dim"])
+        elif self.index_type in QUANTIZED_TYPES:
+            self.full = np.empty((0, self.config["dim"]), dtype=np.float32)
+        self.docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards))
+
+        keyword_path = os.path.join(path, KEYWORD_INDEX_FILE)
+        self.keyword_index = BM25Index.load(keyword_path) if os.path.exists(keyword_path) else None
+
+    @property
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in self.shards)
+
+    def search_vectors(self, vector, k: int) -> List[Tuple[int, float]]:
+        """
+        (vector ID, L2 distance) of the k nearest vectors across all shards
+        """
+        query = np.ascontiguousarray(vector, dtype=np.float32).reshape(1, -1)
+        rescored = self.full is not None
+        shard_query = compact_vectors(query, self.index_type, self.params)
+        fetch = k * max(self.params["rescore"], 1) if rescored else k
+
+        def search_shard(index):
+            if index.ntotal == 0:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            distances, ids = index.search(shard_query, min(fetch, index.ntotal))
+            return distances[0], ids[0]
+
+        if len(self.shards) == 1:
+            partials = [search_shard(self.shards[0])]
+        else:
+            partials = list(self._pool.map(search_shard, self.shards))
+
+        distances = np.concatenate([d for d, _ in partials])
+        ids = np.concatenate([i for _, i in partials])
+        keep = ids >= 0
+        distances, ids = distances[keep], ids[keep]
+        order = np.argsort(distances, kind="stable")[:fetch]
+        if rescored:
+            return self._rescore(query[0], ids[order], k)
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    def _rescore(self, query: np.ndarray, candidates: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Exact L2 distances of the candidates, from the memory-mapped full-precision vectors
+        """
+        # Sorted reads are sequential on the memory-mapped file
+        ids = np.sort(candidates)
+        distances = ((self.full[ids] - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    def similarity_search_by_vector_with_score(self, vector, k: int = 4) -> List[Tuple[Document, float]]:
+        hits = self.search_vectors(vector, k)
+        docs = self.docstore.get([doc_id for doc_id, _ in hits])
+        return [(docs[doc_id], score) for doc_id, score in hits if doc_id in docs]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def get_by_ids(self, ids: Sequence[int]) -> List[Document]:
+        docs = self.docstore.get(ids)
+        return [docs[int(doc_id)] for doc_id in ids if int(doc_id) in docs]
+
+    def as_retriever(self, k: int = 4) -> "ShardedFAISSRetriever":
+        return ShardedFAISSRetriever(store=self, k=k)
+
+    def as_hybrid_retriever(self, k: int = 4, fetch_k: int = 20, mode: str = "hybrid") -> BaseRetriever:
+        """
+        BM25 + vector retriever (plain vector retriever for stores saved without a keyword index)
+        """
+        if self.keyword_index is None:
+            return self.as_retriever(k=k)
+        return HybridRetriever(vectorstore=self, keyword_index=self.keyword_index, k=k, fetch_k=fetch_k, mode=mode)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.docstore.close()
+
+
+class ShardedFAISSRetriever(BaseRetriever):
+    """
+    LangChain retriever over a ShardedFAISS store
+    """
+
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.store.similarity_search(query, k=self.k)
+
+
+def convert_langchain_store(source: str, target: str, num_shards: int = 1, index_type: str = "flat",
+                            params: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Convert a FAISS.save_local directory (index.faiss + index.pkl) into the
+    sharded layout. Returns the number of vectors written.
+    """
+    import pickle
+
+    index = faiss.read_index(os.path.join(source, "index.faiss"))
+    with open(os.path.join(source, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    documents = [docstore.search(index_to_docstore_id[i]) for i in range(index.ntotal)]
+
+    writer = ShardedFAISSWriter(target, index.d, num_shards=num_shards, index_type=index_type, params=params)
+    writer.add(vectors, documents)
+    writer.save()
+    writer.close()
+    return index.ntotal
+
+
+def add_index_arguments(parser: argparse.ArgumentParser):
+    """
+    --index and its tuning flags (shared by ingest.py and the convert command)
+    """
+    parser.add_argument("--index", choices=INDEX_TYPES, default="flat", help="FAISS index type for new stores")
+    parser.add_argument("--hnsw-m", type=int, help="hnsw: graph neighbours per node (default 32)")
+    parser.add_argument("--ef-construction", type=int, help="hnsw: build-time search depth (default 200)")
+    parser.add_argument("--ef-search", type=int, help="hnsw: query-time search depth (default 64)")
+    parser.add_argument("--nlist", type=int, help="ivfpq: inverted lists (default ~4*sqrt(training sample))")
+    parser.add_argument("--pq-m", type=int, help="ivfpq: PQ sub-quantizers, must divide the dimension")
+    parser.add_argument("--nprobe", type=int, help="ivfpq: lists searched per query (default 16)")
+    parser.add_argument("--train-size", type=int, help="ivfpq, sq8: vectors sampled for training (default 50000)")
+    parser.add_argument("--dims", type=int, help="sq8, binary: keep the first N dimensions (Matryoshka truncation)")
+    parser.add_argument("--rescore", type=int,
+                        help="ivfpq, sq8, binary: candidates re-scored at full precision per result "
+                             "(default 4, binary 10)")
+
+
+def index_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    index_params overrides for args.index from the parsed flags
+    """
+    flags = {
+        "hnsw": {"m": args.hnsw_m, "ef_construction": args.ef_construction, "ef_search": args.ef_search},
+        "ivfpq": {"nlist": args.nlist, "pq_m": args.pq_m, "nprobe": args.nprobe, "train_size": args.train_size,
+                  "rescore": args.rescore},
+        "sq8": {"dims": args.dims, "rescore": args.rescore, "train_size": args.train_size},
+        "binary": {"dims": args.dims, "rescore": args.rescore},
+    }
+    return {key: value for key, value in flags.get(args.index, {}).items() if value is not None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded FAISS store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="convert a FAISS.save_local directory")
+    convert.add_argument("source")
+    convert.add_argument("target")
+    convert.add_argument("--shards", type=int, default=1)
+    add_index_arguments(convert)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        count = convert_langchain_store(args.source, args.target, args.shards, args.index, index_args(args))
+        print(f" Converted {count} vectors from '{args.source}' into '{args.target}' "
+              f"({args.shards} shards, {args.index} index)")
@@ -1,18 +1,21 @@
 import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import TextLoader, PyPDFLoader, DirectoryLoader
+from langchain.document_loaders import TextLoader, PyPDFLoader
 from dotenv import load_dotenv
 
-
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in .env file")
-
-print(" API key loaded")
+# Shared modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_cache import CachedEmbeddings
+from faiss_store import STORE_FILE, ShardedFAISSWriter, add_index_arguments, index_args
+from manifest import Manifest
+from semantic_chunking import StreamingSemanticChunker
 
 
 DATA_PATHS = [
@@ -20,40 +23,237 @@ DATA_PATHS = [
     "knowledge_base/projects"
 ]
 
-# 1. Load documents
-all_docs = []
+LOADERS = {
+    ".pdf": PyPDFLoader,
+    ".md": TextLoader
+}
+
+VECTOR_STORE_PATH = "vectorstore_faiss"
+
+
+def discover_files(data_paths):
+    """
+    Files under each data path that have a loader (same non-recursive globs as before)
+    """
+    files = []
+    for path in data_paths:
+        if not os.path.exists(path):
+            print(f" Path does not exist: {path}")
+            continue
+        for extension in LOADERS:
+            files.extend(sorted(glob.glob(os.path.join(path, f"*{extension}"))))
+    return files
+
+
+def load_and_split(file_path, chunk_size=500, chunk_overlap=50, split=True):
+    """
+    Parse one file and split it into chunks (runs in a worker process);
+    with split=False the parsed documents are returned whole
+    """
+    loader_cls = LOADERS[os.path.splitext(file_path)[1].lower()]
+    docs = loader_cls(file_path).load()
+    if not split:
+        for doc in docs:
+            doc.metadata["source"] = file_path
+        return docs
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    return text_splitter.split_documents(docs)
+
+
+def iter_chunks(files, workers=None, split=True):
+    """
+    Yield (file path, chunk) pairs as files finish parsing. At most 2 files per
+    worker are in flight, so memory stays bounded no matter how large the corpus is.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = iter(files)
+        in_flight = [(path, pool.submit(load_and_split, path, split=split)) for path in islice(pending, workers * 2)]
+        while in_flight:
+            file_path, future = in_flight.pop(0)
+            for path in islice(pending, 1):
+                in_flight.append((path, pool.submit(load_and_split, path, split=split)))
+            for chunk in future.result():
+                yield file_path, chunk
+
+
+def iter_semantic_chunks(files, chunker, workers=None):
+    """
+    Yield (file path, chunk) pairs from semantic chunking: files are parsed by
+    the worker processes, then chunked here as a stream (sentence embeddings
+    need the embeddings client, which stays in this process)
+    """
+    pages = (page for _, page in iter_chunks(files, workers, split=False))
+    for chunk in chunker.split_documents(pages):
+        yield chunk.metadata["source"], chunk
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-for path in DATA_PATHS:
-    if os.path.exists(path):
-        # Load PDFs
-        pdf_loader = DirectoryLoader(path, glob="*.pdf", loader_cls=PyPDFLoader)
-        all_docs.extend(pdf_loader.load())
 
-        txt_loader = DirectoryLoader(path, glob="*.md", loader_cls=TextLoader)
-        all_docs.extend(txt_loader.load())
+def sync(embeddings, store_path=VECTOR_STORE_PATH, num_shards=1, batch_size=128, workers=None, rebuild=False,
+         chunker=None, index_type="flat", index_params=None):
+    """
+    Bring the FAISS store in line with DATA_PATHS. Only added or modified files
+    are parsed and embedded; vectors of modified and removed files are deleted.
+    Falls back to a full rebuild when there is no store or manifest yet.
+    Pass a StreamingSemanticChunker as `chunker` to chunk semantically.
+    `index_type` / `index_params` select the FAISS index of full builds;
+    incremental updates keep the index the store was built with.
+    """
+    files = discover_files(DATA_PATHS)
+    manifest = Manifest(store_path)
+    has_store = os.path.exists(os.path.join(store_path, STORE_FILE)) and os.path.exists(manifest.path)
+
+    if rebuild or not has_store:
+        manifest.files = {}
+        writer = None
+        to_index = manifest.snapshot(files)
+        print(f"\n Full build: {len(to_index)} files")
     else:
-        print(f" Path does not exist: {path}")
+        writer = ShardedFAISSWriter.open(store_path)
+        added, modified, removed = manifest.diff(files)
+        if not (added or modified or removed):
+            writer.close()
+            manifest.save()
+            print(" Vector store is up to date")
+            return 0
 
-print(f"\nLoaded {len(all_docs)} documents")
+        stale_ids = [vector_id for path in modified + removed for vector_id in manifest.forget(path)]
+        writer.delete(stale_ids)
+        to_index = added + modified
+        print(f"\n Incremental update: {len(added)} added, {len(modified)} modified, "
+              f"{len(removed)} removed ({len(stale_ids)} vectors deleted)")
 
-# 2. Split documents into chunks
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50
-)
-chunks = text_splitter.split_documents(all_docs)
+    vector_ids = {path: [] for path in to_index}
+    total_chunks = 0
+    start = time.perf_counter()
 
-print(f"\nSplit documents into {len(chunks)} chunks")
+    try:
+        chunks_stream = (iter_semantic_chunks(to_index, chunker, workers) if chunker is not None
+                         else iter_chunks(to_index, workers))
+        for batch in batched(chunks_stream, batch_size):
+            paths = [path for path, _ in batch]
+            chunks = [chunk for _, chunk in batch]
+            vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            if writer is None:
+                writer = ShardedFAISSWriter(store_path, dim=len(vectors[0]), num_shards=num_shards,
+                                            index_type=index_type, params=index_params)
+            for path, vector_id in zip(paths, writer.add(vectors, chunks)):
+                vector_ids[path].append(vector_id)
 
-# 3.  embeddings
-embeddings = OpenAIEmbeddings(openai_api_key=api_key)
+            total_chunks += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f" {total_chunks} chunks indexed ({total_chunks / elapsed:.1f} chunks/s)")
+    except BaseException:
+        # Roll back the deletes and any chunks added so far; the next sync starts over
+        if writer is not None:
+            writer.close()
+        raise
 
-# 4. Build FAISS vector store
-vectorstore = FAISS.from_documents(chunks, embeddings)
+    if writer is None:
+        print(" No chunks produced; vector store left unchanged")
+        return 0
+
+    writer.save()
+    writer.close()
+    for path, ids in vector_ids.items():
+        manifest.record(path, manifest.fingerprints[path], ids)
+    manifest.save()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n Indexed {total_chunks} chunks from {len(to_index)} files in {elapsed:.1f}s")
+    return total_chunks
+
+
+def watch(embeddings, interval=5.0, **sync_kwargs):
+    """
+    Poll DATA_PATHS and apply updates as files change (Ctrl+C to stop).
+    A failed poll (e.g. an embeddings API error) is reported and retried on the next one.
+    """
+    print(f"\n Watching {', '.join(DATA_PATHS)} every {interval:.0f}s (Ctrl+C to stop)")
+    store_path = sync_kwargs.get("store_path", VECTOR_STORE_PATH)
+    first = True
+    try:
+        while True:
+            try:
+                if first:
+                    sync(embeddings, **sync_kwargs)
+                    first = False
+                else:
+                    manifest = Manifest(store_path)
+                    added, modified, removed = manifest.diff(discover_files(DATA_PATHS))
+                    if added or modified or removed:
+                        sync(embeddings, **sync_kwargs)
+                    elif manifest.refreshed:
+                        # Touched but unchanged files: keep their new mtime so they are not hashed every poll
+                        manifest.save()
+            except Exception as e:
+                print(f" :warning: Update failed ({type(e).__name__}: {e}); retrying in {interval:.0f}s")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n Stopped watching")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the personal knowledge base FAISS store")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=128, help="chunks per embedding request")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("FAISS_NUM_SHARDS", "1")),
+                        help="shard count for full builds")
+    add_index_arguments(parser)
+    parser.add_argument("--rebuild", action="store_true", help="ignore the manifest and rebuild from scratch")
+    parser.add_argument("--watch", action="store_true", help="keep running and apply updates as files change")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between --watch polls")
+    parser.add_argument("--chunker", choices=["recursive", "semantic"], default="recursive",
+                        help="chunking strategy (use with --rebuild when switching)")
+    parser.add_argument("--min-chunk-chars", type=int, default=200, help="semantic chunks: minimum size")
+    parser.add_argument("--max-chunk-chars", type=int, default=2000, help="semantic chunks: maximum size")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in .env file")
+
+    print(" API key loaded")
+
+    # 1. Embeddings
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(openai_api_key=api_key))
+
+    # 2. Parse, split, embed and index changed files as a stream
+    sync_kwargs = dict(
+        store_path=VECTOR_STORE_PATH,
+        num_shards=args.shards,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        index_type=args.index,
+        index_params=index_args(args),
+        chunker=StreamingSemanticChunker(
+            embeddings,
+            min_chunk_chars=args.min_chunk_chars,
+            max_chunk_chars=args.max_chunk_chars
+        ) if args.chunker == "semantic" else None
+    )
+    if args.watch:
+        watch(embeddings, interval=args.interval, **sync_kwargs)
+        return
+
+    sync(embeddings, rebuild=args.rebuild, **sync_kwargs)
+
+    print(f"\n FAISS vector store saved at '{VECTOR_STORE_PATH}'")
+    print("You can now run query.py to test your RAG system!")
 
-# 5. Save the vector store locally
-VECTOR_STORE_PATH = "vectorstore_faiss"
-vectorstore.save_local(VECTOR_STORE_PATH)
 
-print(f"\n FAISS vector store saved at '{VECTOR_STORE_PATH}'")
-print("You can now run query.py to test your RAG system!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+File manifest for incremental re-indexing of the personal knowledge base
+
+Stored as manifest.json inside the vector store directory:
+    {"files": {path: {"mtime", "size", "sha256", "vector_ids"}}}
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str) -> Optional[dict]:
+    """
+    mtime, size and content hash of a file, or None if it no longer exists
+    """
+    try:
+        stat = os.stat(path)
+        sha256 = file_sha256(path)
+    except FileNotFoundError:
+        return None
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256}
+
+
+class Manifest:
+    """
+    Path, mtime, size and content hash per file, plus the vector IDs it produced
+    """
+
+    def __init__(self, store_path: str):
+        self.path = os.path.join(store_path, MANIFEST_FILE)
+        self.files: Dict[str, dict] = {}
+        # Taken by diff()/snapshot() before indexing, passed back to record()
+        self.fingerprints: Dict[str, dict] = {}
+        self.refreshed = False
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.files = json.load(f)["files"]
+
+    def diff(self, paths: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Split `paths` into (added, modified) and list removed manifest entries.
+        mtime/size are checked first; the content hash only when they differ,
+        so touched-but-unchanged files are not re-embedded (their new mtime is
+        kept and `refreshed` set, so the caller can save it). Files that vanish
+        while being checked count as removed. Added and modified files are
+        fingerprinted here, before they are parsed, into `fingerprints`.
+        """
+        self.fingerprints = {}
+        self.refreshed = False
+        added, modified, present = [], [], set()
+        for path in paths:
+            entry = self.files.get(path)
+            if entry is None:
+                if self._fingerprint(path):
+                    added.append(path)
+                    present.add(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            present.add(path)
+            if stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]:
+                continue
+            fingerprint = file_fingerprint(path)
+            if fingerprint is None:
+                present.discard(path)
+            elif fingerprint["sha256"] != entry["sha256"]:
+                self.fingerprints[path] = fingerprint
+                modified.append(path)
+            else:
+                entry["mtime"], entry["size"] = fingerprint["mtime"], fingerprint["size"]
+                self.refreshed = True
+
+        removed = [path for path in self.files if path not in present]
+        return added, modified, removed
+
+    def snapshot(self, paths: List[str]) -> List[str]:
+        """
+        Fingerprint `paths` before a full build; returns the ones that still exist
+        """
+        self.fingerprints = {}
+        return [path for path in paths if self._fingerprint(path)]
+
+    def _fingerprint(self, path: str) -> bool:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is not None:
+            self.fingerprints[path] = fingerprint
+        return fingerprint is not None
+
+    def record(self, path: str, fingerprint: dict, vector_ids: List[int]):
+        """
+        Store the vector IDs of a file under the fingerprint taken before it was parsed,
+        so an edit made while it was being indexed is picked up by the next diff
+        """
+        self.files[path] = {**fingerprint, "vector_ids": list(vector_ids)}
+
+    def forget(self, path: str) -> List[int]:
+        """
+        Drop a file from the manifest; returns the vector IDs it owned
+        """
+        entry = self.files.pop(path, None)
+        return entry["vector_ids"] if entry else []
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"files": self.files}, f, indent=2)
+        os.replace(tmp, self.path)
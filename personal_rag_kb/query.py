@@ -1,53 +1,75 @@
 
 import os
+import sys
+from functools import lru_cache
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+# Shared modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_cache import CachedEmbeddings
+from faiss_store import ShardedFAISS
 
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in .env file")
+VECTOR_STORE_PATH = "vectorstore_faiss"
 
-print("API key loaded")
 
-# Load FAISS Vector Store 
-VECTOR_STORE_PATH = "vectorstore_faiss"
-embeddings = OpenAIEmbeddings(openai_api_key=api_key)
-vectorstore = FAISS.load_local(VECTOR_STORE_PATH, embeddings)
+# Nothing is loaded at import time; the store and chain are built on first use
+@lru_cache(maxsize=None)
+def load_api_key():
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in .env file")
+
+    print("API key loaded")
+    return api_key
+
+
+@lru_cache(maxsize=None)
+def get_vectorstore():
+    """
+    FAISS vector store (shards are memory-mapped, chunks are read on demand)
+    """
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(openai_api_key=load_api_key()))
+    vectorstore = ShardedFAISS(VECTOR_STORE_PATH, embeddings)
+    print(f"\n✅ FAISS vector store loaded from '{VECTOR_STORE_PATH}'")
+    return vectorstore
 
-print(f"\n✅ FAISS vector store loaded from '{VECTOR_STORE_PATH}'")
 
 # Simple Query 
 def simple_query(query_text, k=3):
-    results = vectorstore.similarity_search(query_text, k=k)
+    # Keyword + vector search; exact names ("ZeroDivisionError") skip the embedding call
+    results = get_vectorstore().as_hybrid_retriever(k=k).invoke(query_text)
     for i, doc in enumerate(results):
         print(f"\nResult {i+1}:\n{doc.page_content}\n")
     return results
 
-# Conversational RAG 
 
-llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, openai_api_key=api_key)
+# Conversational RAG 
+@lru_cache(maxsize=None)
+def get_conv_chain():
+    """
+    Conversational retrieval chain with its own buffer memory
+    """
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, openai_api_key=load_api_key())
 
-#conversational memory
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    #conversational memory
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
-# Conversational retrieval chain
-conv_chain = ConversationalRetrievalChain.from_llm(
-    llm=llm,
-    retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-    memory=memory,
-    return_source_documents=True
-)
+    return ConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=get_vectorstore().as_hybrid_retriever(k=3),
+        memory=memory,
+        return_source_documents=True
+    )
 
 def chat_query(query_text):
-    response = conv_chain({"question": query_text})
+    response = get_conv_chain()({"question": query_text})
     answer = response["answer"]
     sources = response.get("source_documents", [])
     
@@ -0,0 +1,226 @@
+"""
+Compact (quantized) vector indexes with full-precision re-scoring
+
+Embeddings are stored in RAM as int8 scalar-quantized codes (4x smaller than
+float32) or as sign bits (32x smaller), optionally after Matryoshka
+truncation to their first `dims` dimensions (text-embedding-3 vectors keep
+most of their quality when truncated and renormalized). A search runs on the
+compact codes for `k * rescore` candidates, then re-scores only those with
+the full-precision vectors, which stay on disk in a memory-mapped .npy file.
+
+CompactIndex is a sidecar for stores that cannot hold quantized vectors
+themselves (Chroma); build it from the collection with from_chroma and pass
+it to RetrievalService as `compact_index` (load_compact_index keeps a saved
+copy next to the Chroma files). The FAISS store uses the same helpers for
+its "sq8" and "binary" index types.
+"""
+
+import json
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from mmr import normalize_rows
+
+QUANTIZATION_KINDS = ("int8", "binary")
+
+META_FILE = "compact.json"
+CODES_FILE = "codes.faiss"
+FULL_FILE = "full.npy"
+
+
+def truncate(vectors, dims: Optional[int] = None) -> np.ndarray:
+    """
+    Matryoshka truncation: the first `dims` dimensions, renormalized to unit length
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    return normalize_rows(matrix[:, :dims] if dims else matrix)
+
+
+def binary_codes(matrix: np.ndarray) -> np.ndarray:
+    """
+    One bit per dimension (positive or not), packed 8 per byte
+    """
+    return np.packbits(matrix > 0, axis=1)
+
+
+def compact_dims(dim: int, kind: str, dims: Optional[int] = None) -> int:
+    """
+    Dimension of the compact codes; binary codes need a multiple of 8
+    """
+    dims = min(dims or dim, dim)
+    if kind == "binary" and dims % 8:
+        raise ValueError(f"Binary quantization needs a multiple of 8 dimensions, got {dims}")
+    return dims
+
+
+class CompactIndex:
+    """
+    Quantized first-pass index plus memory-mapped full-precision vectors.
+    Scores are cosine similarities (higher is better).
+    """
+
+    def __init__(self, ids: List[Any], codes, full: np.ndarray, kind: str = "int8",
+                 dims: Optional[int] = None, rescore: int = 4):
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unknown quantization {kind!r}; expected one of {', '.join(QUANTIZATION_KINDS)}")
+        self.ids = ids
+        self.codes = codes
+        self.full = full
+        self.kind = kind
+        self.dims = dims
+        self.rescore = rescore
+
+    @classmethod
+    def build(cls, ids: Sequence[Any], vectors, kind: str = "int8", dims: Optional[int] = None,
+              rescore: int = 4) -> "CompactIndex":
+        """
+        Quantize `vectors` (rows in the order of `ids`)
+        """
+        full = normalize_rows(vectors)
+        dims = compact_dims(full.shape[1], kind, dims)
+        compact = truncate(full, dims)
+        if kind == "binary":
+            codes = faiss.IndexBinaryFlat(dims)
+            codes.add(binary_codes(compact))
+        else:
+            codes = faiss.IndexScalarQuantizer(dims, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            codes.train(compact)
+            codes.add(compact)
+        return cls(list(ids), codes, full, kind=kind, dims=dims, rescore=rescore)
+
+    @classmethod
+    def from_chroma(cls, vectorstore, kind: str = "int8", dims: Optional[int] = None, rescore: int = 4,
+                    batch_size: int = 5_000) -> "CompactIndex":
+        """
+        Compact index over every embedding of a Chroma collection
+        """
+        collection = vectorstore._collection
+        ids, rows = [], []
+        for offset in range(0, collection.count(), batch_size):
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            ids.extend(batch["ids"])
+            rows.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        if not ids:
+            raise ValueError("Cannot build a compact index over an empty collection")
+        return cls.build(ids, np.concatenate(rows), kind=kind, dims=dims, rescore=rescore)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------
+    # Search
+    # ------------------------------------------
+
+    def candidates(self, vector, k: int) -> np.ndarray:
+        """
+        Row positions of the best `k` matches on the compact codes
+        """
+        query = truncate(vector, self.dims)
+        k = min(k, len(self.ids))
+        if self.kind == "binary":
+            _, rows = self.codes.search(binary_codes(query), k)
+        else:
+            _, rows = self.codes.search(query, k)
+        return rows[0][rows[0] >= 0]
+
+    def search_rows(self, vector, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (row positions, cosine similarities) of the top k after re-scoring
+        `k * rescore` compact candidates at full precision
+        """
+        rows = self.candidates(vector, k * max(self.rescore, 1))
+        # Sorted reads are sequential on the memory-mapped file
+        rows = np.sort(rows)
+        scores = self.full[rows] @ normalize_rows(vector)[0]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def search(self, vector, k: int = 4) -> List[Tuple[Any, float]]:
+        """
+        (ID, cosine similarity) of the k best matches
+        """
+        rows, scores = self.search_rows(vector, k)
+        return [(self.ids[row], float(score)) for row, score in zip(rows, scores)]
+
+    def search_with_vectors(self, vector, k: int) -> Tuple[List[Any], np.ndarray]:
+        """
+        IDs of the k best matches and their full-precision vectors (for MMR)
+        """
+        rows, _ = self.search_rows(vector, k)
+        return [self.ids[row] for row in rows], np.asarray(self.full[rows])
+
+    # ------------------------------------------
+    # Persistence and memory
+    # ------------------------------------------
+
+    def save(self, path: str):
+        """
+        Write the codes, the full-precision vectors and the metadata to a directory
+        """
+        os.makedirs(path, exist_ok=True)
+        target = os.path.join(path, CODES_FILE)
+        if self.kind == "binary":
+            faiss.write_index_binary(self.codes, target + ".tmp")
+        else:
+            faiss.write_index(self.codes, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        np.save(os.path.join(path, FULL_FILE), np.ascontiguousarray(self.full))
+        meta = {"kind": self.kind, "dims": self.dims, "rescore": self.rescore, "ids": self.ids}
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactIndex":
+        """
+        Load a saved index; with mmap the full-precision vectors stay on disk
+        """
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        target = os.path.join(path, CODES_FILE)
+        codes = faiss.read_index_binary(target) if meta["kind"] == "binary" else faiss.read_index(target)
+        full = np.load(os.path.join(path, FULL_FILE), mmap_mode="r" if mmap else None)
+        return cls(meta["ids"], codes, full, kind=meta["kind"], dims=meta["dims"], rescore=meta["rescore"])
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes of the compact codes (resident); the full vectors are memory-mapped
+        """
+        return int(self.codes.code_size) * int(self.codes.ntotal)
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "dims": self.dims,
+            "rescore": self.rescore,
+            "vectors": len(self.ids),
+            "compact_bytes": self.memory_bytes(),
+            "full_bytes": int(self.full.nbytes)
+        }
+
+
+def load_compact_index(vectorstore, path: str, kind: str = "int8", dims: Optional[int] = None,
+                       rescore: int = 4) -> CompactIndex:
+    """
+    Load the compact index saved at `path`, rebuilding it when the collection
+    or the settings changed since it was saved
+    """
+    if CompactIndex.exists(path):
+        index = CompactIndex.load(path)
+        dim = index.full.shape[1]
+        # Same count is not enough: a delete plus an add keeps it but changes the rows
+        if (index.kind == kind and index.dims == compact_dims(dim, kind, dims)
+                and set(index.ids) == set(vectorstore._collection.get(include=[])["ids"])):
+            index.rescore = rescore
+            return index
+    CompactIndex.from_chroma(vectorstore, kind=kind, dims=dims, rescore=rescore).save(path)
+    # Reloaded so the full-precision vectors are memory-mapped rather than held in RAM
+    return CompactIndex.load(path)
@@ -0,0 +1,301 @@
+"""
+Batched, cached cross-encoder reranking
+
+RerankService puts a cross-encoder behind a micro-batching queue: pairs
+from concurrent requests that arrive within `batch_window` seconds are scored
+in one model call. Scores are cached per (query hash, chunk ID), so repeated
+questions and overlapping candidate sets are not scored twice, and reranking
+is skipped altogether when the first-stage scores already separate the top_n
+candidates from the rest by `decisive_margin`.
+
+The model is anything with CrossEncoder.predict(pairs) - see
+llm_backends.make_cross_encoder for the torch / quantized ONNX options.
+"""
+
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun, Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.retrievers import BaseRetriever
+
+from embedding_cache import normalize_text
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(doc: Document) -> str:
+    """
+    Store ID of a chunk, or a hash of its content when it has none
+    """
+    if doc.id is not None:
+        return str(doc.id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+class RerankService:
+    """
+    Long-lived reranker shared by every retriever in the process.
+
+    `rerank(query, docs, scores)` returns the top_n documents by
+    cross-encoder score. `scores` are the optional first-stage relevance
+    scores of `docs` (higher is better, docs in that order) used for the
+    decisive-margin skip.
+    """
+
+    def __init__(
+        self,
+        model,
+        top_n: int = 5,
+        batch_window: float = 0.005,
+        max_batch_pairs: int = 64,
+        cache_size: int = 20_000,
+        decisive_margin: Optional[float] = None,
+        max_chars: int = 2_000
+    ):
+        self.model = model
+        self.top_n = top_n
+        self.batch_window = batch_window
+        self.max_batch_pairs = max_batch_pairs
+        self.cache_size = cache_size
+        self.decisive_margin = decisive_margin
+        self.max_chars = max_chars
+
+        self.requests = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.pairs_scored = 0
+        self.batches = 0
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[List[Tuple[str, str]], Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------
+    # Public API
+    # ------------------------------------------
+
+    def rerank(self, query: str, docs: Sequence[Document], scores: Optional[Sequence[float]] = None,
+               top_n: Optional[int] = None) -> List[Document]:
+        """
+        Top documents for `query`, best first
+        """
+        top_n = self.top_n if top_n is None else top_n
+        if self._skip(scores, top_n):
+            return list(docs[:top_n])
+        return self._select(docs, self.score(query, docs), top_n)
+
+    async def arerank(self, query: str, docs: Sequence[Document], scores: Optional[Sequence[float]] = None,
+                      top_n: Optional[int] = None) -> List[Document]:
+        """
+        Async rerank: awaits the shared batch instead of blocking the event loop
+        """
+        top_n = self.top_n if top_n is None else top_n
+        if self._skip(scores, top_n):
+            return list(docs[:top_n])
+        return self._select(docs, await self.ascore(query, docs), top_n)
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        """
+        Cross-encoder score of every document (cached pairs are not rescored)
+        """
+        future = self._submit(query, docs)
+        return future.result() if isinstance(future, Future) else future
+
+    async def ascore(self, query: str, docs: Sequence[Document]) -> List[float]:
+        future = self._submit(query, docs)
+        return await asyncio.wrap_future(future) if isinstance(future, Future) else future
+
+    def is_decisive(self, scores: Optional[Sequence[float]], top_n: int) -> bool:
+        """
+        True when the first-stage scores already settle the top_n: there
+        are no more candidates than top_n, or the gap between the last kept
+        and the first dropped candidate is at least `decisive_margin`
+        """
+        if scores is None or self.decisive_margin is None:
+            return False
+        ranked = sorted(scores, reverse=True)
+        return len(ranked) <= top_n or ranked[top_n - 1] - ranked[top_n] >= self.decisive_margin
+
+    def as_compressor(self, top_n: Optional[int] = None) -> "RerankCompressor":
+        """
+        Drop-in replacement for CrossEncoderReranker in ContextualCompressionRetriever
+        """
+        return RerankCompressor(service=self, top_n=self.top_n if top_n is None else top_n)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "skipped": self.skipped,
+                "cache_hits": self.cache_hits,
+                "pairs_scored": self.pairs_scored,
+                "batches": self.batches,
+                "pairs_per_batch": self.pairs_scored / self.batches if self.batches else 0.0,
+                "cached_pairs": len(self._cache)
+            }
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ------------------------------------------
+    # Cache and micro-batching
+    # ------------------------------------------
+
+    def _skip(self, scores: Optional[Sequence[float]], top_n: int) -> bool:
+        # Nothing to keep needs no scoring
+        decisive = top_n <= 0 or self.is_decisive(scores, top_n)
+        with self._lock:
+            self.requests += 1
+            self.skipped += decisive
+        return decisive
+
+    @staticmethod
+    def _select(docs: Sequence[Document], scores: List[float], top_n: int) -> List[Document]:
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:top_n]]
+
+    def _submit(self, query: str, docs: Sequence[Document]):
+        """
+        Cached scores, or a Future resolving to all scores once the missing
+        pairs have been scored by the batch worker
+        """
+        qhash = query_hash(query)
+        keys = [(qhash, chunk_id(doc)) for doc in docs]
+        with self._lock:
+            cached = {}
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    cached[key] = self._cache[key]
+            self.cache_hits += len(cached)
+
+        missing = {}
+        for key, doc in zip(keys, docs):
+            if key not in cached and key not in missing:
+                missing[key] = (query, doc.page_content[:self.max_chars])
+        if not missing:
+            return [cached[key] for key in keys]
+
+        batch_future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((list(missing.values()), batch_future))
+
+        result: Future = Future()
+
+        def finish(done: Future):
+            if done.exception() is not None:
+                result.set_exception(done.exception())
+                return
+            fresh = dict(zip(missing, done.result()))
+            self._store(fresh)
+            cached.update(fresh)
+            result.set_result([cached[key] for key in keys])
+
+        batch_future.add_done_callback(finish)
+        return result
+
+    def _store(self, scores: Dict[Tuple[str, str], float]):
+        with self._lock:
+            self._cache.update(scores)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        carry = None
+        while True:
+            batch = [carry or self._queue.get()]
+            carry = None
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.batch_window
+            # Gather whatever else arrives within the window, up to max_batch_pairs;
+            # a request that would overflow the batch opens the next one
+            while size < self.max_batch_pairs:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if size + len(request[0]) > self.max_batch_pairs:
+                    carry = request
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            pairs = [pair for request_pairs, _ in batch for pair in request_pairs]
+            # A single request larger than max_batch_pairs is scored in several calls
+            step = self.max_batch_pairs
+            calls = [pairs[start:start + step] for start in range(0, len(pairs), step)]
+            try:
+                scores = [float(s) for call in calls for s in self.model.predict(call, batch_size=len(call))]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += len(calls)
+                self.pairs_scored += len(pairs)
+            start = 0
+            for request_pairs, future in batch:
+                future.set_result(scores[start:start + len(request_pairs)])
+                start += len(request_pairs)
+
+
+class RerankCompressor(BaseDocumentCompressor):
+    """
+    BaseDocumentCompressor backed by a shared RerankService
+    """
+
+    service: Any
+    top_n: int = 5
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Callbacks = None) -> Sequence[Document]:
+        return self.service.rerank(query, documents, top_n=self.top_n)
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str,
+                                  callbacks: Callbacks = None) -> Sequence[Document]:
+        return await self.service.arerank(query, documents, top_n=self.top_n)
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Retrieve `fetch_k` candidates with their relevance scores, then rerank
+    to the service's top_n (skipped when the scores are decisive)
+    """
+
+    vectorstore: Any
+    service: Any
+    fetch_k: int = 10
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.fetch_k)
+        return self.service.rerank(query, [doc for doc, _ in hits], [score for _, score in hits])
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = await self.vectorstore.asimilarity_search_with_relevance_scores(query, k=self.fetch_k)
+        return await self.service.arerank(query, [doc for doc, _ in hits], [score for _, score in hits])
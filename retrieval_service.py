@@ -0,0 +1,316 @@
+"""
+Long-lived retrieval service shared by the agents' retrieval tools
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import VectorStore
+from langgraph.graph import MessagesState
+from langgraph.prebuilt import ToolNode
+from pydantic import ValidationError
+
+from graph_telemetry import emit_event
+from hybrid_search import BM25Index, fetch_documents, reciprocal_rank_fusion, submit_search
+from mmr import MMRReranker
+from quantization import CompactIndex
+
+
+class RetrievalService:
+    """
+    Holds a configured retriever for the lifetime of the process.
+    `retrieve_many` embeds a batch of queries in one request and runs
+    their searches in a single collection query. MMR re-ranking uses the
+    NumPy MMRReranker instead of the store's generic implementation.
+
+    With a `keyword_index` (a BM25Index over the same chunk IDs) retrieval
+    is hybrid: BM25 runs while the queries are embedded and searched, and
+    the two rankings are fused with RRF. Exact identifier lookups are
+    answered from the keyword index alone and are never embedded.
+
+    With a `compact_index` (a quantization.CompactIndex over the same chunk
+    IDs) the dense search runs on its int8 or binary codes and re-scores the
+    candidates at full precision; the store is only asked for the chunks.
+    """
+
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        search_type: str = "mmr",
+        k: int = 3,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        keyword_index: Optional[BM25Index] = None,
+        rrf_k: int = 60,
+        compact_index: Optional[CompactIndex] = None
+    ):
+        self.vectorstore = vectorstore
+        self.embeddings = vectorstore.embeddings
+        self.search_type = search_type
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.keyword_index = keyword_index
+        self.rrf_k = rrf_k
+        self.compact_index = compact_index
+        self.reranker = MMRReranker(k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+
+        search_kwargs = {"k": k}
+        if search_type == "mmr":
+            search_kwargs.update(fetch_k=fetch_k, lambda_mult=lambda_mult)
+        self.retriever = vectorstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+
+    def retrieve(self, query: str) -> List[Document]:
+        """
+        Retrieve documents for a single query
+        """
+        if self.keyword_index is not None:
+            return self.retrieve_many([query])[0]
+        if self.search_type == "mmr" or self.compact_index is not None:
+            return self.search_by_vectors([self.embeddings.embed_query(query)])[0]
+        return self.retriever.invoke(query)
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieve documents for several queries with one embedding request
+        """
+        if not queries:
+            return []
+        if self.keyword_index is None:
+            vectors = self.embeddings.embed_documents(list(queries))
+            return self.search_by_vectors(vectors)
+
+        dense_queries = [q for q in queries if not self.keyword_index.is_exact_lookup(q)]
+        # Dense search runs on SEARCH_POOL (with the caller's context) while BM25 scores here
+        dense = submit_search(self._dense_many, dense_queries) if dense_queries else None
+        lexical = [self._lexical(q) for q in queries]
+        return self._combine(queries, lexical, dense.result() if dense else [])
+
+    async def aretrieve(self, query: str) -> List[Document]:
+        """
+        Async retrieve: the embedding call is awaited, the search runs in a thread
+        """
+        if self.keyword_index is not None:
+            return (await self.aretrieve_many([query]))[0]
+        if self.search_type == "mmr" or self.compact_index is not None:
+            vector = await self.embeddings.aembed_query(query)
+            return (await asyncio.to_thread(self.search_by_vectors, [vector]))[0]
+        return await self.retriever.ainvoke(query)
+
+    async def aretrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Async retrieve_many: one awaited embedding request, one threaded search
+        """
+        if not queries:
+            return []
+        if self.keyword_index is None:
+            vectors = await self.embeddings.aembed_documents(list(queries))
+            return await asyncio.to_thread(self.search_by_vectors, vectors)
+
+        dense_queries = [q for q in queries if not self.keyword_index.is_exact_lookup(q)]
+
+        async def dense_many() -> List[List[Document]]:
+            if not dense_queries:
+                return []
+            vectors = await self.embeddings.aembed_documents(dense_queries)
+            return await asyncio.to_thread(self.search_by_vectors, vectors)
+
+        lexical, dense = await asyncio.gather(
+            asyncio.to_thread(lambda: [self._lexical(q) for q in queries]),
+            dense_many()
+        )
+        return self._combine(queries, lexical, dense)
+
+    def _dense_many(self, queries: List[str]) -> List[List[Document]]:
+        return self.search_by_vectors(self.embeddings.embed_documents(queries))
+
+    def _lexical(self, query: str) -> List[Document]:
+        hits = self.keyword_index.search(query, self.fetch_k)
+        return fetch_documents(self.vectorstore, [doc_id for doc_id, _ in hits])
+
+    def _combine(self, queries: List[str], lexical: List[List[Document]],
+                 dense: List[List[Document]]) -> List[List[Document]]:
+        """
+        Keyword-only results for exact lookups, RRF of both rankings otherwise
+        """
+        dense_results = iter(dense)
+        combined = []
+        for query, lexical_docs in zip(queries, lexical):
+            if self.keyword_index.is_exact_lookup(query):
+                combined.append(lexical_docs[:self.k])
+                emit_event("retrieval", {"queries": 1, "hits": len(combined[-1])})
+            else:
+                combined.append(reciprocal_rank_fusion([lexical_docs, next(dense_results)],
+                                                       k=self.rrf_k, limit=self.k))
+        return combined
+
+    def search_by_vectors(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """
+        Run the configured search for pre-computed query vectors
+        """
+        if self.compact_index is not None:
+            return self._search_compact(vectors)
+        collection = getattr(self.vectorstore, "_collection", None)
+        if collection is None:
+            if len(vectors) == 1:
+                batched = [self._search_one(vectors[0])]
+            else:
+                # No batched query API: run the searches concurrently
+                futures = [submit_search(self._search_one, vector) for vector in vectors]
+                batched = [future.result() for future in futures]
+            emit_event("retrieval", {"queries": len(vectors), "hits": sum(map(len, batched))})
+            return batched
+
+        use_mmr = self.search_type == "mmr"
+        include = ["documents", "metadatas"] + (["embeddings"] if use_mmr else [])
+        results = collection.query(
+            query_embeddings=vectors,
+            n_results=self.fetch_k if use_mmr else self.k,
+            include=include
+        )
+
+        batched = []
+        for i, vector in enumerate(vectors):
+            candidates = [
+                Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(
+                    results["ids"][i], results["documents"][i], results["metadatas"][i]
+                )
+            ]
+            if use_mmr and candidates:
+                selected = self.reranker.select(vector, results["embeddings"][i])
+                candidates = [candidates[j] for j in selected]
+            batched.append(candidates[:self.k])
+        emit_event("retrieval", {"queries": len(vectors), "hits": sum(map(len, batched))})
+        return batched
+
+    def _search_compact(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """
+        Search the compact index, then fetch every query's chunks in one store lookup
+        """
+        rankings = []
+        for vector in vectors:
+            if self.search_type == "mmr":
+                ids, candidates = self.compact_index.search_with_vectors(vector, self.fetch_k)
+                rankings.append([ids[j] for j in self.reranker.select(vector, candidates, normalized=True)])
+            else:
+                rankings.append([doc_id for doc_id, _ in self.compact_index.search(vector, self.k)])
+
+        by_id = {doc.id: doc for doc in fetch_documents(self.vectorstore, list({i for r in rankings for i in r}))}
+        batched = [[by_id[str(doc_id)] for doc_id in ranking if str(doc_id) in by_id][:self.k]
+                   for ranking in rankings]
+        emit_event("retrieval", {"queries": len(vectors), "hits": sum(map(len, batched))})
+        return batched
+
+    def _search_one(self, vector: List[float]) -> List[Document]:
+        if self.search_type == "mmr":
+            return self.vectorstore.max_marginal_relevance_search_by_vector(
+                vector, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+            )
+        return self.vectorstore.similarity_search_by_vector(vector, k=self.k)
+
+
+def batched_tool_node(
+    tool_node: ToolNode,
+    batch_handlers: Dict[str, Callable[[List[dict]], List[str]]],
+    abatch_handlers: Optional[Dict[str, Callable[[List[dict]], Awaitable[List[str]]]]] = None
+) -> RunnableLambda:
+    """
+    Wrap a ToolNode so that tool calls with a batch handler are answered
+    together (one handler call per tool name) instead of one by one.
+    `batch_handlers` maps a tool name to a function taking the list of
+    call args and returning one result string per call; `abatch_handlers`
+    are their async counterparts, used when the graph runs with ainvoke.
+    The async path runs every batch and the remaining tool calls concurrently.
+
+    Calls whose args fail the tool's schema, and every call of a batch whose
+    handler raises, are passed on to the ToolNode, which runs them one by
+    one and answers failures with error ToolMessages (per handle_tool_errors).
+    """
+    abatch_handlers = abatch_handlers or {}
+
+    def valid(call: dict) -> bool:
+        schema = getattr(tool_node.tools_by_name.get(call["name"]), "args_schema", None)
+        if not hasattr(schema, "model_validate"):
+            return True
+        try:
+            schema.model_validate(call["args"])
+        except ValidationError:
+            return False
+        return True
+
+    def group(tool_calls: List[dict]) -> Dict[str, List[dict]]:
+        grouped = {}
+        for call in tool_calls:
+            if call["name"] in batch_handlers and valid(call):
+                grouped.setdefault(call["name"], []).append(call)
+        # A single call gains nothing from batching
+        return grouped if any(len(calls) > 1 for calls in grouped.values()) else {}
+
+    def to_messages(name: str, calls: List[dict], outputs: List[str]) -> List[ToolMessage]:
+        return [
+            ToolMessage(content=output, name=name, tool_call_id=call["id"])
+            for call, output in zip(calls, outputs)
+        ]
+
+    def remaining_input(tool_calls: List[dict], handled: set) -> Optional[dict]:
+        remaining = [call for call in tool_calls if call["id"] not in handled]
+        return {"messages": [AIMessage(content="", tool_calls=remaining)]} if remaining else None
+
+    def ordered(tool_calls: List[dict], messages: List[ToolMessage]) -> dict:
+        by_id = {message.tool_call_id: message for message in messages}
+        return {"messages": [by_id[call["id"]] for call in tool_calls]}
+
+    def run_tools(state: MessagesState) -> dict:
+        tool_calls = state["messages"][-1].tool_calls
+        grouped = group(tool_calls)
+        if not grouped:
+            return tool_node.invoke(state)
+
+        messages = []
+        for name, calls in grouped.items():
+            try:
+                outputs = batch_handlers[name]([call["args"] for call in calls])
+            except Exception:
+                # Left to the ToolNode, which handles each call's error
+                continue
+            messages += to_messages(name, calls, outputs)
+
+        delegated = remaining_input(tool_calls, {message.tool_call_id for message in messages})
+        if delegated:
+            messages += tool_node.invoke(delegated)["messages"]
+        return ordered(tool_calls, messages)
+
+    async def arun_tools(state: MessagesState) -> dict:
+        tool_calls = state["messages"][-1].tool_calls
+        grouped = group(tool_calls)
+        if not grouped:
+            return await tool_node.ainvoke(state)
+
+        async def run_batch(name: str, calls: List[dict]) -> List[ToolMessage]:
+            args = [call["args"] for call in calls]
+            try:
+                if name in abatch_handlers:
+                    outputs = await abatch_handlers[name](args)
+                else:
+                    outputs = await asyncio.to_thread(batch_handlers[name], args)
+            except Exception:
+                # Left to the ToolNode, which handles each call's error
+                return (await tool_node.ainvoke({"messages": [AIMessage(content="", tool_calls=calls)]}))["messages"]
+            return to_messages(name, calls, outputs)
+
+        async def run_delegated(delegated: dict) -> List[ToolMessage]:
+            return (await tool_node.ainvoke(delegated))["messages"]
+
+        jobs = [run_batch(name, calls) for name, calls in grouped.items()]
+        delegated = remaining_input(tool_calls, {call["id"] for calls in grouped.values() for call in calls})
+        if delegated:
+            jobs.append(run_delegated(delegated))
+
+        messages = [message for batch in await asyncio.gather(*jobs) for message in batch]
+        return ordered(tool_calls, messages)
+
+    return RunnableLambda(run_tools, afunc=arun_tools, name="tools")
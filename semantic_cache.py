@@ -0,0 +1,358 @@
+"""
+Semantic response cache for the chat agents
+
+A graph stage in front of the assistant: the incoming question is embedded and
+compared with past questions. When a stored question is similar enough (and the
+new one does not lean on earlier turns), its answer is returned without calling
+the LLM. Final answers are written back by a second stage after the assistant.
+
+Entries expire after `ttl` seconds, the least recently used ones are evicted
+past `max_entries`, and every entry is tagged with a corpus version so a change
+to the documents or prompt invalidates old answers. Entries persist in SQLite
+and are held in memory as one normalized matrix (one matrix-vector product per
+lookup, which is sub-millisecond at the cache sizes used here).
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import MessagesState
+
+from conversation_memory import is_summary
+from graph_telemetry import emit_event
+from mmr import normalize_rows
+
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "SEMANTIC_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.sqlite3")
+)
+
+# Follow-ups that point back at earlier turns cannot be answered from the cache
+_REFERRING = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|above|previous|earlier|again|more|else|also|same)\b",
+    re.IGNORECASE
+)
+
+
+def fingerprint(*parts: str) -> str:
+    """
+    Corpus version string for a set of documents, prompts or model names
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def is_cache_hit(message: BaseMessage) -> bool:
+    return isinstance(message, AIMessage) and "semantic_cache" in message.response_metadata
+
+
+def bypassed(config: Optional[RunnableConfig]) -> bool:
+    """
+    True when the run asked to skip the response cache (tests, benchmarks)
+    """
+    return bool((config or {}).get("configurable", {}).get("bypass_cache"))
+
+
+def is_standalone(messages: List[BaseMessage]) -> bool:
+    """
+    True when the last question can be answered without the turns before it:
+    it is the first question of the thread (and no summary of earlier turns
+    exists), or it has no referring words
+    """
+    questions = [m for m in messages if isinstance(m, HumanMessage)]
+    if not questions:
+        return False
+    if len(questions) == 1 and not any(is_summary(m) for m in messages):
+        return True
+    return not _REFERRING.search(questions[-1].content)
+
+
+class SemanticCache:
+    """
+    Question/answer cache keyed by embedding similarity.
+    `namespace` separates agents sharing one database file; `context_check`
+    decides whether a thread's last question may be served from the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        namespace: str,
+        corpus_version: str = "",
+        threshold: float = 0.9,
+        ttl: Optional[float] = 24 * 3600,
+        max_entries: int = 2_000,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        context_check: Callable[[List[BaseMessage]], bool] = is_standalone
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.corpus_version = corpus_version
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.context_check = context_check
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_namespace ON responses(namespace, corpus_version)"
+        )
+        # Answers produced against another corpus version are never served again
+        self._conn.execute(
+            "DELETE FROM responses WHERE namespace = ? AND corpus_version != ?",
+            (namespace, corpus_version)
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT id, question, answer, vector, created, last_used FROM responses "
+            "WHERE namespace = ? ORDER BY id",
+            (self.namespace,)
+        ).fetchall()
+        self._ids = [row[0] for row in rows]
+        self._entries = {row[0]: {"question": row[1], "answer": row[2]} for row in rows}
+        self._created = np.array([row[4] for row in rows], dtype=np.float64)
+        self._last_used = np.array([row[5] for row in rows], dtype=np.float64)
+        self._matrix = (
+            np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows]) if rows else None
+        )
+
+    # ------------------------------------------
+    # Lookup and store
+    # ------------------------------------------
+
+    def lookup(self, question: str, vector: Optional[List[float]] = None) -> Optional[str]:
+        """
+        Cached answer for `question`, or None (counts as a miss)
+        """
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+        query = normalize_rows(vector)[0]
+
+        answer = None
+        with self._lock:
+            self._expire()
+            if self._matrix is not None:
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = self._ids[best]
+                    self._last_used[best] = time.time()
+                    self._conn.execute(
+                        "UPDATE responses SET last_used = ? WHERE id = ?",
+                        (self._last_used[best], entry_id)
+                    )
+                    self._conn.commit()
+                    answer = self._entries[entry_id]["answer"]
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        emit_event("semantic_cache", {"hit": answer is not None})
+        return answer
+
+    def store(self, question: str, answer: str, vector: Optional[List[float]] = None):
+        """
+        Remember an answer; a near-identical stored question is overwritten
+        """
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+        query = normalize_rows(vector)[0]
+        now = time.time()
+
+        with self._lock:
+            if self._matrix is not None:
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._remove([best])
+
+            cursor = self._conn.execute(
+                "INSERT INTO responses (namespace, corpus_version, question, answer, vector, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, self.corpus_version, question, answer, query.tobytes(), now, now)
+            )
+            self._ids.append(cursor.lastrowid)
+            self._entries[cursor.lastrowid] = {"question": question, "answer": answer}
+            self._created = np.append(self._created, now)
+            self._last_used = np.append(self._last_used, now)
+            self._matrix = query[np.newaxis, :] if self._matrix is None else np.vstack([self._matrix, query])
+            self.stores += 1
+
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                # Least recently used entries go first
+                self._remove(np.argsort(self._last_used)[:overflow].tolist())
+                self.evictions += overflow
+            self._conn.commit()
+
+    def _expire(self):
+        if self.ttl is None or not self._ids:
+            return
+        expired = np.flatnonzero(self._created < time.time() - self.ttl).tolist()
+        if expired:
+            self._remove(expired)
+            self._conn.commit()
+
+    def _remove(self, positions: List[int]):
+        # Caller holds the lock and commits
+        doomed = [self._ids[p] for p in positions]
+        self._conn.executemany("DELETE FROM responses WHERE id = ?", [(entry_id,) for entry_id in doomed])
+        for entry_id in doomed:
+            del self._entries[entry_id]
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[positions] = False
+        self._ids = [entry_id for entry_id, kept in zip(self._ids, keep) if kept]
+        self._created = self._created[keep]
+        self._last_used = self._last_used[keep]
+        self._matrix = self._matrix[keep] if keep.any() else None
+
+    # ------------------------------------------
+    # Cache management
+    # ------------------------------------------
+
+    def set_corpus_version(self, corpus_version: str):
+        """
+        Invalidate every entry produced against another corpus version
+        """
+        with self._lock:
+            self.corpus_version = corpus_version
+            self._conn.execute(
+                "DELETE FROM responses WHERE namespace = ? AND corpus_version != ?",
+                (self.namespace, corpus_version)
+            )
+            self._conn.commit()
+            self._load()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit/miss counters; context-dependent questions count as skipped, not misses
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._ids)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+            self._load()
+            self.hits = self.misses = self.skipped = self.stores = self.evictions = 0
+
+    # ------------------------------------------
+    # Graph stages
+    # ------------------------------------------
+
+    def _question(self, messages: List[BaseMessage]) -> Optional[str]:
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return None
+        if not self.context_check(messages):
+            with self._lock:
+                self.skipped += 1
+            return None
+        return messages[-1].content
+
+    def _answer(self, question: str, answer: str) -> dict:
+        return {"messages": [AIMessage(
+            content=answer,
+            response_metadata={"semantic_cache": {"hit": True, "question": question}}
+        )]}
+
+    def _final_pair(self, messages: List[BaseMessage]):
+        """
+        (question, answer) of a finished turn that is worth caching, else None
+        """
+        last = messages[-1] if messages else None
+        if not isinstance(last, AIMessage) or last.tool_calls or is_cache_hit(last) or not last.content:
+            return None
+        start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+        if start is None or not self.context_check(messages[:start + 1]):
+            return None
+        return messages[start].content, last.content
+
+    def lookup_node(self, state: MessagesState, config: Optional[RunnableConfig] = None) -> dict:
+        if bypassed(config):
+            return {}
+        question = self._question(state["messages"])
+        answer = self.lookup(question) if question else None
+        return self._answer(question, answer) if answer is not None else {}
+
+    async def alookup_node(self, state: MessagesState, config: Optional[RunnableConfig] = None) -> dict:
+        if bypassed(config):
+            return {}
+        question = self._question(state["messages"])
+        if not question:
+            return {}
+        vector = await self.embeddings.aembed_query(question)
+        # SQLite updates and commits run in a worker thread, off the event loop
+        answer = await asyncio.to_thread(self.lookup, question, vector)
+        return self._answer(question, answer) if answer is not None else {}
+
+    def store_node(self, state: MessagesState, config: Optional[RunnableConfig] = None) -> dict:
+        pair = None if bypassed(config) else self._final_pair(state["messages"])
+        if pair:
+            self.store(*pair)
+        return {}
+
+    async def astore_node(self, state: MessagesState, config: Optional[RunnableConfig] = None) -> dict:
+        pair = None if bypassed(config) else self._final_pair(state["messages"])
+        if pair:
+            vector = await self.embeddings.aembed_query(pair[0])
+            await asyncio.to_thread(self.store, *pair, vector)
+        return {}
+
+    def as_nodes(self):
+        """
+        (lookup, store) graph nodes usable from both invoke and ainvoke.
+        Route to END after lookup when `is_cache_hit(state["messages"][-1])`.
+        A run with `configurable={"bypass_cache": True}` skips both nodes.
+        """
+        return (
+            RunnableLambda(self.lookup_node, afunc=self.alookup_node, name="cache_lookup"),
+            RunnableLambda(self.store_node, afunc=self.astore_node, name="cache_store")
+        )
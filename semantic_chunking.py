@@ -0,0 +1,160 @@
+"""
+Streaming semantic chunking
+
+StreamingSemanticChunker splits documents where the meaning shifts, like
+langchain_experimental's SemanticChunker, but is built for large corpora:
+
+- every document is chunked on its own (no single combined text)
+- documents are consumed as a stream, in windows of `window_sentences`
+  sentences; sentences from all documents in a window are embedded in
+  batched requests through the caller's (cached) embeddings
+- adjacent-sentence cosine distances and the percentile breakpoint
+  threshold are computed with NumPy, one pass per document segment
+- chunks are kept between `min_chunk_chars` and `max_chunk_chars`
+
+A document longer than one window is processed a window at a time; its
+unfinished last chunk is carried into the next window, so window edges do
+not force a split. Memory is bounded by the window, not the corpus.
+"""
+
+from itertools import repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from sentences import EMBED_BATCH, embed_sentences, split_sentences
+
+# (sentences, their embedding rows) of a document's unfinished chunk
+_Carry = Optional[Tuple[List[str], np.ndarray]]
+
+
+class StreamingSemanticChunker:
+    """
+    Semantic chunker over a stream of documents.
+    A breakpoint is placed after every sentence whose distance to the next
+    one is above the `breakpoint_percentile` of the document's distances
+    (of the current window's, for documents longer than one window).
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        breakpoint_percentile: float = 95.0,
+        min_chunk_chars: int = 200,
+        max_chunk_chars: int = 2_000,
+        window_sentences: int = 1_024,
+        batch_size: int = EMBED_BATCH
+    ):
+        if min_chunk_chars > max_chunk_chars:
+            raise ValueError("min_chunk_chars must not exceed max_chunk_chars")
+        self.embeddings = embeddings
+        self.breakpoint_percentile = breakpoint_percentile
+        self.min_chunk_chars = min_chunk_chars
+        self.max_chunk_chars = max_chunk_chars
+        self.window_sentences = window_sentences
+        self.batch_size = batch_size
+
+    # ------------------------------------------
+    # Public API
+    # ------------------------------------------
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Yield the chunks of each document in order; chunks copy the metadata
+        of their source document
+        """
+        window: List[Tuple[Document, List[str], bool]] = []
+        size = 0
+        carry: _Carry = None
+        for doc in documents:
+            sentences = split_sentences(doc.page_content)
+            for start in range(0, len(sentences), self.window_sentences):
+                part = sentences[start:start + self.window_sentences]
+                window.append((doc, part, start + self.window_sentences >= len(sentences)))
+                size += len(part)
+                if size >= self.window_sentences:
+                    carry = yield from self._process(window, carry)
+                    window, size = [], 0
+        if window:
+            yield from self._process(window, carry)
+
+    def split_texts(self, texts: Iterable[str], metadatas: Optional[Iterable[Dict]] = None) -> Iterator[Document]:
+        metadatas = metadatas if metadatas is not None else repeat({})
+        return self.split_documents(
+            Document(page_content=text, metadata=dict(metadata)) for text, metadata in zip(texts, metadatas)
+        )
+
+    # ------------------------------------------
+    # Breakpoints and size limits
+    # ------------------------------------------
+
+    def _process(self, window: List[Tuple[Document, List[str], bool]], carry: _Carry):
+        """
+        Embed one window in batched requests and chunk each document segment;
+        returns the carry for the document that continues in the next window
+        """
+        matrix = embed_sentences(self.embeddings, [s for _, part, _ in window for s in part], self.batch_size)
+        row = 0
+        for doc, part, last in window:
+            vectors = matrix[row:row + len(part)]
+            row += len(part)
+            if carry is not None:
+                part, vectors = carry[0] + part, np.vstack([carry[1], vectors])
+                carry = None
+
+            spans = self._spans(part, vectors)
+            if not last:
+                start, end = spans.pop()
+                carry = (part[start:end], vectors[start:end])
+            for start, end in spans:
+                yield Document(page_content=" ".join(part[start:end]), metadata=dict(doc.metadata))
+        return carry
+
+    def _spans(self, sentences: List[str], vectors: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        (start, end) sentence ranges of the chunks of one document segment
+        """
+        n = len(sentences)
+        if n > 1:
+            # Rows are unit length: cosine distance of each adjacent pair
+            distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+            threshold = np.percentile(distances, self.breakpoint_percentile)
+            cuts = np.flatnonzero(distances > threshold) + 1
+        else:
+            cuts = np.empty(0, dtype=np.int64)
+        ends = np.append(cuts, n)
+        # offsets[i] = characters before sentence i (joined with single spaces)
+        lengths = np.fromiter((len(s) + 1 for s in sentences), dtype=np.int64, count=n)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        spans = []
+        start = 0
+        for end in ends:
+            # Too small: extend to the next breakpoint
+            if offsets[end] - offsets[start] < self.min_chunk_chars and end < n:
+                continue
+            spans.extend(self._split_long(start, int(end), offsets))
+            start = int(end)
+
+        # A short tail joins the previous chunk when the result still fits
+        if len(spans) > 1:
+            (prev_start, _), (tail_start, tail_end) = spans[-2], spans[-1]
+            if (offsets[tail_end] - offsets[tail_start] < self.min_chunk_chars
+                    and offsets[tail_end] - offsets[prev_start] <= self.max_chunk_chars):
+                spans[-2:] = [(prev_start, tail_end)]
+        return spans
+
+    def _split_long(self, start: int, end: int, offsets: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Split [start, end) at sentence boundaries into pieces of at most
+        max_chunk_chars (a single longer sentence stays whole)
+        """
+        spans = []
+        while offsets[end] - offsets[start] > self.max_chunk_chars and end - start > 1:
+            cut = int(np.searchsorted(offsets, offsets[start] + self.max_chunk_chars, side="right")) - 1
+            cut = min(max(cut, start + 1), end - 1)
+            spans.append((start, cut))
+            start = cut
+        spans.append((start, end))
+        return spans
@@ -0,0 +1,53 @@
+"""
+Sentence splitting and batched sentence embeddings
+
+Shared by the extractive compressor and the semantic chunker. Both split
+text with the same function, so sentence embeddings computed at ingest time
+are cache hits (CachedEmbeddings keys on the exact text) when the same
+sentences are scored again at query time.
+"""
+
+import re
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from mmr import normalize_rows
+
+# Sentence ends followed by whitespace, or line breaks
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Texts per embedding request
+EMBED_BATCH = 256
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Non-empty sentences of `text`, with surrounding whitespace stripped
+    """
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def embed_sentences(embeddings, sentences: Sequence[str], batch_size: int = EMBED_BATCH) -> np.ndarray:
+    """
+    L2-normalized float32 matrix with one row per sentence. Sentences from
+    many documents go out together, `batch_size` per embedding request.
+    """
+    if not sentences:
+        return np.zeros((0, 0), dtype=np.float32)
+    rows = []
+    for start in range(0, len(sentences), batch_size):
+        rows.extend(embeddings.embed_documents(list(sentences[start:start + batch_size])))
+    return normalize_rows(rows)
+
+
+def split_documents(texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    Sentences of every text, flattened, and the index of the text each came from
+    """
+    sentences, owners = [], []
+    for position, text in enumerate(texts):
+        parts = split_sentences(text)
+        sentences.extend(parts)
+        owners.extend([position] * len(parts))
+    return sentences, np.asarray(owners, dtype=np.int64)
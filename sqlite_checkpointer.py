@@ -0,0 +1,533 @@
+"""
+Durable, compact LangGraph checkpointer backed by a single SQLite file
+
+Drop-in replacement for MemorySaver that survives restarts and can be shared
+by several worker processes (WAL mode, one connection per process):
+  - channel values are stored once per channel version, not per checkpoint
+  - message lists are stored as references; each message body is written
+    once per thread, so a new turn only adds the messages it produced
+  - payloads above a small size are zlib-compressed
+  - only the newest `keep_last` checkpoints of each thread are retained
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+
+CHECKPOINT_DIR = os.environ.get(
+    "CHECKPOINT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+)
+
+# Payloads smaller than this are not worth compressing
+_COMPRESS_MIN_BYTES = 256
+_COMPRESSED = "z:"
+_MESSAGE_REFS = "msgrefs"
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    channel_versions TEXT NOT NULL,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (thread_id, hash)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def checkpoint_path(name: str) -> str:
+    """
+    Database file for one agent, so thread IDs of different agents never collide
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    return os.path.join(CHECKPOINT_DIR, f"{name}.sqlite3")
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """
+    Checkpointer storing threads in `path`. Processes that open the same file
+    see each other's threads. Set `keep_last=None` to keep every checkpoint
+    (needed only for time travel further back than `keep_last` steps).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        keep_last: Optional[int] = 20,
+        compression_level: int = 6,
+        serde=None
+    ):
+        super().__init__(serde=serde)
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be at least 1 (or None to keep everything)")
+        self.path = path
+        self.keep_last = keep_last
+        self.compression_level = compression_level
+
+        self._lock = threading.Lock()
+        # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------
+    # Encoding
+    # ------------------------------------------
+
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        return self._compress(type_, data)
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.startswith(_COMPRESSED):
+            type_, data = type_[len(_COMPRESSED):], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    def _compress(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if len(data) < _COMPRESS_MIN_BYTES:
+            return type_, data
+        return _COMPRESSED + type_, zlib.compress(data, self.compression_level)
+
+    def _dump_messages(self, thread_id: str, messages: List[BaseMessage]) -> Tuple[str, bytes]:
+        """
+        Store each message body once per thread and return the reference list
+        """
+        rows, refs = [], []
+        for message in messages:
+            type_, data = self.serde.dumps_typed(message)
+            digest = hashlib.sha256(type_.encode() + b"\x00" + data).hexdigest()
+            refs.append(digest)
+            rows.append((thread_id, digest, *self._compress(type_, data)))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO messages (thread_id, hash, type, value) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        return _MESSAGE_REFS, zlib.compress(json.dumps(refs).encode())
+
+    def _load_messages(self, thread_id: str, data: bytes) -> List[BaseMessage]:
+        refs = json.loads(zlib.decompress(data))
+        found = {}
+        unique = list(dict.fromkeys(refs))
+        for start in range(0, len(unique), _SQL_BATCH):
+            batch = unique[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for digest, type_, value in self._conn.execute(
+                f"SELECT hash, type, value FROM messages WHERE thread_id = ? AND hash IN ({placeholders})",
+                [thread_id, *batch]
+            ):
+                found[digest] = self._load(type_, value)
+        return [found[digest] for digest in refs]
+
+    def _dump_channel(self, thread_id: str, value: Any) -> Tuple[str, bytes]:
+        if isinstance(value, list) and value and all(isinstance(m, BaseMessage) for m in value):
+            return self._dump_messages(thread_id, value)
+        return self._dump(value)
+
+    def _load_channel(self, thread_id: str, type_: str, data: bytes) -> Any:
+        if type_ == _MESSAGE_REFS:
+            return self._load_messages(thread_id, data)
+        return self._load(type_, data)
+
+    # ------------------------------------------
+    # Reads
+    # ------------------------------------------
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = self._conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version))
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            values[channel] = self._load_channel(thread_id, *row)
+        return values
+
+    def _to_tuple(self, row) -> CheckpointTuple:
+        (thread_id, checkpoint_ns, checkpoint_id, parent_id,
+         type_, checkpoint_blob, metadata_type, metadata_blob) = row
+        checkpoint = self._load(type_, checkpoint_blob)
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id
+            }},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"])
+            },
+            metadata=self._load(metadata_type, metadata_blob),
+            pending_writes=[(task_id, channel, self._load(t, v)) for task_id, channel, t, v in writes],
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_id
+                }}
+                if parent_id else None
+            )
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = ("thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                   "type, checkpoint, metadata_type, metadata")
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns)
+                ).fetchone()
+            return self._to_tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                f"type, checkpoint, metadata_type, metadata FROM checkpoints {where} "
+                "ORDER BY checkpoint_id DESC",
+                params
+            ).fetchall()
+
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            # Metadata is serialized, so filters are applied after decoding
+            if filter:
+                metadata = self._load(row[6], row[7])
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                item = self._to_tuple(row)
+            yield item
+
+    # ------------------------------------------
+    # Writes
+    # ------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values = stored.pop("channel_values")
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                blob_rows = []
+                for channel, version in new_versions.items():
+                    type_, data = (
+                        self._dump_channel(thread_id, values[channel]) if channel in values else ("empty", None)
+                    )
+                    blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, data))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, value) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    blob_rows
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+                    "parent_checkpoint_id, channel_versions, type, checkpoint, metadata_type, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        json.dumps({k: str(v) for k, v in checkpoint["channel_versions"].items()}),
+                        *self._dump(stored),
+                        *self._dump(get_checkpoint_metadata(config, metadata))
+                    )
+                )
+                if self.keep_last is not None:
+                    self._prune(thread_id, checkpoint_ns, self.keep_last)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"]
+        }}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id,
+                WRITES_IDX_MAP.get(channel, idx), channel, *self._dump(value), task_path
+            ))
+        # Special writes (errors, interrupts) may be replaced; regular ones are written once
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, "
+                    "channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for table in ("checkpoints", "blobs", "messages", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("COMMIT")
+
+    # ------------------------------------------
+    # Retention
+    # ------------------------------------------
+
+    def prune(self, thread_id: str, keep_last: Optional[int] = None):
+        """
+        Drop all but the newest `keep_last` checkpoints of every namespace in a thread
+        """
+        keep_last = keep_last or self.keep_last
+        if keep_last is None:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                namespaces = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                )]
+                for checkpoint_ns in namespaces:
+                    self._prune(thread_id, checkpoint_ns, keep_last)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, keep_last: int):
+        # Runs inside the caller's transaction
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, keep_last)
+        )]
+        if not expired:
+            return
+
+        for start in range(0, len(expired), _SQL_BATCH):
+            batch = expired[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? "
+                    f"AND checkpoint_id IN ({placeholders})",
+                    [thread_id, checkpoint_ns, *batch]
+                )
+
+        # Channel versions no surviving checkpoint points at
+        live = set()
+        for (versions,) in self._conn.execute(
+            "SELECT channel_versions FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns)
+        ):
+            live.update(json.loads(versions).items())
+        stale = [
+            (channel, version)
+            for channel, version in self._conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns)
+            )
+            if (channel, version) not in live
+        ]
+        self._conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, channel, version) for channel, version in stale]
+        )
+
+        # Message bodies no remaining reference list mentions (references span namespaces)
+        referenced = set()
+        for (data,) in self._conn.execute(
+            "SELECT value FROM blobs WHERE thread_id = ? AND type = ?", (thread_id, _MESSAGE_REFS)
+        ):
+            referenced.update(json.loads(zlib.decompress(data)))
+        orphans = [
+            digest
+            for (digest,) in self._conn.execute("SELECT hash FROM messages WHERE thread_id = ?", (thread_id,))
+            if digest not in referenced
+        ]
+        self._conn.executemany(
+            "DELETE FROM messages WHERE thread_id = ? AND hash = ?",
+            [(thread_id, digest) for digest in orphans]
+        )
+
+    # ------------------------------------------
+    # Async interface (SQLite work runs in a worker thread)
+    # ------------------------------------------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Same "<counter>.<random>" scheme as MemorySaver, so versions sort as strings
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
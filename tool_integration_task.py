@@ -1,34 +1,21 @@
 from langgraph.graph import START, END, StateGraph, MessagesState
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import ToolNode
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from typing import Literal
-from duckduckgo_search import DDGS
+from llm_backends import is_offline, make_chat_model
+from chat_streaming import stream_reply, format_timing
+from conversation_memory import HistoryManager
+from sqlite_checkpointer import SQLiteCheckpointer, checkpoint_path
+from graph_telemetry import GraphTelemetry
+from dataclasses import dataclass
+import threading
 import random
 import os
 
-print(" All libraries sucessfully imported")
-
-# Load API key from .env file
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY not found! Please set it in your .env file.")
-
-print(" API key loaded")
-
-# Initialize LLM
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,  # Temperature set to zero for more precise tool usage
-    api_key=openai_api_key
-)
-
-print(f" LLM initialized: {llm.model_name}")
+# Importing this module has no side effects: the LLM and graphs are built on
+# first use by get_app() (or by touching e.g. `tool_integration_task.agent`)
 
 # Tool 1: Weather tool
 
@@ -80,8 +67,6 @@ def weather_checker(city: str) -> str:
 • Forecast: Similar conditions expected tomorrow
 """
 
-print(" Weather tool created")
-
 # Tool 2: Dictionary tool 
 
 @tool
@@ -165,8 +150,6 @@ Misspelled
 A technical term
 """
 
-print("Dictionary tool created")
-
 # Tool 3: Web search tool 
 @tool
 def web_search(query: str, max_results: int = 3) -> str:
@@ -186,6 +169,8 @@ def web_search(query: str, max_results: int = 3) -> str:
 "Python 3.12 features" returns information about Python updates
     """
     try:
+        # Imported on use so the agent loads without the search client installed
+        from duckduckgo_search import DDGS
         with DDGS() as ddgs:
             results = list(ddgs.text(query, max_results=max_results))
             
@@ -210,31 +195,28 @@ Found {len(results)} relevant results.
     except Exception as e:
         return f":warning: Search error: {str(e)}\nPlease try again or rephrase your query."
 
-print(" Web search tool created")
-
-# Testing tools directly 
-print("\n Testing tools directly:")
+# Testing tools directly (the web search makes a live request)
+def test_tools():
+    print("\n Testing tools directly:")
 
-# weather tool
-weather_result = weather_checker.invoke({"city": "Lagos"})
-print(f"Weather Tool Test:\n{weather_result[:100]}...")
+    # weather tool
+    weather_result = weather_checker.invoke({"city": "Lagos"})
+    print(f"Weather Tool Test:\n{weather_result[:100]}...")
 
-# dictionary tool
-dict_result = dictionary_lookup.invoke({"word": "ephemeral"})
-print(f"\nDictionary Tool Test:\n{dict_result[:100]}...")
+    # dictionary tool
+    dict_result = dictionary_lookup.invoke({"word": "ephemeral"})
+    print(f"\nDictionary Tool Test:\n{dict_result[:100]}...")
 
-# web search tool 
-try:
-    search_result = web_search.invoke({"query": "latest AI developments 2024", "max_results": 2})
-    print(f"\nWeb Search Tool Test:\n{search_result[:150]}...")
-except Exception as e:
-    print(f"\nWeb Search Tool Test (simulated): Showing tool works - {str(e)[:50]}...")
+    # web search tool
+    try:
+        search_result = web_search.invoke({"query": "latest AI developments 2024", "max_results": 2})
+        print(f"\nWeb Search Tool Test:\n{search_result[:150]}...")
+    except Exception as e:
+        print(f"\nWeb Search Tool Test (simulated): Showing tool works - {str(e)[:50]}...")
 
 # Building agent..
 
 tools = [weather_checker, dictionary_lookup, web_search]
-llm_with_tools = llm.bind_tools(tools)
-print(f"\n LLM bound to {len(tools)} tools: {[t.name for t in tools]}")
 
 # System prompt
 sys_msg = SystemMessage(content="""You are a versatile assistant with access to multiple tools.
@@ -252,15 +234,6 @@ Be concise but helpful
 Always acknowledge when you're using a tool
 """)
 
-# Assistant node
-def assistant(state: MessagesState) -> dict:
-    """
-    Assistant node - decides whether to use tools or answer directly.
-    """
-    messages = [sys_msg] + state["messages"]
-    response = llm_with_tools.invoke(messages)
-    return {"messages": [response]}
-
 # Conditional routing function
 def should_continue(state: MessagesState) -> Literal["tools", "__end__"]:
     """
@@ -273,28 +246,121 @@ def should_continue(state: MessagesState) -> Literal["tools", "__end__"]:
     
     return "__end__"
 
-# Building with  graph
-builder = StateGraph(MessagesState)
-builder.add_node("assistant", assistant)
-builder.add_node("tools", ToolNode(tools))
+@dataclass
+class MultiToolApp:
+    """
+    LLM, history stage and compiled graphs, built once per process by get_app()
+    """
+    llm: object
+    history: HistoryManager
+    memory: SQLiteCheckpointer
+    telemetry: GraphTelemetry
+    agent: object
+    async_agent: object
+
+def build_app() -> MultiToolApp:
+    """
+    Initialize the LLM and compile the agent graphs (uncached; use get_app())
+    """
+    # Load API key from .env file
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+
+    if not openai_api_key and not is_offline():
+        raise ValueError("OPENAI_API_KEY not found! Please set it in your .env file.")
+
+    # Initialize LLM
+    llm = make_chat_model(
+        model="gpt-4o-mini",
+        temperature=0,  # Temperature set to zero for more precise tool usage
+        api_key=openai_api_key
+    )
+    print(f" LLM initialized: {llm.model_name}")
+
+    llm_with_tools = llm.bind_tools(tools)
+    print(f" LLM bound to {len(tools)} tools: {[t.name for t in tools]}")
+
+    # Assistant node
+    def assistant(state: MessagesState) -> dict:
+        """
+        Assistant node - decides whether to use tools or answer directly.
+        """
+        messages = [sys_msg] + state["messages"]
+        response = llm_with_tools.invoke(messages)
+        return {"messages": [response]}
+
+    # Async assistant node (used by async_agent)
+    async def aassistant(state: MessagesState) -> dict:
+        """
+        Async assistant node - same decision as `assistant`, awaited on the event loop.
+        """
+        messages = [sys_msg] + state["messages"]
+        response = await llm_with_tools.ainvoke(messages)
+        return {"messages": [response]}
+
+    # History stage: keeps each thread under a token budget by stubbing old tool
+    # outputs and summarizing older turns (recent turns stay verbatim)
+    history = HistoryManager(sys_msg, max_tokens=3000, keep_recent_turns=3, summarizer=llm)
+
+    # Building with  graph
+    def build_graph(assistant_node) -> StateGraph:
+        """
+        History stage, then the assistant/tools loop around the given assistant node.
+        """
+        builder = StateGraph(MessagesState)
+        builder.add_node("history", history.as_node())
+        builder.add_node("assistant", assistant_node)
+        # Under ainvoke, ToolNode runs a turn's tool calls concurrently; these tools have
+        # no async client, so each call is offloaded to a worker thread
+        builder.add_node("tools", ToolNode(tools))
+
+        builder.add_edge(START, "history")
+        builder.add_edge("history", "assistant")
+        builder.add_conditional_edges(
+            "assistant",
+            should_continue,
+            {"tools": "tools", "__end__": END}
+        )
+        builder.add_edge("tools", "assistant")
+        return builder
+
+    # durable checkpointer (survives restarts, shared across processes)
+    memory = SQLiteCheckpointer(checkpoint_path("multi_tool"))
+    # Per-node timings, tokens and tool calls; set AGENT_TELEMETRY_LOG to also get JSON-lines logs
+    telemetry = GraphTelemetry(log_path=os.getenv("AGENT_TELEMETRY_LOG"))
+    agent = build_graph(assistant).compile(checkpointer=memory).with_config(callbacks=[telemetry])
 
-builder.add_edge(START, "assistant")
-builder.add_conditional_edges(
-    "assistant",
-    should_continue,
-    {"tools": "tools", "__end__": END}
-)
-builder.add_edge("tools", "assistant") 
+    # Async variant: serve many conversations from one event loop with `await async_agent.ainvoke(...)`
+    async_agent = build_graph(aassistant).compile(checkpointer=memory).with_config(callbacks=[telemetry])
 
-# memory saver
-memory = MemorySaver()
-agent = builder.compile(checkpointer=memory)
+    print(" Multi-tool agent compiled successfully!")
+    return MultiToolApp(
+        llm=llm, history=history, memory=memory, telemetry=telemetry, agent=agent, async_agent=async_agent
+    )
+
+_app = None
+_app_lock = threading.Lock()
 
-print(" Multi-tool agent compiled successfully!")
+def get_app() -> MultiToolApp:
+    """
+    The process-wide MultiToolApp, built on first call (thread-safe)
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_app()
+    return _app
+
+def __getattr__(name: str):
+    # `tool_integration_task.agent` and friends resolve to the lazily built app
+    if name in MultiToolApp.__dataclass_fields__:
+        return getattr(get_app(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Visualize the graph
 # try:
-#     display(Image(agent.get_graph().draw_mermaid_png()))
+#     display(Image(get_app().agent.get_graph().draw_mermaid_png()))
 # except Exception as e:
 #     print(f"Graph structure: START → assistant → [conditional] → tools → assistant → END")
 #     print(f"(Visualization error: {e})")
@@ -309,7 +375,7 @@ def run_multi_tool_agent(user_input: str, thread_id: str = "multi_tool_test", ve
         print(f" User: {user_input}")
         print(f"{'='*70}")
     
-    result = agent.invoke(
+    result = get_app().agent.invoke(
         {"messages": [HumanMessage(content=user_input)]},
         config={"configurable": {"thread_id": thread_id}}
     )
@@ -333,14 +399,27 @@ def run_multi_tool_agent(user_input: str, thread_id: str = "multi_tool_test", ve
     
     return result
 
-print("Agent ready for testing!")
+# Async helper
+async def arun_multi_tool_agent(user_input: str, thread_id: str = "multi_tool_test") -> dict:
+    """
+    Async counterpart of run_multi_tool_agent (without printing).
+    Gather several calls to serve many threads concurrently, e.g.
+    await asyncio.gather(*(arun_multi_tool_agent(q, t) for t, q in chats.items()))
+    """
+    return await get_app().async_agent.ainvoke(
+        {"messages": [HumanMessage(content=user_input)]},
+        config={"configurable": {"thread_id": thread_id}}
+    )
 
 
 # Interactive chat
-def interactive_multi_tool_chat():
+def interactive_multi_tool_chat(stream: bool = True):
     """
     Live chat with your multi-tool agent.
+    With stream=True tokens and tool start/finish events are printed as they happen.
     """
+    agent = get_app().agent
+
     print("\n" + "="*60)
     print("  MULTI-TOOL ASSISTANT - INTERACTIVE MODE")
     print("="*60)
@@ -377,6 +456,14 @@ def interactive_multi_tool_chat():
             continue
         
         # Running agent 
+        if stream:
+            print("\n" + "-"*50)
+            reply = stream_reply(agent, user_input, thread_id, prefix=": ")
+            decision = "Used tools" if reply.tool_calls else "Answered directly"
+            print(f"\n Decision: {decision} {format_timing(reply)}")
+            print("-"*50 + "\n")
+            continue
+        
         print(": Thinking...")
         result = agent.invoke(
             {"messages": [HumanMessage(content=user_input)]},
@@ -406,4 +493,7 @@ def interactive_multi_tool_chat():
         print("-"*50 + "\n")
 
 if __name__ == "__main__":
+    get_app()
+    test_tools()
+    print("Agent ready for testing!")
     interactive_multi_tool_chat()
\ No newline at end of file